@@ -1,19 +1,88 @@
-from services.llm import LLMService
+from services.llm import LLMService, PRIORITY_INTERACTIVE
 from agents.legal import LegalAgent
+from agents.summarizer import ConversationSummarizer
+from services.tokens import count_message_tokens, count_tokens, fit_messages
+from services.legal_index import legal_index, format_articles
+from services.analysis_store import AnalysisStore, analysis_store as shared_analysis_store, report_fingerprint
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
 import json
+import os
+
+# Orçamento de tokens do prompt de conversa (system prompt + análise + histórico)
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "3000"))
+# Mínimo garantido para o histórico, mesmo com system prompt grande
+CHAT_MIN_HISTORY_TOKENS = int(os.getenv("CHAT_MIN_HISTORY_TOKENS", "500"))
+
+# Análise silenciosa: "concurrent" (com prazo) ou "sequential" (espera sempre)
+CHAT_ANALYSIS_MODE = os.getenv("CHAT_ANALYSIS_MODE", "concurrent").lower()
+CHAT_ANALYSIS_DEADLINE_SECONDS = float(os.getenv("CHAT_ANALYSIS_DEADLINE_SECONDS", "1.5"))
+MAX_LATE_ANALYSES = 256
+
+def case_report(messages: list) -> str:
+    """Todos os relatos do usuário juntos: o mesmo texto que o widget de score manda para /claim/analyze."""
+    return " ".join(m["content"] for m in messages if m.get("role") == "user")
 
 class ConversationalAgent:
-    def __init__(self, llm: LLMService, legal_agent: LegalAgent):
+    def __init__(self, llm: LLMService, legal_agent: LegalAgent, analysis_store: Optional[AnalysisStore] = None):
         self.llm = llm
         self.legal_agent = legal_agent
+        # Shared with /api/claim/analyze so the score widget reuses this turn's analysis
+        self.analysis_store = analysis_store or shared_analysis_store
+        # Folds older turns into a running summary once the history outgrows the budget
+        self.summarizer = ConversationSummarizer(llm)
+        self.stats = {
+            "turns": 0,
+            "history_tokens": 0,
+            "system_prompt_tokens": 0,
+            "messages_dropped": 0,
+            "analysis_in_time": 0,
+            "analysis_late": 0,
+            "late_analysis_reused": 0,
+            "turns_summarized": 0
+        }
+        # Análises que perderam o prazo, aproveitadas no próximo turno
+        self._late_ids: "OrderedDict[str, bool]" = OrderedDict()
 
-    async def chat(self, messages: list, context: dict = None) -> dict:
+    async def chat(self, messages: list, context: dict = None, session: Optional[dict] = None) -> dict:
         """
         Orchestrate the conversation.
         1. Check if we need specific legal analysis.
         2. Generate a response using the persona "Ju".
+
+        `session` (session mode only): {"summary", "max_messages"} from the
+        ConversationStore; the turn writes back "summary" and "folded".
         """
+        full_context_messages, current_system_prompt, analysis_id = await self._prepare_turn(messages, context, session)
+        
+        response_text = await self.llm.chat_completion(
+            messages=full_context_messages,
+            system_prompt=current_system_prompt,
+            use_cache=False,  # Resposta de conversa não deve ser reaproveitada
+            priority=PRIORITY_INTERACTIVE
+        )
         
+        return {
+            "role": "assistant",
+            "content": response_text,
+            "analysis_id": analysis_id
+        }
+
+    async def stream_chat(self, messages: list, context: dict = None,
+                          session: Optional[dict] = None) -> AsyncIterator[str]:
+        """Same as chat(), but yields the reply token by token."""
+        full_context_messages, current_system_prompt, _ = await self._prepare_turn(messages, context, session)
+        
+        async for delta in self.llm.stream_chat_completion(
+            messages=full_context_messages,
+            system_prompt=current_system_prompt
+        ):
+            yield delta
+
+    async def _prepare_turn(self, messages: list, context: dict = None,
+                            session: Optional[dict] = None) -> Tuple[List[dict], str, Optional[str]]:
+        """Build the context window and system prompt for this turn (plus the analysis handle, if any)."""
         system_prompt = """
         Você é a 'Ju', uma assistente jurídica virtual do 'Procon Ágil'.
         
@@ -32,12 +101,6 @@ class ConversationalAgent:
         - NÃO PRESTE CONSULTORIA JURÍDICA FORMAL (não assine como advogada, não garanta ganho de causa).
         - Use frases como "Pela lei...", "Geralmente...", "Nesse tipo de caso...".
         
-        CONHECIMENTO BASE (Lei do Inquilinato 8.245/91 e CDC):
-        - Infiltração/Estrutural: Responsabilidade do proprietário (Art. 22).
-        - Manutenção simples: Responsabilidade do inquilino (Art. 23).
-        - Caução: Deve ser devolvida corrigida ao fim do contrato.
-        - Multa rescisória: Deve ser proporcional ao tempo restante.
-        
         Se o usuário disser algo como "Quero processar" ou "Gerar documento", inicie a coleta de dados ou indique os botões de ação.
         """
 
@@ -47,33 +110,105 @@ class ConversationalAgent:
         # 1. Quick Analysis Trigger (heuristic or LLM based)
         # If the user gives a substantial report, we try to get a legal insight to feed the chat context
         analysis_context = ""
+        analysis = None
+        analysis_id = None
         if len(last_user_msg.split()) > 5: # Only analyze if there's enough text
             try:
-                # We do a 'silent' analysis call
-                analysis = await self.legal_agent.analyze_case(last_user_msg)
-                if analysis.get('viability_score', 0) > 60:
-                   analysis_context = f"""
-                   [INFO DO SISTEMA: O Agente Legal analisou este relato preliminarmente.
-                   Score de Viabilidade: {analysis.get('viability_score')}/100.
-                   Análise Técnica: {analysis.get('analysis')}
-                   Falta: {', '.join(analysis.get('missing_info', []))}
-                   USE ESSAS INFORMAÇÕES PARA DAR UMA RESPOSTA MAIS RICA, MAS NÃO KOPIE E COLE O JSON.]
-                   """
+                # We do a 'silent' analysis call, over the whole case so far (not just this message)
+                analysis_id, analysis = await self._silent_analysis(case_report(messages))
             except Exception as e:
                 print(f"Silent analysis failed: {e}")
+        if analysis is None:
+            # Missed the deadline (or short message): reuse a late result from an earlier turn
+            analysis = self._pop_late_analysis(messages[:-1])
+        if analysis is not None and analysis.get('viability_score', 0) > 60:
+            analysis_context = f"""
+            [INFO DO SISTEMA: O Agente Legal analisou este relato preliminarmente.
+            Score de Viabilidade: {analysis.get('viability_score')}/100.
+            Análise Técnica: {analysis.get('analysis')}
+            Falta: {', '.join(analysis.get('missing_info', []))}
+            USE ESSAS INFORMAÇÕES PARA DAR UMA RESPOSTA MAIS RICA, MAS NÃO KOPIE E COLE O JSON.]
+            """
+
+        # 2. Build Chat Context
+        # Only the law articles relevant to the recent reports, instead of a fixed excerpt
+        recent_reports = " ".join(m["content"] for m in messages[-6:] if m.get("role") == "user")
+        articles = legal_index.search(recent_reports)
+        if articles:
+            system_prompt += f"""
+        CONHECIMENTO BASE (artigos relevantes para este relato):
+{format_articles(articles)}
+        """
 
-        # 2. Generate Chat Response
-        full_context_messages = messages[-10:] # Keep last 10 messages for context window
-        
         # Inject analysis context into the system prompt for this turn if available
         current_system_prompt = system_prompt + analysis_context
         
-        response_text = await self.llm.chat_completion(
-            messages=full_context_messages,
-            system_prompt=current_system_prompt
-        )
+        # Fill the remaining token budget with history, newest first.
+        # Older turns that don't fit are folded into a running summary.
+        history_budget = max(CHAT_MIN_HISTORY_TOKENS, CHAT_PROMPT_TOKEN_BUDGET - count_tokens(current_system_prompt))
+        if session is not None:
+            # Sessão: o resumo corrido vem do store e volta para ele com as mensagens que dobrou
+            summary, recent_messages, folded = await self.summarizer.compact_session(
+                session["summary"], messages, history_budget, session["max_messages"]
+            )
+            session.update(summary=summary, folded=folded)
+        else:
+            summary, recent_messages = await self.summarizer.compact(messages, history_budget)
+        if summary:
+            current_system_prompt += f"""
+            [RESUMO DA CONVERSA ATÉ AQUI (mensagens anteriores):
+            {summary}]
+            """
+        system_tokens = count_tokens(current_system_prompt)
+        history_budget = max(CHAT_MIN_HISTORY_TOKENS, CHAT_PROMPT_TOKEN_BUDGET - system_tokens)
+        if summary:
+            # O summarizer já encaixou resumo + mensagens verbatim no orçamento; cortar aqui
+            # perderia mensagens que não estão no resumo
+            history_budget = max(history_budget, sum(count_message_tokens(m) for m in recent_messages))
+        full_context_messages, history_tokens = fit_messages(recent_messages, history_budget)
         
-        return {
-            "role": "assistant",
-            "content": response_text
-        }
+        self.stats["turns"] += 1
+        self.stats["history_tokens"] += history_tokens
+        self.stats["system_prompt_tokens"] += system_tokens
+        self.stats["messages_dropped"] += len(recent_messages) - len(full_context_messages)
+        if summary:
+            self.stats["turns_summarized"] += 1
+        
+        return full_context_messages, current_system_prompt, analysis_id
+
+    async def _silent_analysis(self, report: str) -> Tuple[str, Optional[dict]]:
+        """
+        Run (or reuse) the legal analysis for this turn through the shared store.
+        In concurrent mode it only waits up to the deadline; a late result stays
+        in the store and is used on the next turn instead of being lost.
+        """
+        analysis_id = self.analysis_store.start(report, [], lambda: self.legal_agent.analyze_case(report))
+        task = self.analysis_store.task(analysis_id)
+        if CHAT_ANALYSIS_MODE == "sequential":
+            return analysis_id, await asyncio.shield(task)
+
+        done, _ = await asyncio.wait({task}, timeout=CHAT_ANALYSIS_DEADLINE_SECONDS)
+        if done:
+            self.stats["analysis_in_time"] += 1
+            return analysis_id, task.result()
+
+        self.stats["analysis_late"] += 1
+        self._late_ids[analysis_id] = True
+        while len(self._late_ids) > MAX_LATE_ANALYSES:
+            self._late_ids.popitem(last=False)
+        return analysis_id, None
+
+    def _pop_late_analysis(self, previous_messages: list) -> Optional[dict]:
+        """Most recent late analysis among the earlier turns (case report up to each user message), if any."""
+        for end in range(len(previous_messages), 0, -1):
+            if previous_messages[end - 1].get("role") != "user":
+                continue
+            analysis_id = report_fingerprint(case_report(previous_messages[:end]))
+            if analysis_id not in self._late_ids:
+                continue
+            analysis = self.analysis_store.peek(analysis_id)
+            if analysis is not None:
+                del self._late_ids[analysis_id]
+                self.stats["late_analysis_reused"] += 1
+                return analysis
+        return None
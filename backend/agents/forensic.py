@@ -1,13 +1,15 @@
-from services.llm import LLMService
-import json
+from services.llm import LLMService, is_fallback
+from services.preprocess import format_preprocessed
+from typing import Optional
 
 class ForensicAgent:
     def __init__(self, llm: LLMService):
         self.llm = llm
 
-    async def analyze_evidence(self, file_path: str, context: str = "") -> dict:
+    async def analyze_evidence(self, file_path: str, context: str = "", preprocessed: Optional[dict] = None) -> dict:
         # In a real scenario, this would use OCR/Vision API first.
-        # Here we simulate sending the "description" of the file to the LLM
+        # Here we simulate sending the "description" of the file to the LLM,
+        # plus the compact data extracted locally (PDF text, EXIF) when available
         
         system_prompt = """
         Você é um Agente Forense Especialista em disputas imobiliárias.
@@ -16,13 +18,20 @@ class ForensicAgent:
         """
         
         user_message = f"Analise este arquivo (simulado): {file_path}. Contexto: {context}"
+        extracted = format_preprocessed(preprocessed)
+        if extracted:
+            user_message += f"\n\nDados extraídos do arquivo:\n{extracted}"
         
+        # extracted_data é livre, então pedimos apenas um objeto JSON (sem schema estrito)
         response = await self.llm.chat_completion(
             messages=[{"role": "user", "content": user_message}],
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            response_format=self.llm.json_format("forensic")
         )
         
-        try:
-            return json.loads(response)
-        except:
+        result = self.llm.parse_json(response, "forensic")
+        if result is None:
             return {"error": "Falha ao processar resposta do Forense", "raw": response}
+        if is_fallback(response):
+            result["fallback"] = True  # Resposta simulada: não vale como análise guardada
+        return result
@@ -1,11 +1,110 @@
-from services.llm import LLMService
+from services.llm import LLMService, PRIORITY_INTERACTIVE, PRIORITY_BATCH, is_fallback
+from services.claim_templates import claim_template_engine
+from collections import OrderedDict
+from typing import Optional
+import asyncio
 import json
+import os
+import uuid
+
+# Tipos com modelo saem do template na hora; o LLM só lapida o texto, em segundo plano
+GENERATOR_POLISH_ENABLED = os.getenv("GENERATOR_POLISH_ENABLED", "true").lower() == "true"
+MAX_DRAFTS = 1024
+
+POLISH_SYSTEM_PROMPT = """
+Você revisa reclamações formais para o Procon/Consumidor.gov.br.
+Melhore a redação do rascunho (clareza, tom formal, coesão) usando os dados do caso,
+sem inventar fatos, datas ou valores que não estejam no rascunho ou no relato.
+Retorne um JSON com title, facts (max 3000 chars), request e value.
+"""
+
+# Schema da saída estruturada (response_format json_schema estrito)
+CLAIM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "facts": {"type": "string"},
+        "request": {"type": "string"},
+        "value": {"type": "string"}
+    },
+    "required": ["title", "facts", "request", "value"],
+    "additionalProperties": False
+}
 
 class GeneratorAgent:
     def __init__(self, llm: LLMService):
         self.llm = llm
+        self.templates = claim_template_engine
+        # draft_id -> {"status": "pending" | "ready" | "failed", "claim": dict, "task": Future}
+        self._drafts: "OrderedDict[str, dict]" = OrderedDict()
+        self.stats = {"from_template": 0, "from_llm": 0, "polished": 0, "polish_failed": 0}
+
+    async def generate_claim(self, case_data: dict, polish: bool = False,
+                             priority: str = PRIORITY_INTERACTIVE) -> dict:
+        """
+        Routine claim types are filled from a template immediately. `polish` is
+        opt-in, for clients that poll get_draft: the LLM rewrites the draft in the
+        background and the result carries a `draft_id` to fetch the polished
+        version. Unknown types go straight to the LLM.
+        """
+        claim = self.templates.render(case_data)
+        if claim is None:
+            self.stats["from_llm"] += 1
+            return await self._generate_with_llm(case_data, priority)
+
+        self.stats["from_template"] += 1
+        claim["source"] = "template"
+        if polish and GENERATOR_POLISH_ENABLED and not self.llm.mock_mode:
+            claim["draft_id"] = self._start_polish(case_data, claim)
+        return claim
+
+    def _start_polish(self, case_data: dict, draft: dict) -> str:
+        draft_id = uuid.uuid4().hex
+        entry = {"status": "pending", "claim": draft, "error": None, "task": None}
+        entry["task"] = asyncio.ensure_future(self._polish(case_data, draft, entry))
+        self._drafts[draft_id] = entry
+        while len(self._drafts) > MAX_DRAFTS:
+            _, oldest = self._drafts.popitem(last=False)
+            oldest["task"].cancel()
+        return draft_id
 
-    async def generate_claim(self, case_data: dict) -> dict:
+    async def _polish(self, case_data: dict, draft: dict, entry: dict):
+        fields = {k: draft[k] for k in ("title", "facts", "request", "value")}
+        user_message = (f"Rascunho: {json.dumps(fields, ensure_ascii=False)}\n"
+                        f"Relato original: {case_data.get('report', '')}")
+        error = None
+        try:
+            response = await self.llm.chat_completion(
+                messages=[{"role": "user", "content": user_message}],
+                system_prompt=POLISH_SYSTEM_PROMPT,
+                priority=PRIORITY_BATCH,  # Ninguém está bloqueado esperando
+                response_format=self.llm.json_format("claim", CLAIM_SCHEMA)
+            )
+            if is_fallback(response):
+                error, polished = "LLM indisponível", None
+            else:
+                polished = self.llm.parse_json(response, "claim")
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            polished = None
+        if not polished or not all(isinstance(polished.get(k), str) and polished[k] for k in fields):
+            entry["status"] = "failed"  # O rascunho do template continua valendo
+            entry["error"] = error or "Resposta do LLM sem os campos da reclamação"
+            self.stats["polish_failed"] += 1
+            return
+        polished["facts"] = polished["facts"][:3000]
+        entry["claim"] = {**draft, **{k: polished[k] for k in fields}, "source": "polished"}
+        entry["status"] = "ready"
+        self.stats["polished"] += 1
+
+    def get_draft(self, draft_id: str) -> Optional[dict]:
+        """Status of a background polish (with the error, if it failed) and the best claim available so far."""
+        entry = self._drafts.get(draft_id)
+        if entry is None:
+            return None
+        return {"draft_id": draft_id, "status": entry["status"], "claim": entry["claim"], "error": entry["error"]}
+
+    async def _generate_with_llm(self, case_data: dict, priority: str = PRIORITY_INTERACTIVE) -> dict:
         # data contains: report, forensic_data, legal_analysis
         
         system_prompt = """
@@ -22,24 +121,23 @@ class GeneratorAgent:
         
         response = await self.llm.chat_completion(
             messages=[{"role": "user", "content": user_message}],
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            priority=priority,  # Normalmente o usuário está esperando o documento
+            response_format=self.llm.json_format("claim", CLAIM_SCHEMA)
         )
         
-        # Mock response if LLM fails or is in mock mode (likely the latter)
-        if "Erro" in response or "{" not in response:
-             return {
+        claim = self.llm.parse_json(response, "claim")
+        
+        # Mock response if LLM fails or is in mock mode. A fallback answer from the LLM layer may
+        # still parse (e.g. the simulated legal analysis), so the claim fields are checked too
+        if is_fallback(response) or not claim or not all(
+                isinstance(claim.get(k), str) and claim[k] for k in CLAIM_SCHEMA["required"]):
+            return {
                 "title": "Reclamação por Vício Oculto e Falha na Prestação de Serviço",
                 "facts": f"No dia {case_data.get('date', 'recente')}, constatei problemas de {case_data.get('type', 'manutenção')} no imóvel locado. Apesar das tentativas de contato, a imobiliária não resolveu. (Texto gerado automaticamente baseado no relato: {case_data.get('report', '...')})",
                 "request": "Requeiro o reparo imediato dos danos e abatimento no aluguel proporcional ao tempo de inutilização, conforme Art. 22 da Lei do Inquilinato.",
-                "value": "R$ 2.500,00"
+                "value": "R$ 2.500,00",
+                "fallback": True
             }
 
-        try:
-            return json.loads(response)
-        except:
-            return {
-                "title": "Reclamação Procon",
-                "facts": "Erro ao gerar texto. Por favor edite.",
-                "request": "Reparo imediato.",
-                "value": "R$ 0,00"
-            }
+        return claim
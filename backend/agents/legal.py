@@ -1,11 +1,39 @@
-from services.llm import LLMService
-import json
+from services.llm import LLMService, PRIORITY_ANALYSIS, is_fallback
+from services.classifier import claim_classifier
+from services.legal_index import legal_index, format_articles
+from services.learning import LearningService, learning_service
+from services.local_scorer import LocalScorer, local_scorer
+from typing import Optional
+import asyncio
+
+# Schema da saída estruturada (response_format json_schema estrito)
+LEGAL_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "viability_score": {"type": "integer"},
+        "analysis": {"type": "string"},
+        "strategy": {"type": "string"},
+        "missing_info": {"type": "array", "items": {"type": "string"}},
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "risks": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["viability_score", "analysis", "strategy", "missing_info", "strengths", "risks"],
+    "additionalProperties": False
+}
 
 class LegalAgent:
-    def __init__(self, llm: LLMService):
+    def __init__(self, llm: LLMService, scorer: Optional[LocalScorer] = None,
+                 learning: Optional[LearningService] = None):
         self.llm = llm
+        # Clear-cut reports are scored locally; only borderline ones reach the LLM
+        self.scorer = scorer or local_scorer
+        self.learning = learning or learning_service
+
+    async def analyze_case(self, user_report: str, evidences: list = [], priority: str = PRIORITY_ANALYSIS) -> dict:
+        prediction = self.scorer.decide(user_report, len(evidences))
+        if prediction is not None:
+            return self._generate_mock_analysis(user_report, evidences, score=prediction.score)
 
-    async def analyze_case(self, user_report: str, evidences: list = []) -> dict:
         system_prompt = """
         Você é um Agente Jurídico Especialista na Lei do Inquilinato (8.245/91) e CDC.
         Analise o relato e retorne um JSON com:
@@ -16,24 +44,49 @@ class LegalAgent:
         - strengths (lista de pontos fortes do caso)
         - risks (lista de riscos identificados)
         """
+        # Fundamenta a análise só nos artigos relevantes para este relato
+        articles = legal_index.search(user_report)
+        if articles:
+            system_prompt += f"""
+        ARTIGOS RELEVANTES:
+{format_articles(articles)}
+        """
         
         evidence_context = f"Evidências disponíveis: {len(evidences)} arquivos."
         user_message = f"Relato do usuário: {user_report}. {evidence_context}"
         
         response = await self.llm.chat_completion(
             messages=[{"role": "user", "content": user_message}],
-            system_prompt=system_prompt
+            system_prompt=system_prompt,
+            response_format=self.llm.json_format("legal_analysis", LEGAL_ANALYSIS_SCHEMA),
+            priority=priority
         )
         
-        try:
-            return json.loads(response)
-        except:
+        analysis = self.llm.parse_json(response, "legal_analysis")
+        if analysis is None:
             # Fallback with humanized mock data based on keywords
-            return self._generate_mock_analysis(user_report, evidences)
+            return {**self._generate_mock_analysis(user_report, evidences), "fallback": True}
+        if is_fallback(response):
+            # Simulated answer from the LLM layer: usable on screen, but not a real analysis
+            analysis["fallback"] = True
+        # Only a real upstream answer becomes a training label (never mock or fallback scores)
+        if not self.llm.mock_mode and not analysis.get("fallback") and isinstance(analysis.get("viability_score"), int):
+            self._record_label(user_report, len(evidences), analysis["viability_score"])
+        return analysis
     
-    def _generate_mock_analysis(self, user_report: str, evidences: list) -> dict:
-        """Generate a realistic mock analysis based on keywords."""
-        lower_report = user_report.lower()
+    def _record_label(self, user_report: str, evidences_count: int, score: int):
+        """Keep the LLM's score as training data for the local scorer."""
+        try:
+            self.learning.record_scored_report(user_report, evidences_count, score)
+        except OSError as e:
+            print(f"Failed to record scored report: {e}")
+            return
+        if self.scorer.record_sample():
+            self._retrain_task = asyncio.ensure_future(self.scorer.retrain(self.learning.load_scored_reports))
+    
+    def _generate_mock_analysis(self, user_report: str, evidences: list, score: Optional[int] = None) -> dict:
+        """Generate a realistic mock analysis based on keywords (`score` overrides the keyword score)."""
+        signals = claim_classifier.match(user_report)
         
         base_score = 50
         strengths = []
@@ -42,25 +95,25 @@ class LegalAgent:
         analysis = ""
         
         # Analyze keywords and build score
-        if "infiltração" in lower_report or "vazamento" in lower_report or "mofo" in lower_report:
+        if signals & {"infiltracao", "umidade"}:
             base_score += 25
             strengths.append("Problema estrutural - responsabilidade clara do locador (Art. 22)")
             strengths.append("Lei do Inquilinato protege explicitamente contra vícios ocultos")
             analysis = "Pela Lei do Inquilinato (Art. 22), problemas estruturais como infiltração são de responsabilidade do proprietário."
             
-        elif "cobrança" in lower_report or "multa" in lower_report:
+        elif signals & {"cobranca", "multa"}:
             base_score += 15
             strengths.append("Cobranças indevidas podem ser revertidas")
             risks.append("Necessário verificar cláusulas contratuais")
             analysis = "Multas contratuais têm limites legais. Precisamos verificar os valores e justificativas."
             
-        elif "caução" in lower_report or "depósito" in lower_report:
+        elif "caucao" in signals:
             base_score += 20
             strengths.append("Lei 8.245/91 garante devolução em 30 dias após término")
             strengths.append("Retenção indevida gera juros e correção")
             analysis = "A devolução da caução é um direito garantido por lei após a entrega do imóvel."
             
-        elif "manutenção" in lower_report:
+        elif "manutencao" in signals:
             base_score += 10
             strengths.append("Art. 22 obriga o locador a manter o imóvel habitável")
             analysis = "Problemas de manutenção são frequentemente de responsabilidade do locador."
@@ -74,16 +127,19 @@ class LegalAgent:
             risks.append("Sem provas documentais, o caso fica mais difícil")
         
         # Common missing info
-        if "data" not in lower_report and "quando" not in lower_report:
+        if "data" not in signals:
             missing_info.append("Data do início do problema")
         
-        if "notific" not in lower_report and "aviso" not in lower_report:
+        if "notificacao" not in signals:
             missing_info.append("Comprovante de notificação ao proprietário")
         
         if not analysis:
             analysis = "Preciso de mais detalhes para fazer uma análise completa do seu caso."
             risks.append("Informações insuficientes para análise precisa")
         
+        if score is not None:
+            base_score = score
+        
         return {
             "viability_score": min(95, max(20, base_score)),
             "analysis": analysis,
@@ -0,0 +1,184 @@
+from services.llm import LLMService, PRIORITY_ANALYSIS, is_fallback
+from services.tokens import count_message_tokens, count_tokens, fit_messages
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import os
+import re
+
+# Parte do orçamento de histórico reservada às mensagens recentes (verbatim)
+CHAT_SUMMARY_RECENT_SHARE = float(os.getenv("CHAT_SUMMARY_RECENT_SHARE", "0.5"))
+# Mensagens antigas ainda não resumidas: acima disso o resumo é refeito
+CHAT_SUMMARY_REFRESH_TOKENS = int(os.getenv("CHAT_SUMMARY_REFRESH_TOKENS", "600"))
+# Tamanho máximo do resumo
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+MAX_CACHED_SUMMARIES = 2048
+
+SUMMARY_SYSTEM_PROMPT = """
+Você resume conversas entre um inquilino e a assistente 'Ju' do Procon Ágil.
+Atualize o resumo anterior com as novas mensagens. Preserve TODOS os fatos úteis
+para uma reclamação: o problema, datas, valores, partes envolvidas (proprietário,
+imobiliária), cláusulas de contrato, provas mencionadas e o que já foi tentado.
+Escreva em tópicos curtos, em português, sem opinião e sem repetir saudações.
+"""
+
+
+def _prefix_hashes(messages: List[Dict[str, str]]) -> List[str]:
+    """hashes[i] identifica messages[:i + 1] (hash encadeado, uma passada)."""
+    hashes = []
+    digest = b""
+    for message in messages:
+        digest = hashlib.sha256(digest + f"{message['role']}\x00{message['content']}".encode("utf-8")).digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+class ConversationSummarizer:
+    """
+    Resumo incremental das mensagens antigas de uma conversa.
+
+    Com o histórico completo vindo do cliente, o resumo fica em cache sob o
+    hash do prefixo que ele cobre. No modo sessão o resumo corrido mora no
+    ConversationStore junto da conversa (compact_session): as mensagens
+    resumidas saem do store, então nada depende de o histórico começar na
+    mensagem 0. Nos dois modos o resumo só é refeito quando as mensagens
+    antigas ainda não resumidas passam de CHAT_SUMMARY_REFRESH_TOKENS (ou o
+    store precisa liberar espaço); até lá elas seguem verbatim.
+    """
+
+    def __init__(self, llm: LLMService):
+        self.llm = llm
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()  # hash do prefixo -> resumo
+        self.stats = {
+            "compactions": 0,
+            "summary_reused": 0,
+            "summary_refreshed": 0,
+            "summary_failed": 0,
+            "extractive_fallbacks": 0
+        }
+
+    async def compact(self, messages: List[Dict[str, str]], budget: int) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Returns:
+            (resumo das mensagens antigas ou "", mensagens que seguem verbatim)
+        """
+        if sum(count_message_tokens(m) for m in messages) <= budget:
+            return "", messages
+
+        self.stats["compactions"] += 1
+        recent, _ = fit_messages(messages, int(budget * CHAT_SUMMARY_RECENT_SHARE))
+        older = messages[:len(messages) - len(recent)]
+        if not older:
+            return "", messages
+        hashes = _prefix_hashes(older)
+
+        # Maior prefixo das mensagens antigas que já tem resumo
+        covered, summary = 0, ""
+        for index in range(len(older) - 1, -1, -1):
+            cached = self._summaries.get(hashes[index])
+            if cached is not None:
+                self._summaries.move_to_end(hashes[index])
+                covered, summary = index + 1, cached
+                break
+
+        summary, kept, refreshed = await self._fold(summary, older[covered:], recent, budget)
+        if refreshed:
+            self._summaries[hashes[-1]] = summary
+            while len(self._summaries) > MAX_CACHED_SUMMARIES:
+                self._summaries.popitem(last=False)
+        return summary, kept
+
+    async def compact_session(self, summary: str, messages: List[Dict[str, str]], budget: int,
+                              max_messages: int) -> Tuple[str, List[Dict[str, str]], int]:
+        """
+        Modo sessão: `summary` é o resumo corrido guardado no ConversationStore e
+        cobre tudo o que já saiu do histórico; `messages` são as mensagens ainda
+        não resumidas (o histórico do store + a mensagem nova).
+
+        Returns:
+            (resumo, mensagens que seguem verbatim, quantas das primeiras
+             mensagens entraram no resumo e podem sair do store)
+        """
+        # Depois deste turno (+1: a resposta) o store passaria do teto de mensagens
+        overflow = len(messages) + 1 - max_messages
+        if overflow <= 0 and sum(count_message_tokens(m) for m in messages) + count_tokens(summary) <= budget:
+            return summary, messages, 0
+
+        self.stats["compactions"] += 1
+        recent, _ = fit_messages(messages, int(budget * CHAT_SUMMARY_RECENT_SHARE))
+        split = len(messages) - len(recent)
+        if overflow > 0:
+            # Libera metade do teto de uma vez: um resumo a cada max_messages / 2
+            # mensagens, e não uma chamada por turno depois que a conversa encheu
+            split = max(split, len(messages) - max_messages // 2)
+        split = min(split, len(messages) - 1)  # A mensagem nova segue sempre verbatim
+        if split <= 0:
+            return summary, messages, 0
+
+        summary, kept, refreshed = await self._fold(summary, messages[:split], messages[split:], budget,
+                                                    force=overflow > 0)
+        return summary, kept, split if refreshed else 0
+
+    async def _fold(self, summary: str, pending: List[Dict[str, str]], recent: List[Dict[str, str]],
+                    budget: int, force: bool = False) -> Tuple[str, List[Dict[str, str]], bool]:
+        """
+        Junta `pending` (mensagens antigas fora do resumo) ao resumo, ou as mantém
+        verbatim enquanto couberem. Returns: (resumo, verbatim, se o resumo foi refeito)
+        """
+        pending_tokens = sum(count_message_tokens(m) for m in pending)
+        # O resumo só é reaproveitado se ele e as mensagens ainda não resumidas cabem
+        # no orçamento; senão elas seriam cortadas depois sem ter entrado no resumo
+        room = budget - count_tokens(summary)
+        if (summary and not force and pending_tokens < CHAT_SUMMARY_REFRESH_TOKENS
+                and pending_tokens + sum(count_message_tokens(m) for m in recent) <= room):
+            self.stats["summary_reused"] += 1
+            return summary, pending + recent, False
+
+        refreshed = await self._summarize(summary, pending)
+        if refreshed is None:
+            # LLM fora do ar: sem resumo novo (nada vai para o cache nem sai do store);
+            # as mensagens não resumidas seguem verbatim, as mais novas primeiro, até onde couberem
+            self.stats["summary_failed"] += 1
+            kept, _ = fit_messages(pending + recent, room)
+            return summary, kept, False
+
+        self.stats["summary_refreshed"] += 1
+        return refreshed, recent, True
+
+    async def _summarize(self, previous: str, pending: List[Dict[str, str]]) -> Optional[str]:
+        """Resumo atualizado, ou None se o LLM só devolveu um fallback."""
+        if not self.llm.mock_mode:
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in pending)
+            response = await self.llm.chat_completion(
+                messages=[{
+                    "role": "user",
+                    "content": f"RESUMO ANTERIOR:\n{previous or '(nenhum)'}\n\nNOVAS MENSAGENS:\n{transcript}"
+                }],
+                system_prompt=SUMMARY_SYSTEM_PROMPT,
+                temperature=0.2,
+                priority=PRIORITY_ANALYSIS
+            )
+            if is_fallback(response):
+                return None  # Texto simulado não é resumo da conversa
+            if response and response.strip():
+                return self._truncate(response.strip().splitlines())
+
+        self.stats["extractive_fallbacks"] += 1
+        return self._extractive_summary(previous, pending)
+
+    def _extractive_summary(self, previous: str, pending: List[Dict[str, str]]) -> str:
+        """Sem LLM: primeira frase de cada relato do usuário, mais novos preferidos."""
+        lines = previous.splitlines() if previous else []
+        for message in pending:
+            if message["role"] != "user":
+                continue
+            sentence = re.split(r"(?<=[.!?])\s+", message["content"].strip(), maxsplit=1)[0]
+            if sentence:
+                lines.append(f"- {sentence[:300]}")
+        return self._truncate(lines)
+
+    def _truncate(self, lines: List[str]) -> str:
+        # Descarta as linhas mais antigas até caber no tamanho máximo
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > CHAT_SUMMARY_MAX_TOKENS:
+            lines.pop(0)
+        return "\n".join(lines)
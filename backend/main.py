@@ -1,8 +1,38 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import chat, upload, claim, automation, learning, script_gen, submission, auth
+from routers import chat, upload, claim, automation, learning, script_gen, submission, auth, metrics
+from services.llm import llm_service
+from services.legal_index import legal_index
+from services.learning import learning_service
+from services.local_scorer import local_scorer
+from services.pregeneration import claim_pregenerator
+from services.forensic_jobs import forensic_jobs
+from services.preprocess import preprocessor
+from services.tokens import count_tokens
 
-app = FastAPI(title="Procon Ágil API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: o vocabulário do tiktoken pode precisar de download; carrega numa thread,
+    # antes de qualquer request contar tokens no event loop
+    await asyncio.to_thread(count_tokens, "x")
+    # Carrega (ou monta, se o corpus mudou) o índice de artigos de lei
+    await asyncio.to_thread(legal_index.load)
+    # Treina o pré-score local com os scores já registrados (se houver amostras suficientes)
+    await local_scorer.retrain(learning_service.load_scored_reports)
+    # Workers da fila forense, presos ao event loop da aplicação
+    forensic_jobs.start()
+    yield
+    # Shutdown: cancela o trabalho de fundo (especulação, workers forenses, pool de processos),
+    # libera o pool de conexões do LLM e o mmap do índice
+    claim_pregenerator.cancel_all()
+    forensic_jobs.shutdown()
+    preprocessor.shutdown()
+    await llm_service.aclose()
+    legal_index.close()
+
+app = FastAPI(title="Procon Ágil API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +50,7 @@ app.include_router(learning.router, prefix="/api")
 app.include_router(script_gen.router, prefix="/api")
 app.include_router(submission.router) # NOVO: Orquestrador Integrado
 app.include_router(auth.router, prefix="/api") # NOVO: Auth Gov.br
+app.include_router(metrics.router, prefix="/api")
 
 @app.get("/")
 def read_root():
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
+import os
 
 router = APIRouter()
 
@@ -10,37 +13,87 @@ class Message(BaseModel):
     timestamp: Optional[str] = None
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    # Modo antigo: o cliente manda a conversa inteira em `messages`.
+    # Modo sessão: manda só `message` (+ `conversation_id` a partir do 2º turno);
+    # no 1º turno, `messages` pode trazer o histórico inicial.
+    messages: List[Message] = []
+    message: Optional[str] = None
+    conversation_id: Optional[str] = None
     context: Optional[dict] = None
 
 class ChatResponse(BaseModel):
     message: Message
     suggested_actions: List[str] = []
+    analysis_id: Optional[str] = None  # Handle para /api/claim/analyze reaproveitar a análise do turno
+    conversation_id: Optional[str] = None  # Só no modo sessão
 
-from services.llm import LLMService
+from services.llm import llm_service
 from agents.legal import LegalAgent
-from agents.conversational import ConversationalAgent
+from agents.conversational import ConversationalAgent, case_report
+from services.analysis_store import analysis_store, report_fingerprint
+from services.conversation_store import ConversationStore
+
+FALLBACK_MESSAGE = "Desculpe, estou tendo dificuldades para processar sua mensagem agora. Pode tentar novamente em alguns instantes?"
 
 # Dependency Injection (Simple for MVP)
-llm_service = LLMService()
 legal_agent = LegalAgent(llm_service)
-conversational_agent = ConversationalAgent(llm_service, legal_agent)
+conversational_agent = ConversationalAgent(llm_service, legal_agent, analysis_store)
+conversation_store = ConversationStore(
+    max_conversations=int(os.getenv("CHAT_SESSION_MAX_CONVERSATIONS", "5000")),
+    idle_seconds=float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "3600")),
+    max_messages=int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "40"))
+)
+
+def _resolve_history(request: ChatRequest):
+    """
+    Returns (conversation_id, messages for this turn, session summary state).
+    conversation_id and the session are None in the legacy full-history mode.
+    """
+    if request.message is None:
+        if not request.messages:
+            raise HTTPException(status_code=422, detail="Envie 'messages' ou 'message'.")
+        return None, [{"role": m.role, "content": m.content} for m in request.messages], None
+
+    if request.conversation_id:
+        history = conversation_store.get(request.conversation_id)
+        if history is None:
+            # O cliente deve reenviar o histórico completo para abrir outra conversa
+            raise HTTPException(status_code=404, detail="Conversa não encontrada ou expirada.")
+        conversation_id = request.conversation_id
+    else:
+        history = [{"role": m.role, "content": m.content} for m in request.messages]
+        conversation_id = conversation_store.create(history)
+    session = {"summary": conversation_store.get_summary(conversation_id),
+               "max_messages": conversation_store.max_messages, "folded": 0}
+    return conversation_id, history + [{"role": "user", "content": request.message}], session
+
+def _append_turn(conversation_id: str, session: dict, *messages: dict):
+    """Grava o turno e o resumo corrido (tirando do histórico as mensagens que entraram nele)."""
+    conversation_store.append(conversation_id, *messages, summary=session["summary"], folded=session["folded"])
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
+    conversation_id, messages_dicts, session = _resolve_history(request)
     try:
         # Get response from the Conversational Agent
-        # Convert Pydantic models to dicts for the agent
-        messages_dicts = [{"role": m.role, "content": m.content} for m in request.messages]
+        response_dict = await conversational_agent.chat(messages_dicts, request.context, session)
         
-        response_dict = await conversational_agent.chat(messages_dicts, request.context)
+        if conversation_id:
+            _append_turn(
+                conversation_id,
+                session,
+                messages_dicts[-1],
+                {"role": response_dict["role"], "content": response_dict["content"]}
+            )
         
         return ChatResponse(
             message=Message(
                 role=response_dict["role"],
                 content=response_dict["content"]
             ),
-            suggested_actions=[]
+            suggested_actions=[],
+            analysis_id=response_dict.get("analysis_id"),
+            conversation_id=conversation_id
         )
             
     except Exception as e:
@@ -49,7 +102,55 @@ async def chat_endpoint(request: ChatRequest):
         return ChatResponse(
             message=Message(
                 role="assistant",
-                content="Desculpe, estou tendo dificuldades para processar sua mensagem agora. Pode tentar novamente em alguns instantes?"
+                content=FALLBACK_MESSAGE
             ),
-            suggested_actions=[]
+            suggested_actions=[],
+            conversation_id=conversation_id
         )
+
+def _turn_analysis_id(messages: list) -> Optional[str]:
+    """Id da análise silenciosa do turno (relatos do usuário até aqui), se o store a conhece."""
+    analysis_id = report_fingerprint(case_report(messages))
+    return analysis_id if analysis_store.task(analysis_id) is not None else None
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Mesma conversa do /chat, mas a resposta chega via Server-Sent Events:
+    - event: token    -> {"delta": "..."} (um pedaço da resposta)
+    - event: done     -> {"content": "...", "analysis_id": "...", "conversation_id": "..."} (resposta completa)
+    - event: fallback -> {"content": FALLBACK_MESSAGE} (falha no meio do stream)
+    """
+    conversation_id, messages_dicts, session = _resolve_history(request)
+
+    async def event_stream():
+        parts = []
+        try:
+            async for delta in conversational_agent.stream_chat(messages_dicts, request.context, session):
+                parts.append(delta)
+                yield _sse_event("token", {"delta": delta})
+            done = {"content": "".join(parts)}
+            analysis_id = _turn_analysis_id(messages_dicts)
+            if analysis_id:
+                done["analysis_id"] = analysis_id
+            if conversation_id:
+                _append_turn(
+                    conversation_id,
+                    session,
+                    messages_dicts[-1],
+                    {"role": "assistant", "content": done["content"]}
+                )
+                done["conversation_id"] = conversation_id
+            yield _sse_event("done", done)
+        except Exception as e:
+            print(f"Error in chat stream: {e}")
+            yield _sse_event("fallback", {"content": FALLBACK_MESSAGE})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
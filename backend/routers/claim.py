@@ -1,24 +1,57 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-from services.llm import LLMService
+from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import json
+import os
+from services.llm import llm_service, PRIORITY_ANALYSIS, PRIORITY_BATCH
 from agents.generator import GeneratorAgent
 from agents.legal import LegalAgent
+from services.analysis_store import analysis_store, report_fingerprint
+from services.pregeneration import claim_pregenerator
+from routers.upload import evidence_store, wait_forensic_job
+from services.forensic_jobs import QueueFull
 
 router = APIRouter()
 
-llm_service = LLMService()
 generator_agent = GeneratorAgent(llm_service)
 legal_agent = LegalAgent(llm_service)
 
+# Lote de análises: concorrência padrão/máxima e tamanho máximo
+BATCH_ANALYZE_CONCURRENCY = int(os.getenv("BATCH_ANALYZE_CONCURRENCY", "8"))
+BATCH_ANALYZE_MAX_CONCURRENCY = int(os.getenv("BATCH_ANALYZE_MAX_CONCURRENCY", "32"))
+BATCH_ANALYZE_MAX_ITEMS = int(os.getenv("BATCH_ANALYZE_MAX_ITEMS", "1000"))
+BATCH_JSONL_MAX_BYTES = 5 * 1024 * 1024 # 5MB
+PIPELINE_MAX_EVIDENCES = int(os.getenv("PIPELINE_MAX_EVIDENCES", "20"))
+# Análise que caiu no fallback do LLM (descartada pelo scheduler ou LLM fora do ar)
+ANALYSIS_UNAVAILABLE = "Análise indisponível no momento (LLM sobrecarregado ou fora do ar). Tente de novo."
+
 class GenerateClaimRequest(BaseModel):
     report: str
     forensic_data: dict = {}
     legal_analysis: dict = {}
+    polish: bool = False  # Lapidar o texto do modelo com o LLM em segundo plano (consultar /claim/draft/{draft_id})
 
 class AnalyzeRequest(BaseModel):
     report: str
     evidences: List[str] = []
+    analysis_id: Optional[str] = None  # Devolvido por /api/chat: reaproveita a análise daquele turno
+
+class BatchAnalyzeItem(BaseModel):
+    id: Optional[str] = None  # Identificador do parceiro, devolvido em cada linha
+    report: str
+    evidences: List[str] = []
+
+class BatchAnalyzeRequest(BaseModel):
+    items: List[BatchAnalyzeItem]
+    concurrency: Optional[int] = None
+
+class PipelineRequest(BaseModel):
+    report: str
+    evidences: List[str] = []  # `evidence_id` devolvido por /api/upload
+    analysis_id: Optional[str] = None
+    polish: bool = False
 
 class AnalysisResponse(BaseModel):
     viability_score: int
@@ -36,17 +69,51 @@ async def generate_claim_endpoint(request: GenerateClaimRequest):
         "legal_analysis": request.legal_analysis
     }
     
-    result = await generator_agent.generate_claim(case_data)
+    result = None
+    if not request.polish and not request.forensic_data:
+        # Rascunho já gerado (ou gerando, sem lapidação) a partir do score alto em /claim/analyze
+        result = await claim_pregenerator.take(request.report)
+    if result is None:
+        result = await generator_agent.generate_claim(case_data, polish=request.polish)
     return result
 
+@router.get("/claim/draft/{draft_id}")
+async def get_claim_draft(draft_id: str):
+    """Polished version of a template claim: status pending, ready or failed (with error)."""
+    draft = generator_agent.get_draft(draft_id)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="Rascunho não encontrado.")
+    return draft
+
 @router.post("/claim/analyze", response_model=AnalysisResponse)
 async def analyze_claim_endpoint(request: AnalyzeRequest):
     """Analyze a claim and return viability score with transparent breakdown."""
-    analysis = await legal_agent.analyze_case(
-        user_report=request.report,
-        evidences=request.evidences
+    analysis = await _legal_analysis(request.report, request.evidences, request.analysis_id)
+    response = _analysis_response(analysis)
+    # Score alto: o usuário provavelmente vai pedir a reclamação, então já começa a gerar.
+    # Sem lapidação: ela rodaria fora do limite e do cancelamento do pregenerator
+    claim_pregenerator.maybe_start(request.report, response.viability_score, lambda: generator_agent.generate_claim(
+        {"report": request.report, "forensic_data": {}, "legal_analysis": analysis},
+        polish=False,
+        priority=PRIORITY_ANALYSIS
+    ))
+    return response
+
+async def _legal_analysis(report: str, evidences: list, analysis_id: Optional[str]) -> dict:
+    """The analysis behind `analysis_id` (from /api/chat) if it is this report's, else a shared one for the report."""
+    if analysis_id and analysis_id == report_fingerprint(report, evidences):
+        # Resultado pronto, ou a análise silenciosa do chat ainda em andamento.
+        # Só vale se o id é deste mesmo relato: análise de outro texto daria o score errado
+        analysis = await analysis_store.get(analysis_id)
+        if analysis is not None:
+            return analysis
+    return await analysis_store.get_or_run(
+        report,
+        evidences,
+        lambda: legal_agent.analyze_case(user_report=report, evidences=evidences)
     )
-    
+
+def _analysis_response(analysis: dict) -> AnalysisResponse:
     return AnalysisResponse(
         viability_score=analysis.get("viability_score", 50),
         analysis=analysis.get("analysis", "Análise em processamento."),
@@ -55,3 +122,175 @@ async def analyze_claim_endpoint(request: AnalyzeRequest):
         strengths=analysis.get("strengths", []),
         risks=analysis.get("risks", [])
     )
+
+# =================== LOTE ===================
+
+async def _analyze_batch(items: list, concurrency: int) -> AsyncIterator[str]:
+    """
+    Runs the analyses with at most `concurrency` in flight and yields one NDJSON
+    line per item as soon as it finishes (completion order, not input order).
+    `items` holds BatchAnalyzeItem or, for unparseable input lines, an error string.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # Relatos repetidos no lote compartilham a análise. Fica só aqui: gravar no
+    # analysis_store (LRU de 1024) despejaria as análises do chat dos usuários
+    analyses: Dict[str, asyncio.Future] = {}
+
+    async def analyze(item: BatchAnalyzeItem) -> dict:
+        async with semaphore:
+            return await legal_agent.analyze_case(item.report, item.evidences, priority=PRIORITY_BATCH)
+
+    async def run(index: int, item: BatchAnalyzeItem) -> dict:
+        key = report_fingerprint(item.report, item.evidences)
+        # Análise do chat já pronta para o mesmo relato: só leitura, sem ocupar o store
+        analysis = analysis_store.peek(key)
+        if analysis is None:
+            if key not in analyses:
+                analyses[key] = asyncio.ensure_future(analyze(item))
+            analysis = await asyncio.shield(analyses[key])
+        if analysis.get("fallback"):
+            # Chamada descartada pelo scheduler ou LLM fora do ar: o score simulado não vale como resultado
+            return {"index": index, "id": item.id, "status": "error", "error": ANALYSIS_UNAVAILABLE}
+        return {"index": index, "id": item.id, "status": "ok", "result": _analysis_response(analysis).model_dump()}
+
+    async def guarded(index: int, item) -> dict:
+        if isinstance(item, str):
+            return {"index": index, "id": None, "status": "error", "error": item}
+        try:
+            return await run(index, item)
+        except Exception as e:
+            # Um item com problema não derruba o lote
+            return {"index": index, "id": item.id, "status": "error", "error": str(e)}
+
+    tasks = [asyncio.ensure_future(guarded(index, item)) for index, item in enumerate(items)]
+    counts = {"ok": 0, "error": 0}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            counts[line["status"]] += 1
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        yield json.dumps({"summary": {"total": len(items), **counts}}) + "\n"
+    finally:
+        # Cliente desconectou no meio: cancela as análises do lote (ninguém de fora
+        # espera por elas). As que ainda aguardam vaga nem começam; uma chamada ao
+        # LLM já enviada termina no single-flight do LLMService e fica no cache dele
+        for task in [*tasks, *analyses.values()]:
+            task.cancel()
+
+def _batch_response(items: list, concurrency: Optional[int]) -> StreamingResponse:
+    if not items:
+        raise HTTPException(status_code=400, detail="Lote vazio.")
+    if len(items) > BATCH_ANALYZE_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Lote muito grande. Máximo {BATCH_ANALYZE_MAX_ITEMS} relatos.")
+    concurrency = max(1, min(concurrency or BATCH_ANALYZE_CONCURRENCY, BATCH_ANALYZE_MAX_CONCURRENCY))
+    return StreamingResponse(_analyze_batch(items, concurrency), media_type="application/x-ndjson")
+
+@router.post("/claim/analyze/batch")
+async def analyze_batch_endpoint(request: BatchAnalyzeRequest):
+    """
+    Analyze many reports at once. Streams NDJSON: one line per item
+    ({"index", "id", "status": "ok", "result"} or {"index", "id", "status": "error", "error"})
+    as each finishes, then a final {"summary": {...}} line.
+    """
+    return _batch_response(request.items, request.concurrency)
+
+@router.post("/claim/analyze/batch/jsonl")
+async def analyze_batch_jsonl_endpoint(file: UploadFile = File(...), concurrency: Optional[int] = None):
+    """Same as /claim/analyze/batch, reading one {"id", "report", "evidences"} object per line of a JSONL file."""
+    content = await file.read(BATCH_JSONL_MAX_BYTES + 1)
+    if len(content) > BATCH_JSONL_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Arquivo muito grande. Máximo 5MB.")
+    try:
+        lines = content.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="O arquivo deve estar em UTF-8.")
+
+    items = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(BatchAnalyzeItem.model_validate_json(line))
+        except ValidationError as e:
+            items.append(f"Linha {number} inválida: {e.errors()[0]['msg']}")
+    return _batch_response(items, concurrency)
+
+# =================== PIPELINE ===================
+
+async def _run_pipeline(request: PipelineRequest) -> AsyncIterator[str]:
+    """
+    forensic (one job per evidence) and legal run concurrently; generate starts
+    once all of them are done. Yields one NDJSON event per finished job:
+    {"stage": "forensic", "evidence_id", "status", "result"|"error"},
+    {"stage": "legal", ...}, {"stage": "generate", ...}, then {"stage": "done"}.
+    """
+    async def forensic(evidence_id: str) -> dict:
+        event = {"stage": "forensic", "evidence_id": evidence_id}
+        try:
+            record = await evidence_store.get(evidence_id)
+            if record is None:
+                return {**event, "status": "error", "error": "Evidência não encontrada."}
+            # Pela fila forense, como o upload: o limite de workers vale para todos os pedidos
+            result = await wait_forensic_job(record)
+        except QueueFull:
+            return {**event, "status": "error", "error": "Muitas análises em andamento. Tente de novo em instantes."}
+        except Exception as e:
+            return {**event, "status": "error", "error": str(e)}
+        return {**event, "status": "ok", "result": result}
+
+    async def legal() -> dict:
+        try:
+            analysis = await _legal_analysis(request.report, request.evidences, request.analysis_id)
+        except Exception as e:
+            return {"stage": "legal", "status": "error", "error": str(e)}
+        if analysis.get("fallback"):
+            # Mesmo critério do lote: score simulado não é resultado
+            return {"stage": "legal", "status": "error", "error": ANALYSIS_UNAVAILABLE}
+        return {"stage": "legal", "status": "ok", "result": analysis}
+
+    tasks = [asyncio.ensure_future(legal())]
+    tasks += [asyncio.ensure_future(forensic(evidence_id)) for evidence_id in request.evidences]
+    forensic_data = {}
+    legal_analysis = {}
+    errors = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            if event["status"] == "error":
+                errors += 1
+            elif event["stage"] == "forensic":
+                forensic_data[event["evidence_id"]] = event["result"]
+            else:
+                legal_analysis = event["result"]
+                event = {**event, "result": _analysis_response(legal_analysis).model_dump()}
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+        # Evidências ou análise com falha não impedem a reclamação
+        case_data = {"report": request.report, "forensic_data": forensic_data, "legal_analysis": legal_analysis}
+        try:
+            claim = None
+            if not request.polish and not request.evidences:
+                claim = await claim_pregenerator.take(request.report)
+            if claim is None:
+                claim = await generator_agent.generate_claim(case_data, polish=request.polish)
+            event = {"stage": "generate", "status": "ok", "result": claim}
+        except Exception as e:
+            errors += 1
+            event = {"stage": "generate", "status": "error", "error": str(e)}
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+        yield json.dumps({"stage": "done", "errors": errors}) + "\n"
+    finally:
+        # Cliente desconectou no meio: para de esperar. A análise jurídica fica no
+        # analysis_store e as forenses seguem na fila (o resultado é guardado por hash)
+        for task in tasks:
+            task.cancel()
+
+@router.post("/claim/pipeline")
+async def claim_pipeline_endpoint(request: PipelineRequest):
+    """
+    Evidence analysis, legal analysis and claim generation in one call,
+    streamed as NDJSON stage events as each one finishes.
+    """
+    if len(request.evidences) > PIPELINE_MAX_EVIDENCES:
+        raise HTTPException(status_code=413, detail=f"Evidências demais. Máximo {PIPELINE_MAX_EVIDENCES}.")
+    return StreamingResponse(_run_pipeline(request), media_type="application/x-ndjson")
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from services.llm import llm_service
+from services.analysis_store import analysis_store
+from services.legal_index import legal_index
+from services.local_scorer import local_scorer
+from services.pregeneration import claim_pregenerator
+from services.forensic_jobs import forensic_jobs
+from services.preprocess import preprocessor
+from routers.chat import conversational_agent, conversation_store
+from routers.claim import generator_agent
+from routers.upload import evidence_store
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    """Métricas de desempenho do backend (cache, filas, latências)."""
+    return {
+        "llm": llm_service.get_stats(),
+        "chat": conversational_agent.stats,
+        "summarizer": conversational_agent.summarizer.stats,
+        "analysis_store": analysis_store.get_stats(),
+        "conversations": conversation_store.get_stats(),
+        "legal_index": legal_index.get_stats(),
+        "local_scorer": local_scorer.get_stats(),
+        "generator": generator_agent.stats,
+        "pregeneration": claim_pregenerator.get_stats(),
+        "evidence_store": evidence_store.get_stats(),
+        "forensic_jobs": forensic_jobs.get_stats(),
+        "preprocess": preprocessor.get_stats()
+    }
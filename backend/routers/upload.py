@@ -1,7 +1,8 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import shutil
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import os
-import uuid
 from typing import List
 
 router = APIRouter()
@@ -9,47 +10,196 @@ router = APIRouter()
 UPLOAD_DIR = "temp_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-ALLOWED_TYPES = ["image/jpeg", "image/png", "application/pdf"]
 MAX_SIZE_MB = 10 * 1024 * 1024 # 10MB
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "20"))
+JOB_MAX_WAIT_SECONDS = 30.0  # Teto do long-polling em /upload/jobs/{id}?wait=
+JOB_SSE_KEEPALIVE_SECONDS = 15.0
 
-from services.llm import LLMService
+from services.llm import llm_service
+from services.upload_stream import UploadError, receive_upload
+from services.evidence_store import EvidenceStore
+from services.forensic_jobs import forensic_jobs, QueueFull, JOB_DONE, JOB_FAILED
+from services.preprocess import preprocessor
 from agents.forensic import ForensicAgent
 
-llm_service = LLMService()
 forensic_agent = ForensicAgent(llm_service)
+evidence_store = EvidenceStore(UPLOAD_DIR)
+
+def evidence_context(record: dict) -> str:
+    return "Foto do Dano" if record["content_type"].startswith("image/") else "Documento"
+
+async def preprocess_evidence(record: dict) -> dict:
+    """Local PDF text / EXIF / image size extraction (process pool), cached per evidence hash."""
+    return await evidence_store.preprocessed(record, lambda: preprocessor.run(record))
+
+async def analyze_evidence(record: dict) -> dict:
+    """Forensic analysis of a stored evidence, reused across uploads of the same content."""
+    async def run() -> dict:
+        preprocessed = await preprocess_evidence(record)
+        result = await forensic_agent.analyze_evidence(
+            record["path"], context=evidence_context(record), preprocessed=preprocessed
+        )
+        if preprocessor.enabled and "error" in preprocessed:
+            # Análise sem o texto/EXIF extraído: serve agora, mas não fica guardada sob o hash
+            result = {**result, "retryable": True}
+        return result
+
+    return await evidence_store.forensic(
+        record,
+        run,
+        persist=not forensic_agent.llm.mock_mode  # Resposta simulada não vale como análise guardada
+    )
+
+async def wait_forensic_job(record: dict) -> dict:
+    """
+    Forensic analysis of a stored evidence through the bounded job queue, waiting
+    until it finishes (for callers that need it inline, like /claim/pipeline).
+    Raises QueueFull, or RuntimeError if the job failed.
+    """
+    if record["forensic_analysis"] is not None:
+        return record["forensic_analysis"]
+    forensic_jobs.submit(record["evidence_id"], lambda: analyze_evidence(record))
+    while True:
+        job = await forensic_jobs.wait(record["evidence_id"], JOB_MAX_WAIT_SECONDS)
+        if job is None:
+            raise RuntimeError("Análise forense saiu da fila antes de terminar.")
+        if job["status"] == JOB_DONE:
+            return job["forensic_analysis"]
+        if job["status"] == JOB_FAILED:
+            raise RuntimeError(job["error"] or "Análise forense falhou.")
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    # ... previous validation code ...
-    if file.content_type not in ALLOWED_TYPES:
-        raise HTTPException(status_code=400, detail="Tipo de arquivo não suportado. Use JPG, PNG ou PDF.")
-    
-    file_ext = file.filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
+async def upload_file(request: Request):
+    """
+    Multipart upload of one file in the `file` field (JPG, PNG or PDF, up to 10MB).
+    The body is streamed to disk: size, type (by magic bytes) and SHA-256 are
+    checked while it arrives, so oversized or wrong files are rejected early.
+    The SHA-256 is the `evidence_id`; re-uploads of the same content are deduplicated.
+    """
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Check size after saving
-        if os.path.getsize(file_path) > MAX_SIZE_MB:
-            os.remove(file_path)
-            raise HTTPException(status_code=400, detail="Arquivo muito grande. Máximo 10MB.")
-        
-        # Determine context based on filename/type for the mock
-        context = "Foto do Dano" if "image" in file.content_type else "Documento"
-        
-        # Call Forensic Agent
-        analysis = await forensic_agent.analyze_evidence(file_path, context=context)
-            
-        return {
-            "filename": filename,
-            "original_name": file.filename,
-            "path": file_path,
-            "forensic_analysis": analysis
-        }
+        files = await receive_upload(request, UPLOAD_DIR, MAX_SIZE_MB)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if not files:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo enviado.")
+    return await _accept(files[0])
+
+async def _accept(upload) -> dict:
+    """Stores a received file and queues its forensic analysis; HTTPException on failure."""
+    try:
+        # Mesmo conteúdo já enviado antes: reaproveita o arquivo e a análise
+        record = await evidence_store.put(upload)
     except Exception as e:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if upload.path and os.path.exists(upload.path):
+            os.remove(upload.path)
         raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
+
+    if record["forensic_analysis"] is not None:
+        job = {"status": JOB_DONE, "forensic_analysis": record["forensic_analysis"]}
+    else:
+        # A análise roda na fila; o resultado sai em /upload/jobs/{evidence_id}
+        try:
+            job = forensic_jobs.submit(record["evidence_id"], lambda: analyze_evidence(record))
+        except QueueFull:
+            raise HTTPException(status_code=503, detail="Muitas análises em andamento. Tente de novo em instantes.")
+
+    return {
+        "evidence_id": record["evidence_id"],
+        "filename": record["filename"],
+        "original_name": upload.original_name,
+        "path": record["path"],
+        "content_type": record["content_type"],
+        "size": record["size"],
+        "sha256": record["evidence_id"],
+        "deduplicated": record["deduplicated"],
+        "forensic_status": job["status"],
+        "forensic_analysis": job["forensic_analysis"],
+        "job_url": f"/api/upload/jobs/{record['evidence_id']}"
+    }
+
+@router.post("/upload/batch")
+async def upload_batch(request: Request, wait: float = 0):
+    """
+    Multipart upload of several files (any field name, up to BATCH_UPLOAD_MAX_FILES)
+    in one request. Each file is validated on its own: a rejected file becomes an
+    error item and the others go on. Analyses share the bounded forensic worker pool;
+    `wait` (seconds, max 30) holds the response until they finish.
+    Returns {"files": [...], "summary": {"total", "ok", "error"}}, in upload order.
+    """
+    try:
+        files = await receive_upload(request, UPLOAD_DIR, MAX_SIZE_MB, max_files=BATCH_UPLOAD_MAX_FILES,
+                                     stop_on_error=False)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if not files:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo enviado.")
+    wait = min(max(wait, 0), JOB_MAX_WAIT_SECONDS)
+
+    async def accept(index: int, upload) -> dict:
+        item = {"index": index, "original_name": upload.original_name}
+        if upload.error is not None:
+            return {**item, "status": "error", "status_code": upload.error.status_code, "error": upload.error.detail}
+        try:
+            result = await _accept(upload)
+        except HTTPException as e:
+            return {**item, "status": "error", "status_code": e.status_code, "error": e.detail}
+        if wait and result["forensic_status"] != JOB_DONE:
+            job = await forensic_jobs.wait(result["evidence_id"], wait)
+            result.update(forensic_status=job["status"], forensic_analysis=job["forensic_analysis"])
+            if job["error"]:
+                result["forensic_error"] = job["error"]
+        return {**item, "status": "ok", **result}
+
+    # Gravação no índice e espera pelas análises correm em paralelo entre os arquivos
+    results = await asyncio.gather(*(accept(index, upload) for index, upload in enumerate(files)))
+    ok = sum(1 for result in results if result["status"] == "ok")
+    return {"files": results, "summary": {"total": len(results), "ok": ok, "error": len(results) - ok}}
+
+async def _job_status(evidence_id: str, wait: float = 0) -> dict:
+    job = await forensic_jobs.wait(evidence_id, min(max(wait, 0), JOB_MAX_WAIT_SECONDS))
+    if job is not None:
+        return job
+    # Sem job (já descartado, ou de antes de reiniciar): vale a análise guardada no índice
+    record = await evidence_store.get(evidence_id)
+    if record is None or record["forensic_analysis"] is None:
+        raise HTTPException(status_code=404, detail="Análise não encontrada.")
+    return {"evidence_id": evidence_id, "status": JOB_DONE, "forensic_analysis": record["forensic_analysis"],
+            "error": None, "wait_ms": None, "processing_ms": None}
+
+@router.get("/upload/jobs/{evidence_id}")
+async def get_forensic_job(evidence_id: str, wait: float = 0):
+    """
+    Status of the forensic analysis: queued, running, done (with forensic_analysis)
+    or failed (with error). `wait` (seconds, max 30) long-polls until it finishes.
+    """
+    return await _job_status(evidence_id, wait)
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.get("/upload/jobs/{evidence_id}/events")
+async def forensic_job_events(evidence_id: str):
+    """
+    Server-Sent Events for one analysis:
+    - event: status -> job snapshot (sent on connect and on each status change)
+    - event: done / failed -> final snapshot, then the stream ends
+    """
+    job = await _job_status(evidence_id)
+
+    async def event_stream():
+        current = job
+        yield _sse_event("status", current)
+        while current["status"] not in (JOB_DONE, JOB_FAILED):
+            previous = current["status"]
+            current = await _job_status(evidence_id, JOB_SSE_KEEPALIVE_SECONDS)
+            if current["status"] != previous and current["status"] not in (JOB_DONE, JOB_FAILED):
+                yield _sse_event("status", current)
+            elif current["status"] == previous:
+                yield ": keepalive\n\n"
+        yield _sse_event(current["status"], current)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,119 @@
+"""
+Registro compartilhado de análises jurídicas por relato.
+
+O chat roda a análise silenciosa de cada relato; o widget de score pede a
+mesma análise logo depois em /api/claim/analyze. Guardando o resultado
+(ou a tarefa ainda em andamento) sob a impressão digital do relato, a
+segunda chamada reaproveita a primeira em vez de pagar outra ida ao LLM.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+
+def report_fingerprint(report: str, evidences: Optional[list] = None) -> str:
+    """Impressão digital do relato (normalizado) + quantidade de evidências."""
+    normalized = " ".join(report.lower().split())
+    payload = f"{normalized}|{len(evidences or [])}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _is_fallback(result) -> bool:
+    """Análise montada sem resposta real do LLM (ver LLMService.is_fallback): não fica guardada."""
+    return isinstance(result, dict) and bool(result.get("fallback"))
+
+
+class AnalysisStore:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()  # id -> {"task", "result", "created_at"}
+        self.stats = {
+            "started": 0,
+            "hits_completed": 0,
+            "hits_inflight": 0,
+            "misses": 0
+        }
+
+    def _lookup(self, analysis_id: str) -> Optional[dict]:
+        entry = self._entries.get(analysis_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["created_at"] > self.ttl_seconds:
+            del self._entries[analysis_id]
+            return None
+        task = entry["task"]
+        if entry["result"] is None:
+            if task.done():
+                # Tarefa que falhou, foi cancelada ou caiu no fallback do LLM não serve
+                if task.cancelled() or task.exception() is not None or _is_fallback(task.result()):
+                    del self._entries[analysis_id]
+                    return None
+                entry["result"] = task.result()
+            elif task.get_loop() is not asyncio.get_running_loop():
+                # Tarefa presa num event loop que não é o atual
+                del self._entries[analysis_id]
+                return None
+        self._entries.move_to_end(analysis_id)
+        return entry
+
+    def start(self, report: str, evidences: Optional[list],
+              run: Callable[[], Awaitable[dict]]) -> str:
+        """Garante que a análise do relato exista (pronta ou em andamento) e devolve o id."""
+        analysis_id = report_fingerprint(report, evidences)
+        if self._lookup(analysis_id) is not None:
+            return analysis_id
+
+        entry = {"task": None, "result": None, "created_at": time.monotonic()}
+        entry["task"] = asyncio.ensure_future(run())
+        entry["task"].add_done_callback(lambda t: self._on_done(entry, t))
+        self._entries[analysis_id] = entry
+        self.stats["started"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return analysis_id
+
+    def _on_done(self, entry: dict, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is None and not _is_fallback(task.result()):
+            entry["result"] = task.result()
+
+    def task(self, analysis_id: str) -> Optional[asyncio.Future]:
+        entry = self._lookup(analysis_id)
+        return entry["task"] if entry is not None else None
+
+    def peek(self, analysis_id: str) -> Optional[dict]:
+        """Resultado já pronto, sem esperar."""
+        entry = self._lookup(analysis_id)
+        return entry["result"] if entry is not None else None
+
+    async def get(self, analysis_id: str) -> Optional[dict]:
+        """Resultado pronto, ou aguarda a análise em andamento. None se desconhecido."""
+        entry = self._lookup(analysis_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry["result"] is not None:
+            self.stats["hits_completed"] += 1
+            return entry["result"]
+        self.stats["hits_inflight"] += 1
+        # shield: quem desistir de esperar não cancela a análise para os outros
+        return await asyncio.shield(entry["task"])
+
+    async def get_or_run(self, report: str, evidences: Optional[list],
+                         run: Callable[[], Awaitable[dict]]) -> dict:
+        analysis_id = report_fingerprint(report, evidences)
+        result = await self.get(analysis_id)
+        if result is not None:
+            return result
+        self.start(report, evidences, run)
+        return await asyncio.shield(self._entries[analysis_id]["task"])
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "entries": len(self._entries)}
+
+
+# Instância global compartilhada entre /api/chat e /api/claim
+analysis_store = AnalysisStore()
@@ -0,0 +1,102 @@
+"""
+Reclamações por modelo, sem LLM, para os tipos rotineiros.
+
+Os modelos (data/claim_templates.json) são compilados uma vez em
+string.Template; as entidades (data, valor, empresa, endereço) saem do
+relato por regex pré-compiladas. Tipos sem modelo ("outros") continuam
+indo para o LLM no GeneratorAgent.
+"""
+
+import json
+import os
+import re
+from string import Template
+from typing import Dict, Optional
+
+from services.classifier import claim_classifier
+from services.learning import CLAIM_TYPE_RULES
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "claim_templates.json")
+MAX_FACTS_CHARS = 3000  # Limite do Consumidor.gov.br
+
+_MONTHS = "janeiro|fevereiro|março|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro"
+_DAY = r"(?:0?[1-9]|[12]\d|3[01])"
+_MONTH = r"(?:0?[1-9]|1[0-2])"
+_DATE = re.compile(
+    # dd/mm só com dois dígitos cada (ou com o ano): "1/2" é fração, não data
+    rf"\b({_DAY}/{_MONTH}/(?:\d{{4}}|\d{{2}})|(?:0[1-9]|[12]\d|3[01])/(?:0[1-9]|1[0-2])"
+    rf"|\d{{1,2}} de (?:{_MONTHS})(?: de \d{{4}})?"
+    rf"|(?:{_MONTHS})(?: de \d{{4}})?"
+    r"|há \d+ (?:dias?|semanas?|mes(?:es)?|anos?))\b",
+    re.IGNORECASE
+)
+_AMOUNT = re.compile(r"R\$\s?\d{1,3}(?:\.\d{3})*(?:,\d{2})?|\b\d+(?:\.\d{3})*(?:,\d{2})? reais\b", re.IGNORECASE)
+# Palavras com maiúscula que começam outra frase, não continuam o nome da empresa
+_NOT_NAME = (r"(?:Ontem|Hoje|Amanh[ãa]|Desde|Depois|Antes|Agora|Ent[ãa]o|Mas|Por[ée]m|Quando|J[áa]|At[ée]"
+             r"|H[áa]|Ap[óo]s|N[ãa]o|Tamb[ée]m|Eu|Ele|Ela|Eles|Elas|N[óo]s|Isso|Isto|Esse|Essa|Este|Esta"
+             r"|Meu|Minha|O|A|Os|As|Um|Uma|No|Na|Em|E)\b")
+_COMPANY_SUFFIX = r"(?:Ltda\.?|S\.A\.|S/A|ME|EPP)(?![\w/])"
+_NAME_WORD = rf"(?!{_NOT_NAME}|{_COMPANY_SUFFIX})[A-ZÀ-Ú][\w&'-]*"
+_COMPANY = re.compile(
+    # Nome sem pontuação (para na frase seguinte); ponto só no sufixo societário
+    r"\b(?:[Ii]mobili[áa]ria|[Aa]dministradora|[Cc]onstrutora|[Ee]mpresa)[ \t]+"
+    rf"({_NAME_WORD}(?:[ \t]+(?:d[aeo][ \t]+|&[ \t]+)?{_NAME_WORD}){{0,3}}"
+    rf"(?:[ \t]+{_COMPANY_SUFFIX})?)"
+)
+_ADDRESS = re.compile(
+    r"\b((?:Rua|R\.|Avenida|Av\.|Travessa|Alameda|Praça|Estrada)\s+[^,.;\n]+"
+    r"(?:,\s*(?:n[º°o.]?\s*)?\d+[A-Za-z]?)?)"
+)
+
+
+def extract_entities(text: str) -> Dict[str, Optional[str]]:
+    """Primeira data, valor, empresa e endereço citados no relato."""
+    entities = {}
+    for name, pattern in (("date", _DATE), ("amount", _AMOUNT), ("company", _COMPANY), ("address", _ADDRESS)):
+        match = pattern.search(text)
+        entities[name] = match.group(1 if pattern.groups else 0).strip() if match else None
+    return entities
+
+
+class ClaimTemplateEngine:
+    def __init__(self, path: str = TEMPLATES_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)["templates"]
+        self._templates = {
+            claim_type: {field: Template(spec[field]) for field in ("title", "facts", "request", "value")}
+            for claim_type, spec in raw.items()
+        }
+        self._value_defaults = {claim_type: spec.get("value_default", "A apurar") for claim_type, spec in raw.items()}
+
+    def detect_type(self, report: str) -> str:
+        return claim_classifier.classify(report, CLAIM_TYPE_RULES, default="outros")
+
+    def render(self, case_data: dict) -> Optional[dict]:
+        """Reclamação preenchida, ou None se o tipo do relato não tem modelo."""
+        report = case_data.get("report", "")
+        claim_type = case_data.get("type") or self.detect_type(report)
+        templates = self._templates.get(claim_type)
+        if templates is None:
+            return None
+
+        entities = extract_entities(report)
+        date = entities["date"]
+        relative = bool(date) and date.lower().startswith("há")
+        variables = {
+            "address_phrase": f"situado em {entities['address']}" if entities["address"] else "objeto do contrato de locação",
+            "since": ("H" + date[1:] if relative else f"Desde {date}") if date else "Há algum tempo",
+            "when": ("H" + date[1:] if relative else f"Em {date}") if date else "Recentemente",
+            "company": entities["company"] or "locador/imobiliária",
+            "amount": entities["amount"] or self._value_defaults[claim_type],
+            "evidence_phrase": "Anexo fotos e documentos que comprovam o ocorrido." if case_data.get("forensic_data") else "",
+            "report": report.strip(),
+        }
+        claim = {field: template.safe_substitute(variables) for field, template in templates.items()}
+        claim["facts"] = claim["facts"].replace(" \n", "\n")[:MAX_FACTS_CHARS]
+        claim["company_name"] = entities["company"] or ""
+        claim["claim_type"] = claim_type
+        return claim
+
+
+# Instância global: modelos compilados uma vez
+claim_template_engine = ClaimTemplateEngine()
@@ -0,0 +1,89 @@
+"""
+Classificador de relatos por palavras-chave, compilado uma vez.
+
+A taxonomia (data/claim_taxonomy.json) lista radicais por sinal. Todos os
+radicais viram um único padrão em forma de trie (estilo Aho-Corasick: o
+prefixo comum é testado uma vez só), casado no início de palavra sobre o
+texto já sem acentos. Uma varredura devolve todos os sinais presentes;
+cada chamador decide a prioridade entre eles.
+"""
+
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "claim_taxonomy.json")
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Infiltração" -> "infiltracao")."""
+    text = text.lower()
+    if text.isascii():
+        return text
+    # NFD separa letra e acento; o encode ascii descarta os acentos (e o resto que não for ASCII)
+    return unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Fim de palavra no meio do caminho: o resto é opcional (guloso = radical mais longo)
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return render(trie)
+
+
+class KeywordClassifier:
+    def __init__(self, signals: Dict[str, Sequence[str]]):
+        own: Dict[str, Set[str]] = {}
+        for signal, stems in signals.items():
+            for stem in stems:
+                own.setdefault(fold(stem), set()).add(signal)
+        # O padrão casa só o radical mais longo em cada posição ("multas", nunca "multa"
+        # também): cada radical leva junto os sinais dos radicais que são prefixo dele
+        self._signals_by_stem: Dict[str, Set[str]] = {
+            stem: set().union(*(own[stem[:end]] for end in range(1, len(stem) + 1) if stem[:end] in own))
+            for stem in own
+        }
+        # Só casa no início de palavra ("taxa" não casa em "sintaxe"). O texto já vem
+        # dobrado para ASCII, e a classe explícita é mais rápida que \w no lookbehind.
+        self._pattern = re.compile(r"(?<![a-z0-9_])" + _trie_pattern(self._signals_by_stem))
+
+    @classmethod
+    def from_file(cls, path: str = TAXONOMY_PATH) -> "KeywordClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["signals"])
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Todos os sinais presentes no texto, numa única varredura."""
+        found: Set[str] = set()
+        for match in self._pattern.finditer(fold(text)):
+            found |= self._signals_by_stem[match.group()]
+        return frozenset(found)
+
+    def classify(self, text: str, rules: List[Tuple[str, Iterable[str]]],
+                 default: Optional[str] = None) -> Optional[str]:
+        """Primeiro rótulo (na ordem de `rules`) com algum sinal presente."""
+        found = self.match(text)
+        for label, signals in rules:
+            if not found.isdisjoint(signals):
+                return label
+        return default
+
+
+# Instância compartilhada (LegalAgent, LearningService)
+claim_classifier = KeywordClassifier.from_file()
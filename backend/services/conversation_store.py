@@ -0,0 +1,105 @@
+"""
+Histórico de conversas mantido no servidor.
+
+Com um conversation_id o cliente manda só a mensagem nova em cada turno,
+em vez de reenviar (e o servidor revalidar) a conversa inteira. O store é
+limitado em memória: LRU por número de conversas, expiração por
+inatividade e um teto de mensagens por conversa.
+
+Cada conversa guarda também o resumo corrido das mensagens antigas. As
+mensagens só saem do histórico depois de entrar nesse resumo (o
+ConversationSummarizer as dobra ao chegar em max_messages); se o resumo
+falhar (LLM fora do ar), o store aguenta até o dobro do teto antes de
+cortar sem resumir.
+"""
+
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class ConversationStore:
+    def __init__(self, max_conversations: int = 5000, idle_seconds: float = 3600,
+                 max_messages: int = 40):
+        self.max_conversations = max_conversations
+        self.idle_seconds = idle_seconds
+        self.max_messages = max_messages
+        self._conversations: "OrderedDict[str, dict]" = OrderedDict()  # id -> {"messages", "summary", "last_seen"}
+        self.stats = {
+            "created": 0,
+            "turns": 0,
+            "expired": 0,
+            "evicted": 0,
+            "not_found": 0,
+            "folded": 0,
+            "dropped_unsummarized": 0
+        }
+
+    def _lookup(self, conversation_id: str) -> Optional[dict]:
+        entry = self._conversations.get(conversation_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["last_seen"] > self.idle_seconds:
+            del self._conversations[conversation_id]
+            self.stats["expired"] += 1
+            return None
+        entry["last_seen"] = time.monotonic()
+        self._conversations.move_to_end(conversation_id)
+        return entry
+
+    def create(self, messages: Optional[List[Dict[str, str]]] = None) -> str:
+        """Abre uma conversa (opcionalmente com histórico inicial) e devolve o id."""
+        conversation_id = uuid.uuid4().hex
+        self._conversations[conversation_id] = {"messages": [], "summary": "", "last_seen": time.monotonic()}
+        self.stats["created"] += 1
+        if messages:
+            self._extend(self._conversations[conversation_id], messages)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self.stats["evicted"] += 1
+        return conversation_id
+
+    def get(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """Cópia do histórico, ou None se a conversa não existe ou expirou."""
+        entry = self._lookup(conversation_id)
+        if entry is None:
+            self.stats["not_found"] += 1
+            return None
+        return list(entry["messages"])
+
+    def get_summary(self, conversation_id: str) -> str:
+        """Resumo corrido das mensagens que já saíram do histórico ("" se nenhuma saiu)."""
+        entry = self._conversations.get(conversation_id)
+        return entry["summary"] if entry is not None else ""
+
+    def append(self, conversation_id: str, *messages: Dict[str, str],
+               summary: Optional[str] = None, folded: int = 0) -> bool:
+        """
+        Registra as mensagens do turno. Com `summary`, ele passa a ser o resumo da
+        conversa e as `folded` primeiras mensagens (já resumidas) saem do histórico.
+        False se a conversa sumiu nesse meio-tempo.
+        """
+        entry = self._lookup(conversation_id)
+        if entry is None:
+            return False
+        if summary is not None:
+            entry["summary"] = summary
+            del entry["messages"][:folded]
+            self.stats["folded"] += folded
+        self._extend(entry, messages)
+        self.stats["turns"] += 1
+        return True
+
+    def _extend(self, entry: dict, messages) -> None:
+        # Guarda só role/content: nada de timestamps ou objetos Pydantic
+        entry["messages"].extend({"role": m["role"], "content": m["content"]} for m in messages)
+        # Acima de max_messages o summarizer já dobra as antigas no resumo; o corte
+        # aqui é só o limite de memória para quando o resumo não deu certo
+        overflow = len(entry["messages"]) - 2 * self.max_messages
+        if overflow > 0:
+            del entry["messages"][:overflow]
+            self.stats["dropped_unsummarized"] += overflow
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "active": len(self._conversations)}
@@ -0,0 +1,179 @@
+"""
+Armazenamento de evidências endereçado por conteúdo.
+
+Cada arquivo é guardado uma vez só, como <sha256>.<ext>, e o SHA-256 é o
+evidence_id. Um índice SQLite liga o hash ao arquivo gravado e ao resultado
+da análise forense (e às features do pré-processamento local). Reenviar o mesmo contrato ou a mesma foto (retentativas,
+documentos compartilhados) custa só o hash, já calculado no streaming do
+upload, e uma consulta ao índice: sem nova cópia em disco e sem nova ida ao LLM.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from services.upload_stream import EXTENSIONS, ReceivedFile
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+EVIDENCE_INDEX_PATH = os.getenv("EVIDENCE_INDEX_PATH", os.path.join(DATA_DIR, "evidence.sqlite3"))
+
+_EVIDENCE_ID = re.compile(r"[0-9a-f]{64}")
+
+
+class EvidenceStore:
+    """
+    Índice hash -> arquivo + análise forense. As operações de SQLite e de
+    disco rodam em thread para não bloquear o event loop.
+    """
+
+    def __init__(self, root_dir: str, index_path: str = EVIDENCE_INDEX_PATH):
+        self.root_dir = root_dir
+        self.index_path = index_path
+        self._running: Dict[tuple, asyncio.Future] = {}  # (coluna, evidence_id) -> tarefa em andamento
+        self.stats = {
+            "stored": 0,
+            "deduplicated": 0,
+            "forensic_cached": 0,
+            "forensic_runs": 0,
+            "forensic_joined": 0,
+            "preprocessed_cached": 0,
+            "preprocessed_runs": 0,
+            "preprocessed_joined": 0
+        }
+        os.makedirs(root_dir, exist_ok=True)
+        self._init_db()
+
+    # =================== ÍNDICE ===================
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=5)
+
+    def _init_db(self):
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS evidence ("
+                " evidence_id TEXT PRIMARY KEY,"
+                " filename TEXT NOT NULL,"
+                " content_type TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " original_name TEXT,"
+                " forensic TEXT,"
+                " created_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(evidence)")}
+            if "preprocessed" not in columns:
+                conn.execute("ALTER TABLE evidence ADD COLUMN preprocessed TEXT")
+
+    def _select(self, evidence_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT filename, content_type, size, original_name, forensic, preprocessed"
+                " FROM evidence WHERE evidence_id = ?",
+                (evidence_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        filename, content_type, size, original_name, forensic, preprocessed = row
+        return {
+            "evidence_id": evidence_id,
+            "filename": filename,
+            "path": os.path.join(self.root_dir, filename),
+            "content_type": content_type,
+            "size": size,
+            "original_name": original_name,
+            "forensic_analysis": json.loads(forensic) if forensic else None,
+            "preprocessed": json.loads(preprocessed) if preprocessed else None
+        }
+
+    def _store(self, upload: ReceivedFile) -> tuple:
+        evidence_id = upload.sha256
+        record = self._select(evidence_id)
+        if record is not None and os.path.isfile(record["path"]):
+            os.remove(upload.path)  # Conteúdo já guardado: descarta a cópia nova
+            return record, False
+
+        filename = f"{evidence_id}.{EXTENSIONS[upload.content_type]}"
+        os.replace(upload.path, os.path.join(self.root_dir, filename))
+        with self._connect() as conn:
+            # Se o arquivo tinha sumido do disco, o registro (e a análise) continuam valendo
+            conn.execute(
+                "INSERT OR IGNORE INTO evidence (evidence_id, filename, content_type, size, original_name, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (evidence_id, filename, upload.content_type, upload.size, upload.original_name, time.time())
+            )
+        return self._select(evidence_id), record is None
+
+    def _save(self, column: str, evidence_id: str, result: dict):
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE evidence SET {column} = ? WHERE evidence_id = ?",
+                (json.dumps(result, ensure_ascii=False), evidence_id)
+            )
+
+    # =================== API ===================
+
+    async def put(self, upload: ReceivedFile) -> dict:
+        """Guarda o arquivo recebido (ou reaproveita o já guardado) e devolve o registro."""
+        record, created = await asyncio.to_thread(self._store, upload)
+        upload.path = None
+        self.stats["stored" if created else "deduplicated"] += 1
+        return {**record, "deduplicated": not created}
+
+    async def get(self, evidence_id: str) -> Optional[dict]:
+        if not evidence_id or not _EVIDENCE_ID.fullmatch(evidence_id):
+            return None
+        record = await asyncio.to_thread(self._select, evidence_id)
+        if record is None or not os.path.isfile(record["path"]):
+            return None
+        return record
+
+    async def forensic(self, record: dict, run: Callable[[], Awaitable[dict]], persist: bool = True) -> dict:
+        """
+        Análise forense da evidência: a guardada no índice, a que já está em
+        andamento para o mesmo hash, ou uma nova (gravada se `persist` e se não
+        vier com erro, nem for um fallback do LLM ("fallback"), nem tiver sido
+        feita sem o pré-processamento ("retryable")).
+        """
+        return await self._cached("forensic", "forensic_analysis", record, run, persist)
+
+    async def preprocessed(self, record: dict, run: Callable[[], Awaitable[dict]]) -> dict:
+        """Features do pré-processamento local, com o mesmo reaproveitamento da análise forense."""
+        return await self._cached("preprocessed", "preprocessed", record, run, True)
+
+    async def _cached(self, column: str, field: str, record: dict,
+                      run: Callable[[], Awaitable[dict]], persist: bool) -> dict:
+        if record.get(field) is not None:
+            self.stats[f"{column}_cached"] += 1
+            return record[field]
+
+        key = (column, record["evidence_id"])
+        task = self._running.get(key)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            self.stats[f"{column}_joined"] += 1
+            return await asyncio.shield(task)
+
+        async def compute() -> dict:
+            result = await run()
+            if persist and "error" not in result and not result.get("fallback") and not result.get("retryable"):
+                await asyncio.to_thread(self._save, column, record["evidence_id"], result)
+            return result
+
+        task = asyncio.ensure_future(compute())
+        self._running[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        self.stats[f"{column}_runs"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: tuple, task: asyncio.Future):
+        if self._running.get(key) is task:
+            del self._running[key]
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "inflight": len(self._running)}
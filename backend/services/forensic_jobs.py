@@ -0,0 +1,182 @@
+"""
+Fila de análises forenses com pool de workers.
+
+O /api/upload grava a evidência e devolve o evidence_id na hora; a análise
+forense entra nesta fila e é processada por no máximo `workers` tarefas ao
+mesmo tempo. O resultado sai por polling (GET /api/upload/jobs/{id}) ou por
+SSE (.../events).
+
+A fila é limitada: com `max_queue` jobs esperando, novos envios são recusados
+(QueueFull) em vez de acumular trabalho sem fim. Os workers sobem uma vez, no
+startup da aplicação, e ficam presos ao event loop dela até o shutdown.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from services.resilience import LatencyTracker
+
+FORENSIC_WORKERS = int(os.getenv("FORENSIC_WORKERS", "4"))
+FORENSIC_QUEUE_MAX = int(os.getenv("FORENSIC_QUEUE_MAX", "100"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class QueueFull(Exception):
+    """Fila de análises cheia; o cliente deve tentar de novo mais tarde."""
+
+
+class ForensicJobQueue:
+    def __init__(self, workers: int = FORENSIC_WORKERS, max_queue: int = FORENSIC_QUEUE_MAX,
+                 max_finished: int = 1024):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()  # evidence_id -> job
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._loop = None
+        self.wait_time = LatencyTracker()
+        self.processing_time = LatencyTracker()
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "recovered": 0
+        }
+
+    # =================== WORKERS ===================
+
+    def start(self):
+        """
+        Sobe os workers no event loop atual (chamado no startup da aplicação).
+        Jobs que ficaram pela metade num shutdown anterior voltam para a fila.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            raise RuntimeError("Fila forense já está rodando em outro event loop")
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        for evidence_id, job in self._jobs.items():
+            if job["status"] in (JOB_QUEUED, JOB_RUNNING):
+                job["status"] = JOB_QUEUED
+                job["finished"] = asyncio.Event()
+                self._queue.put_nowait(evidence_id)
+                self.stats["recovered"] += 1
+
+    async def _worker(self):
+        while True:
+            evidence_id = await self._queue.get()
+            job = self._jobs.get(evidence_id)
+            if job is None or job["status"] != JOB_QUEUED:
+                continue
+            job["status"] = JOB_RUNNING
+            job["started_at"] = time.monotonic()
+            self.wait_time.record(job["started_at"] - job["enqueued_at"])
+            try:
+                job["result"] = await job["run"]()
+                job["status"] = JOB_DONE
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job["error"] = str(e)
+                job["status"] = JOB_FAILED
+                self.stats["failed"] += 1
+            job["finished_at"] = time.monotonic()
+            self.processing_time.record(job["finished_at"] - job["started_at"])
+            job["run"] = None
+            job["finished"].set()
+            self._trim()
+
+    def _trim(self):
+        finished = [k for k, job in self._jobs.items() if job["status"] in (JOB_DONE, JOB_FAILED)]
+        for evidence_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[evidence_id]
+
+    # =================== API ===================
+
+    def submit(self, evidence_id: str, run: Callable[[], Awaitable[dict]]) -> dict:
+        """Enfileira a análise da evidência (uma só por evidence_id). Levanta QueueFull."""
+        self.start()  # No-op se o startup já subiu os workers; em scripts, sobe no primeiro uso
+        job = self._jobs.get(evidence_id)
+        # Job que falhou, terminou com fallback do LLM ou sem o pré-processamento roda de novo
+        result = (job or {}).get("result") or {}
+        if job is not None and job["status"] != JOB_FAILED and not result.get("fallback") and not result.get("retryable"):
+            return self.snapshot(evidence_id)
+        if self._queue.qsize() >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise QueueFull()
+        self._jobs[evidence_id] = {
+            "status": JOB_QUEUED,
+            "run": run,
+            "result": None,
+            "error": None,
+            "enqueued_at": time.monotonic(),
+            "started_at": None,
+            "finished_at": None,
+            "finished": asyncio.Event()
+        }
+        self._jobs.move_to_end(evidence_id)
+        self._queue.put_nowait(evidence_id)
+        self.stats["submitted"] += 1
+        return self.snapshot(evidence_id)
+
+    def snapshot(self, evidence_id: str) -> Optional[dict]:
+        job = self._jobs.get(evidence_id)
+        if job is None:
+            return None
+        started, finished = job["started_at"], job["finished_at"]
+        return {
+            "evidence_id": evidence_id,
+            "status": job["status"],
+            "forensic_analysis": job["result"],
+            "error": job["error"],
+            "wait_ms": round((started - job["enqueued_at"]) * 1000) if started else None,
+            "processing_ms": round((finished - started) * 1000) if finished else None
+        }
+
+    async def wait(self, evidence_id: str, timeout: float) -> Optional[dict]:
+        """Estado do job, esperando até `timeout` segundos por ele terminar."""
+        job = self._jobs.get(evidence_id)
+        if job is None:
+            return None
+        if timeout > 0 and job["status"] in (JOB_QUEUED, JOB_RUNNING):
+            try:
+                await asyncio.wait_for(job["finished"].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.snapshot(evidence_id)
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._loop = None
+
+    def get_stats(self) -> Dict:
+        running = sum(1 for job in self._jobs.values() if job["status"] == JOB_RUNNING)
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "running": running,
+            "wait_p50": self.wait_time.percentile(50),
+            "wait_p95": self.wait_time.percentile(95),
+            "processing_p50": self.processing_time.percentile(50),
+            "processing_p95": self.processing_time.percentile(95)
+        }
+
+
+# Instância global usada por /api/upload
+forensic_jobs = ForensicJobQueue()
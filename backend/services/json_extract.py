@@ -0,0 +1,74 @@
+"""
+Extração tolerante de JSON em respostas do LLM.
+
+Modelos às vezes embrulham o JSON em cercas markdown (```json ... ```) ou
+em prosa ("Aqui está a análise: {...}"). Em vez de descartar a resposta,
+localizamos o primeiro objeto JSON válido: a varredura pula de um bloco
+{...} balanceado para o seguinte, sem reabrir o que já leu, então o custo é
+linear no tamanho da resposta.
+"""
+
+import json
+from typing import Optional, Tuple
+
+
+def _balanced_end(text: str, start: int) -> int:
+    """Índice logo depois do '}' que fecha o '{' em start (chaves dentro de strings não contam), ou -1."""
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return -1
+
+
+def extract_json(text: Optional[str]) -> Tuple[Optional[dict], bool]:
+    """
+    Recupera o primeiro objeto JSON do texto.
+
+    Returns:
+        (objeto ou None, se precisou recuperar de texto com ruído)
+    """
+    if not text:
+        return None, False
+
+    stripped = text.strip()
+    # Caminho rápido: a resposta inteira já é o objeto
+    if stripped.startswith("{"):
+        try:
+            value = json.loads(stripped)
+            if isinstance(value, dict):
+                return value, False
+        except json.JSONDecodeError:
+            pass
+
+    # Varredura: decodifica só blocos {...} balanceados; se um falha, o próximo
+    # candidato começa depois dele (tentar cada '{' de dentro seria quadrático).
+    position = text.find("{")
+    while position != -1:
+        end = _balanced_end(text, position)
+        if end == -1:
+            break  # Objeto que nunca fecha (resposta cortada)
+        try:
+            value = json.loads(text[position:end])
+            if isinstance(value, dict):
+                return value, True
+        except json.JSONDecodeError:
+            pass
+        position = text.find("{", end)
+
+    return None, False
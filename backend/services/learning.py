@@ -12,6 +12,15 @@ import json
 import os
 from datetime import datetime
 from typing import Dict, List, Optional, Any
+from services.classifier import claim_classifier
+
+# Prioridade entre os sinais do classificador: o primeiro tipo presente vence
+CLAIM_TYPE_RULES = [
+    ("manutencao_hidraulica", {"infiltracao", "hidraulica"}),
+    ("caucao", {"caucao", "devolucao"}),
+    ("cobranca_indevida", {"multa", "cobranca", "taxa"}),
+    ("contrato", {"contrato"}),
+]
 
 class LearningService:
     """
@@ -19,8 +28,11 @@ class LearningService:
     Toda interação contribui para o conhecimento coletivo.
     """
     
-    def __init__(self, storage_path: str = "data/knowledge.json"):
+    def __init__(self, storage_path: str = "data/knowledge.json",
+                 scored_reports_path: str = "data/scored_reports.jsonl"):
         self.storage_path = storage_path
+        # Vereditos de análise ficam num JSONL à parte: crescem rápido e só recebem append
+        self.scored_reports_path = scored_reports_path
         self.knowledge = self._load_knowledge()
     
     def _load_knowledge(self) -> Dict:
@@ -150,6 +162,32 @@ class LearningService:
         """Sugere nome oficial baseado em aprendizado anterior."""
         return self.knowledge["patterns"]["company_mappings"].get(user_input.lower())
     
+    def record_scored_report(self, report: str, evidences_count: int, viability_score: int, source: str = "llm"):
+        """Guarda o score dado a um relato (rótulo para o pré-score local)."""
+        os.makedirs(os.path.dirname(self.scored_reports_path) or ".", exist_ok=True)
+        line = json.dumps({
+            "timestamp": datetime.now().isoformat(),
+            "report": report,
+            "evidences": evidences_count,
+            "viability_score": viability_score,
+            "source": source
+        }, ensure_ascii=False)
+        with open(self.scored_reports_path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+    
+    def load_scored_reports(self, limit: int = 5000) -> List[Dict]:
+        """Os `limit` relatos pontuados mais recentes."""
+        if not os.path.exists(self.scored_reports_path):
+            return []
+        records = []
+        with open(self.scored_reports_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Linha truncada (queda no meio da escrita)
+        return records[-limit:]
+    
     # =================== ERROS ===================
     
     def learn_error(self, error_type: str, context: Dict, solution: Optional[str] = None):
@@ -190,18 +228,7 @@ class LearningService:
     
     def _detect_claim_type(self, facts: str) -> str:
         """Detecta tipo de reclamação baseado no texto."""
-        facts_lower = facts.lower()
-        
-        if any(word in facts_lower for word in ["infiltração", "vazamento", "hidráulica", "encanamento"]):
-            return "manutencao_hidraulica"
-        elif any(word in facts_lower for word in ["caução", "depósito", "devolução"]):
-            return "caucao"
-        elif any(word in facts_lower for word in ["multa", "cobrança", "taxa"]):
-            return "cobranca_indevida"
-        elif any(word in facts_lower for word in ["contrato", "rescisão"]):
-            return "contrato"
-        else:
-            return "outros"
+        return claim_classifier.classify(facts, CLAIM_TYPE_RULES, default="outros")
     
     def get_success_rate(self) -> float:
         """Retorna taxa de sucesso geral."""
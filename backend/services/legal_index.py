@@ -0,0 +1,223 @@
+"""
+Índice local de artigos de lei (BM25) para montar os prompts.
+
+Em vez de colar um resumo fixo da Lei do Inquilinato e do CDC em todo
+prompt, cada chamada recebe só os k artigos mais relevantes para o relato.
+
+O corpus fica em data/legal_articles.json. O índice invertido é montado uma
+vez e gravado em data/legal_index.bin; nas inicializações seguintes as
+postings são lidas direto do arquivo via mmap (sem copiar para a memória do
+processo, e compartilhadas entre workers). Se o corpus mudar, o hash no
+cabeçalho não bate e o índice é refeito.
+
+Layout do arquivo (inteiros na ordem de bytes nativa):
+    cabeçalho | tabela de termos (JSON) | comprimento dos docs (uint32) | postings (pares uint32 doc, tf)
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from typing import Dict, List
+
+from services.classifier import fold
+from services.tokens import count_tokens
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+ARTICLES_PATH = os.path.join(DATA_DIR, "legal_articles.json")
+INDEX_PATH = os.path.join(DATA_DIR, "legal_index.bin")
+
+LEGAL_INDEX_TOP_K = int(os.getenv("LEGAL_INDEX_TOP_K", "3"))
+# Teto de tokens dos artigos no prompt; o primeiro artigo entra sempre
+LEGAL_INDEX_MAX_TOKENS = int(os.getenv("LEGAL_INDEX_MAX_TOKENS", "160"))
+# Descarta artigos com score abaixo desta fração do melhor (cauda pouco relevante)
+LEGAL_INDEX_MIN_RELATIVE_SCORE = float(os.getenv("LEGAL_INDEX_MIN_RELATIVE_SCORE", "0.5"))
+
+_MAGIC = b"LIX1" + (b"L" if sys.byteorder == "little" else b"B") + b"\x00\x00\x00"
+# magic, hash do corpus, nº de docs, nº de termos, comprimento médio, bytes da tabela de termos
+_HEADER = struct.Struct("<8s32sIIdI")
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+    a ao aos as com como da das de do dos e ela ele em entre essa esse esta este eu foi for
+    ha isso ja la lhe mais mas me meu minha na nao nas nem no nos o os ou para pela pelas pelo
+    pelos por qual que se sem ser seu sua tem ter um uma uns umas voce vou ate apos sobre
+    dia dias mes meses ano anos dois duas tres
+""".split())
+
+
+def _stem(word: str) -> str:
+    # Radical leve: plural em -ões/-ães vira -ão, -éis vira -el, -s final cai, e corta em 7 letras
+    if word.endswith(("oes", "aes")):
+        word = word[:-3] + "ao"
+    elif word.endswith("eis") and len(word) > 5:
+        word = word[:-3] + "el"
+    elif word.endswith("s") and len(word) > 4:
+        word = word[:-1]
+    return word[:7]
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD.findall(fold(text)) if len(w) > 2 and w not in STOPWORDS]
+
+
+def format_articles(articles: List[dict]) -> str:
+    """Bloco de texto para o prompt, um artigo por linha."""
+    return "\n".join(f"- {a['law']}, {a['article']}: {a['text']}" for a in articles)
+
+
+class LegalIndex:
+    def __init__(self, articles_path: str = ARTICLES_PATH, index_path: str = INDEX_PATH,
+                 k1: float = 1.5, b: float = 0.75):
+        self.articles_path = articles_path
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self.articles: List[dict] = []
+        self._terms: Dict[str, List[int]] = {}  # termo -> [posição do 1º par, nº de pares]
+        self._doc_lengths = None
+        self._postings = None
+        self._avgdl = 0.0
+        self._file = None
+        self._mmap = None
+        self._view = None
+        self.stats = {"loaded_from": None, "queries": 0, "articles_returned": 0,
+                      "article_tokens": 0, "empty_results": 0}
+
+    # =================== CONSTRUÇÃO ===================
+
+    def _read_corpus(self) -> tuple:
+        with open(self.articles_path, "rb") as f:
+            raw = f.read()
+        return json.loads(raw)["articles"], hashlib.sha256(raw).digest()
+
+    def build(self, articles: List[dict], corpus_hash: bytes):
+        """Monta o índice invertido e grava o arquivo binário (escrita atômica)."""
+        postings: Dict[str, List[tuple]] = {}
+        doc_lengths = array("I")
+        for doc_id, article in enumerate(articles):
+            tokens = tokenize(f"{article['article']} {article['text']}")
+            doc_lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        flat = array("I")
+        term_table = {}
+        for term in sorted(postings):
+            term_table[term] = [len(flat) // 2, len(postings[term])]
+            for doc_id, tf in postings[term]:
+                flat.extend((doc_id, tf))
+
+        table_bytes = json.dumps(term_table, separators=(",", ":")).encode("utf-8")
+        table_bytes += b" " * (-len(table_bytes) % 8)  # mantém os arrays alinhados
+        avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        header = _HEADER.pack(_MAGIC, corpus_hash, len(articles), len(term_table), avgdl, len(table_bytes))
+
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(table_bytes)
+            f.write(doc_lengths.tobytes())
+            f.write(flat.tobytes())
+        os.replace(tmp_path, self.index_path)
+
+    # =================== CARGA ===================
+
+    def load(self):
+        """Carrega o índice via mmap, refazendo o arquivo se faltar ou estiver velho. Idempotente."""
+        if self._postings is not None:
+            return
+        articles, corpus_hash = self._read_corpus()
+        loaded_from = "mmap"
+        if not self._header_matches(corpus_hash):
+            self.build(articles, corpus_hash)
+            loaded_from = "built"
+        self._open(len(articles))
+        self.articles = articles
+        self.stats["loaded_from"] = loaded_from
+
+    def _header_matches(self, corpus_hash: bytes) -> bool:
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, stored_hash, *_ = _HEADER.unpack(f.read(_HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return magic == _MAGIC and stored_hash == corpus_hash
+
+    def _open(self, n_docs: int):
+        self._file = open(self.index_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, _, self._avgdl, table_size = _HEADER.unpack_from(self._mmap, 0)
+        offset = _HEADER.size
+        self._terms = json.loads(bytes(self._mmap[offset:offset + table_size]))
+        offset += table_size
+        self._view = memoryview(self._mmap)
+        self._doc_lengths = self._view[offset:offset + 4 * n_docs].cast("I")
+        offset += 4 * n_docs
+        self._postings = self._view[offset:].cast("I")
+
+    def close(self):
+        if self._postings is not None:
+            # As views precisam ser liberadas antes de fechar o mmap
+            self._postings.release()
+            self._doc_lengths.release()
+            self._view.release()
+            self._postings = self._doc_lengths = self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    # =================== BUSCA ===================
+
+    def search(self, query: str, k: int = LEGAL_INDEX_TOP_K,
+               max_tokens: int = LEGAL_INDEX_MAX_TOKENS) -> List[dict]:
+        """
+        Até k artigos com maior BM25 para a consulta, dentro de max_tokens.
+        Só entram artigos que casam algum termo e que não fiquem muito atrás do melhor.
+        """
+        self.load()
+        self.stats["queries"] += 1
+        n_docs = len(self.articles)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self._terms.get(term)
+            if entry is None:
+                continue
+            start, count = entry
+            idf = math.log(1 + (n_docs - count + 0.5) / (count + 0.5))
+            for i in range(2 * start, 2 * (start + count), 2):
+                doc_id, tf = self._postings[i], self._postings[i + 1]
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / self._avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        results = []
+        used = 0
+        for doc_id, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            article = self.articles[doc_id]
+            tokens = count_tokens(article["text"])
+            if results and (used + tokens > max_tokens or score < results[0]["score"] * LEGAL_INDEX_MIN_RELATIVE_SCORE):
+                break
+            results.append({**article, "score": round(score, 3)})
+            used += tokens
+        if not results:
+            self.stats["empty_results"] += 1
+        self.stats["articles_returned"] += len(results)
+        self.stats["article_tokens"] += used
+        return results
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "documents": len(self.articles), "terms": len(self._terms)}
+
+
+# Instância global (carregada no startup, ou na primeira busca)
+legal_index = LegalIndex()
@@ -1,34 +1,451 @@
+import asyncio
 import os
-from typing import List, Dict, Optional
+import re
+import time
+import httpx
+from typing import AsyncIterator, List, Dict, Optional
+from services.llm_cache import ResponseCache, make_cache_key
+from services.tokens import count_tokens, count_message_tokens
+from services.json_extract import extract_json
+from services.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from services.llm_scheduler import (
+    AdmissionScheduler, LLMRequestDropped,
+    PRIORITY_INTERACTIVE, PRIORITY_ANALYSIS, PRIORITY_BATCH
+)
+
+# --- CONFIG ---
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")  # Using a fast, capable model
+LLM_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Cache de respostas (memória LRU + disco opcional)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_DISK_PATH = os.getenv("LLM_CACHE_DISK_PATH", "")  # Vazio = só memória
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "20000"))
+
+# Scheduler de admissão (prioridades + orçamentos do provedor; 0 = sem limite)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+LLM_MAX_WAIT_ANALYSIS = float(os.getenv("LLM_MAX_WAIT_ANALYSIS", "15"))
+LLM_MAX_WAIT_BATCH = float(os.getenv("LLM_MAX_WAIT_BATCH", "120"))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "100"))
+LLM_EXPECTED_COMPLETION_TOKENS = 500  # Estimativa usada no orçamento de TPM
+
+# Circuit breaker: abre após falhas/lentidões consecutivas e vai direto ao fallback
+LLM_BREAKER_ENABLED = os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "20"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# Hedging: após o p95 de latência, dispara uma cópia e usa a que chegar primeiro
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PRIORITIES = [p.strip() for p in os.getenv("LLM_HEDGE_PRIORITIES", "interactive").split(",") if p.strip()]
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+# Saída estruturada: "schema" (json_schema estrito), "json_object" ou "off"
+# (use "off" para provedores OpenAI-compatíveis sem suporte a response_format)
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "schema").lower()
+
+
+class FallbackResponse(str):
+    """
+    Resposta simulada entregue no lugar da do modelo (erro do provedor, circuito
+    aberto ou chamada descartada pelo scheduler). Serve para a tela seguir em
+    frente, mas não pode ser guardada como resultado: ver is_fallback().
+    """
+
+
+def is_fallback(response) -> bool:
+    """True se a resposta de chat_completion é um fallback, e não a do modelo."""
+    return isinstance(response, FallbackResponse)
+
 
 class LLMService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.mock_mode = not bool(self.api_key)
+        self._client = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "requests": 0,
+            "upstream_calls": 0,
+            "coalesced": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "fallbacks": 0
+        }
+        self.usage: Dict[str, Dict[str, int]] = {}  # Tokens por classe de prioridade
+        self.json_stats: Dict[str, Dict[str, int]] = {}  # Parse de JSON por agente
+        self.scheduler = AdmissionScheduler(
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            requests_per_minute=LLM_RPM_LIMIT,
+            tokens_per_minute=LLM_TPM_LIMIT,
+            max_wait={
+                PRIORITY_INTERACTIVE: None,  # Resposta ao usuário nunca é descartada
+                PRIORITY_ANALYSIS: LLM_MAX_WAIT_ANALYSIS,
+                PRIORITY_BATCH: LLM_MAX_WAIT_BATCH
+            },
+            max_queue_depth=LLM_MAX_QUEUE_DEPTH
+        )
+        self.breaker: Optional[CircuitBreaker] = None
+        if LLM_BREAKER_ENABLED:
+            self.breaker = CircuitBreaker(
+                failure_threshold=LLM_BREAKER_FAILURE_THRESHOLD,
+                slow_call_seconds=LLM_BREAKER_SLOW_CALL_SECONDS,
+                open_seconds=LLM_BREAKER_OPEN_SECONDS
+            )
+        self.hedging_enabled = LLM_HEDGING_ENABLED
+        self.latency = LatencyTracker()
+        self.cache: Optional[ResponseCache] = None
+        if LLM_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                max_entries=LLM_CACHE_MAX_ENTRIES,
+                ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                disk_path=LLM_CACHE_DISK_PATH or None,
+                disk_max_entries=LLM_CACHE_DISK_MAX_ENTRIES
+            )
+
+    def _get_client(self):
+        """
+        Retorna o cliente assíncrono de longa duração (criado sob demanda).
+        O pool de conexões keep-alive é compartilhado por todos os agentes,
+        evitando um novo handshake TLS a cada chamada.
+        """
+        if self._client is None:
+            from openai import AsyncOpenAI
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=LLM_BASE_URL,
+                http_client=http_client,
+                max_retries=LLM_MAX_RETRIES
+            )
+        return self._client
+
+    async def aclose(self):
+        """Fecha o pool de conexões (chamado no shutdown da aplicação)."""
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.close()
 
-    async def chat_completion(self, messages: List[Dict[str, str]], system_prompt: str = "") -> str:
+    async def chat_completion(self, messages: List[Dict[str, str]], system_prompt: str = "",
+                              temperature: float = 0.7, use_cache: bool = True,
+                              priority: str = PRIORITY_ANALYSIS,
+                              response_format: Optional[Dict] = None) -> str:
+        """
+        Args:
+            priority: classe no scheduler (interactive > analysis > batch)
+            response_format: formato estruturado (ver json_format)
+
+        Returns:
+            O texto do modelo; em falha, uma FallbackResponse (o mock_mode
+            configurado devolve o texto simulado como str comum)
+        """
         if self.mock_mode:
             return self._mock_response(messages, system_prompt)
-        
+
+        self.stats["requests"] += 1
+        request_key = make_cache_key(LLM_MODEL, system_prompt, messages, temperature, response_format)
+
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            cached = await self.cache.get(request_key)
+            if cached is not None:
+                return cached
+
+        # Single-flight: chamadas idênticas simultâneas aguardam a mesma requisição
+        task = self._inflight.get(request_key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(
+            self._complete_uncached(messages, system_prompt, temperature, priority,
+                                    response_format, request_key if use_cache else None)
+        )
+        self._inflight[request_key] = task
+        task.add_done_callback(lambda t: self._release_inflight(request_key, t))
+        # shield: se um dos chamadores for cancelado, os demais continuam aguardando
+        return await asyncio.shield(task)
+
+    def _fallback_response(self, messages: List[Dict[str, str]], system_prompt: str) -> FallbackResponse:
+        self.stats["fallbacks"] += 1
+        return FallbackResponse(self._mock_response(messages, system_prompt))
+
+    def _release_inflight(self, request_key: str, task: asyncio.Future):
+        if self._inflight.get(request_key) is task:
+            del self._inflight[request_key]
+
+    async def _complete_uncached(self, messages: List[Dict[str, str]], system_prompt: str,
+                                 temperature: float, priority: str, response_format: Optional[Dict],
+                                 cache_key: Optional[str]) -> str:
+        # Provedor degradado: fallback imediato, sem esperar fila nem timeout
+        if self.breaker is not None and not self.breaker.allow():
+            return self._fallback_response(messages, system_prompt)
+
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.api_key)
-            
-            # Prepare messages with system prompt
-            api_messages = [{"role": "system", "content": system_prompt}] + messages
-            
-            response = client.chat.completions.create(
-                model="gpt-4o-mini", # Using a fast, capable model
-                messages=api_messages,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
+            async with self.scheduler.slot(priority, self._estimate_tokens(messages, system_prompt)) as ticket:
+                content, usage = await self._guarded_request(messages, system_prompt, temperature,
+                                                             response_format, priority)
+                ticket.actual_tokens = self._record_usage(priority, messages, system_prompt, content, usage)
+        except LLMRequestDropped as e:
+            if self.breaker is not None:
+                self.breaker.record_skipped()
+            print(f"[LLM] Chamada descartada pelo scheduler: {e}. Falling back to mock.")
+            return self._fallback_response(messages, system_prompt)
         except ImportError:
             print("OpenAI library not found. Falling back to mock.")
-            return self._mock_response(messages, system_prompt)
+            return self._fallback_response(messages, system_prompt)
         except Exception as e:
             print(f"Error calling OpenAI: {e}. Falling back to mock.")
-            return self._mock_response(messages, system_prompt)
+            return self._fallback_response(messages, system_prompt)
+
+        # Respostas de fallback (mock) nunca entram no cache
+        if cache_key is not None and content:
+            await self.cache.set(cache_key, content)
+        return content
+
+    async def _guarded_request(self, messages: List[Dict[str, str]], system_prompt: str, temperature: float,
+                               response_format: Optional[Dict], priority: str):
+        """Chamada ao provedor registrando o resultado no circuit breaker e, se habilitado, com hedge."""
+        self.stats["upstream_calls"] += 1
+        started = time.monotonic()
+        try:
+            if self.hedging_enabled and priority in LLM_HEDGE_PRIORITIES:
+                result = await self._hedged_request(messages, system_prompt, temperature, response_format)
+            else:
+                result = await self._request_completion(messages, system_prompt, temperature, response_format)
+        except asyncio.CancelledError:
+            if self.breaker is not None:
+                self.breaker.record_skipped()
+            raise
+        except Exception:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+
+        duration = time.monotonic() - started
+        self.latency.record(duration)
+        if self.breaker is not None:
+            self.breaker.record_success(duration)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if len(self.latency) < LLM_HEDGE_MIN_SAMPLES:
+            return None  # Ainda sem histórico suficiente para estimar o p95
+        return max(LLM_HEDGE_MIN_DELAY, self.latency.percentile(95))
+
+    async def _hedged_request(self, messages: List[Dict[str, str]], system_prompt: str, temperature: float,
+                              response_format: Optional[Dict]):
+        """
+        Dispara a requisição e, se ela passar do p95, uma cópia; vence a primeira
+        que responder com sucesso. A cópia ocupa a mesma vaga do scheduler.
+        """
+        delay = self._hedge_delay()
+        primary = asyncio.ensure_future(
+            self._request_completion(messages, system_prompt, temperature, response_format)
+        )
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.stats["hedged"] += 1
+        backup = asyncio.ensure_future(
+            self._request_completion(messages, system_prompt, temperature, response_format)
+        )
+        pending = {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+            # As duas falharam: propaga o erro da original
+            return primary.result()
+        finally:
+            for task in (primary, backup):
+                if not task.done():
+                    task.cancel()
+
+    def _count_prompt_tokens(self, messages: List[Dict[str, str]], system_prompt: str) -> int:
+        return count_tokens(system_prompt) + sum(count_message_tokens(m) for m in messages)
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]], system_prompt: str) -> int:
+        """Estimativa (prompt + resposta típica) usada no orçamento de TPM."""
+        return self._count_prompt_tokens(messages, system_prompt) + LLM_EXPECTED_COMPLETION_TOKENS
+
+    def _record_usage(self, priority: str, messages: List[Dict[str, str]], system_prompt: str,
+                      content: Optional[str], usage=None) -> int:
+        """
+        Contabiliza tokens de prompt e de resposta da chamada, por classe de prioridade.
+        Usa o `usage` devolvido pelo provedor; sem ele, conta localmente.
+        Retorna o total de tokens da chamada.
+        """
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = self._count_prompt_tokens(messages, system_prompt)
+            completion_tokens = count_tokens(content or "")
+
+        bucket = self.usage.setdefault(priority, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        bucket["calls"] += 1
+        bucket["prompt_tokens"] += prompt_tokens
+        bucket["completion_tokens"] += completion_tokens
+        return prompt_tokens + completion_tokens
+
+    async def _request_completion(self, messages: List[Dict[str, str]], system_prompt: str, temperature: float,
+                                  response_format: Optional[Dict] = None):
+        """
+        Chamada real ao provedor (sem cache nem fallback).
+        Retorna (conteúdo, usage do provedor).
+        """
+        client = self._get_client()
+        
+        # Prepare messages with system prompt
+        api_messages = [{"role": "system", "content": system_prompt}] + messages
+        
+        extra = {"response_format": response_format} if response_format else {}
+        response = await client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=api_messages,
+            temperature=temperature,
+            **extra
+        )
+        return response.choices[0].message.content, response.usage
+
+    # =================== SAÍDA ESTRUTURADA ===================
+
+    def json_format(self, name: str, schema: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        response_format para o agente `name`, conforme LLM_STRUCTURED_OUTPUT.
+        Sem schema (ou em modo json_object), pede apenas um objeto JSON.
+        """
+        if LLM_STRUCTURED_OUTPUT == "off":
+            return None
+        if schema is None or LLM_STRUCTURED_OUTPUT == "json_object":
+            return {"type": "json_object"}
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": name, "schema": schema, "strict": True}
+        }
+
+    def parse_json(self, text: Optional[str], name: str) -> Optional[dict]:
+        """
+        Extrai o objeto JSON da resposta (tolerando cercas markdown e prosa)
+        e contabiliza, por agente, respostas limpas, recuperadas e perdidas.
+        """
+        data, recovered = extract_json(text)
+        bucket = self.json_stats.setdefault(name, {"parsed": 0, "recovered": 0, "failed": 0})
+        if data is None:
+            bucket["failed"] += 1
+        elif recovered:
+            bucket["recovered"] += 1
+        else:
+            bucket["parsed"] += 1
+        return data
+
+    async def stream_chat_completion(self, messages: List[Dict[str, str]], system_prompt: str = "",
+                                     temperature: float = 0.7,
+                                     priority: str = PRIORITY_INTERACTIVE) -> AsyncIterator[str]:
+        """
+        Gera a resposta em pedaços (tokens) à medida que o modelo produz.
+        Diferente de chat_completion, erros são propagados para quem consome o
+        stream decidir o fallback (parte da resposta já pode ter sido enviada).
+        """
+        if self.mock_mode:
+            for chunk in re.findall(r"\S+\s*", self._mock_response(messages, system_prompt)):
+                yield chunk
+            return
+
+        client = self._get_client()
+        api_messages = [{"role": "system", "content": system_prompt}] + messages
+        
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError("Circuito aberto")
+        
+        # A vaga no scheduler fica ocupada enquanto o stream estiver aberto
+        async with self.scheduler.slot(priority, self._estimate_tokens(messages, system_prompt)) as ticket:
+            self.stats["upstream_calls"] += 1
+            started = time.monotonic()
+            first_token_at = None
+            parts = []
+            usage = None
+            try:
+                stream = await client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=api_messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            except (asyncio.CancelledError, GeneratorExit):
+                if self.breaker is not None:
+                    self.breaker.record_skipped()
+                raise
+            except Exception:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                raise
+            # Para o breaker, o que importa num stream é o tempo até o 1º token
+            if self.breaker is not None:
+                self.breaker.record_success((first_token_at or time.monotonic()) - started)
+            ticket.actual_tokens = self._record_usage(priority, messages, system_prompt, "".join(parts), usage)
+
+    def get_stats(self) -> Dict:
+        """Métricas do serviço de LLM (exposto em /api/metrics)."""
+        return {
+            "model": LLM_MODEL,
+            "mock_mode": self.mock_mode,
+            **self.stats,
+            "inflight": len(self._inflight),
+            "scheduler": self.scheduler.get_stats(),
+            "usage": {
+                priority: {
+                    **data,
+                    "avg_prompt_tokens": data["prompt_tokens"] / data["calls"] if data["calls"] else 0.0
+                }
+                for priority, data in self.usage.items()
+            },
+            "json": self.json_stats,
+            "circuit_breaker": self.breaker.get_stats() if self.breaker is not None else None,
+            "hedging": {
+                "enabled": self.hedging_enabled,
+                "priorities": LLM_HEDGE_PRIORITIES,
+                "current_delay": self._hedge_delay(),
+                "latency_p50": self.latency.percentile(50),
+                "latency_p95": self.latency.percentile(95)
+            },
+            "cache": self.cache.get_stats() if self.cache is not None else None
+        }
 
     def _mock_response(self, messages: List[Dict[str, str]], system_prompt: str) -> str:
         last_msg = messages[-1]["content"].lower()
@@ -68,3 +485,7 @@ class LLMService:
             """
             
         return "Resposta simulada da IA."
+
+
+# Instância global compartilhada por todos os agentes (um único pool de conexões)
+llm_service = LLMService()
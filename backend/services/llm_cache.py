@@ -0,0 +1,174 @@
+"""
+Cache de respostas do LLM.
+
+Duas camadas:
+- Memória: LRU limitado por número de entradas, com TTL.
+- Disco (opcional): SQLite, sobrevive a reinicializações do servidor.
+
+A chave é um hash de (modelo, system_prompt, mensagens, temperatura, formato de resposta).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def make_cache_key(model: str, system_prompt: str, messages: List[Dict[str, str]], temperature: float,
+                   response_format: Optional[Dict] = None) -> str:
+    """Hash estável da requisição ao LLM."""
+    payload = json.dumps(
+        [model, system_prompt, messages, temperature, response_format],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache LRU em memória com camada opcional em disco.
+    As operações de disco rodam em thread para não bloquear o event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400,
+                 disk_path: Optional[str] = None, disk_max_entries: int = 20000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0
+        }
+        if self.disk_path:
+            self._init_disk()
+
+    # =================== MEMÓRIA ===================
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._memory[key]
+            self.stats["expired"] += 1
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # =================== DISCO ===================
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path, timeout=5)
+
+    def _init_disk(self):
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            now = time.time()
+            if expires_at < now:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value, expires_at
+
+    def _disk_set(self, key: str, value: str, expires_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time())
+            )
+            # Eviction por tamanho: remove as entradas menos acessadas
+            (count,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            if count > self.disk_max_entries:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.disk_max_entries,)
+                )
+
+    # =================== API ===================
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            self.stats["memory_hits"] += 1
+            return value
+
+        if self.disk_path:
+            try:
+                entry = await asyncio.to_thread(self._disk_get, key)
+            except sqlite3.Error as e:
+                print(f"[LLMCache] Erro lendo cache em disco: {e}")
+                entry = None
+            if entry is not None:
+                value, expires_at = entry
+                self._memory_set(key, value, expires_at)  # Promove para a memória
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_set(key, value, expires_at)
+        if self.disk_path:
+            try:
+                await asyncio.to_thread(self._disk_set, key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"[LLMCache] Erro gravando cache em disco: {e}")
+
+    def clear(self):
+        self._memory.clear()
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM llm_cache")
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_enabled": bool(self.disk_path)
+        }
@@ -0,0 +1,225 @@
+"""
+Scheduler de admissão para chamadas ao LLM.
+
+Fica na frente do provedor e decide QUANDO cada chamada pode sair:
+- Classes de prioridade: interactive > analysis > batch
+- Limite de concorrência (chamadas simultâneas ao provedor)
+- Orçamentos por minuto: requisições (RPM) e tokens (TPM)
+- Sob saturação, trabalho de fundo espera mais ou é descartado
+  (LLMRequestDropped); respostas ao usuário nunca são descartadas.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_ANALYSIS = "analysis"
+PRIORITY_BATCH = "batch"
+
+PRIORITIES = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_ANALYSIS: 1,
+    PRIORITY_BATCH: 2
+}
+
+WINDOW_SECONDS = 60.0
+
+
+class LLMRequestDropped(Exception):
+    """A chamada foi descartada pelo scheduler (fila cheia ou espera excessiva)."""
+
+
+class _Ticket:
+    __slots__ = ("priority", "window_entry", "actual_tokens")
+
+    def __init__(self, priority: str, window_entry: list):
+        self.priority = priority
+        self.window_entry = window_entry  # [timestamp, tokens] dentro da janela de 60s
+        self.actual_tokens: Optional[int] = None  # Preenchido por quem usa a vaga, se souber
+
+
+class AdmissionScheduler:
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 max_wait: Optional[Dict[str, Optional[float]]] = None, max_queue_depth: int = 100):
+        """
+        Args:
+            max_concurrency: chamadas simultâneas ao provedor
+            requests_per_minute: orçamento de RPM (0 = sem limite)
+            tokens_per_minute: orçamento de TPM (0 = sem limite)
+            max_wait: espera máxima na fila por classe (None = espera indefinidamente)
+            max_queue_depth: tamanho máximo da fila para classes não interativas
+        """
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait or {PRIORITY_INTERACTIVE: None, PRIORITY_ANALYSIS: 15.0, PRIORITY_BATCH: 120.0}
+        self.max_queue_depth = max_queue_depth
+
+        self._queue = []  # heap de [prioridade, seq, future, classe, tokens, enfileirado_em]
+        self._seq = itertools.count()
+        self._active = 0
+        self._window = deque()  # [timestamp, tokens] das chamadas admitidas no último minuto
+        self._window_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.stats = {
+            name: {"admitted": 0, "dropped": 0, "queued": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in PRIORITIES
+        }
+
+    # =================== API ===================
+
+    @asynccontextmanager
+    async def slot(self, priority: str = PRIORITY_ANALYSIS, estimated_tokens: int = 0):
+        """Reserva uma vaga para uma chamada ao provedor durante o bloco `async with`."""
+        ticket = await self.acquire(priority, estimated_tokens)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, ticket.actual_tokens)
+
+    async def acquire(self, priority: str = PRIORITY_ANALYSIS, estimated_tokens: int = 0) -> _Ticket:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridade desconhecida: {priority}")
+
+        self._prune_window()
+        if not self._queue and self._can_admit(estimated_tokens):
+            return self._admit(priority, estimated_tokens, 0.0)
+
+        if priority != PRIORITY_INTERACTIVE and self._queue_depth(priority) >= self.max_queue_depth:
+            self.stats[priority]["dropped"] += 1
+            raise LLMRequestDropped(f"Fila '{priority}' cheia ({self.max_queue_depth})")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = [PRIORITIES[priority], next(self._seq), future, priority, estimated_tokens, time.monotonic()]
+        heapq.heappush(self._queue, entry)
+        self.stats[priority]["queued"] += 1
+
+        timeout = self.max_wait.get(priority)
+        timeout_handle = None
+        if timeout is not None:
+            timeout_handle = loop.call_later(timeout, self._expire, future, priority, timeout)
+
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Se a vaga foi concedida no mesmo instante do cancelamento, devolve
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(future.result())
+            raise
+        finally:
+            if timeout_handle is not None:
+                timeout_handle.cancel()
+
+    def release(self, ticket: _Ticket, actual_tokens: Optional[int] = None):
+        """Libera a vaga; opcionalmente corrige a estimativa de tokens com o uso real."""
+        self._active -= 1
+        if actual_tokens is not None:
+            self._window_tokens += actual_tokens - ticket.window_entry[1]
+            ticket.window_entry[1] = actual_tokens
+        self._dispatch()
+
+    def get_stats(self) -> Dict:
+        self._prune_window()
+        classes = {}
+        for name, data in self.stats.items():
+            classes[name] = {
+                "admitted": data["admitted"],
+                "dropped": data["dropped"],
+                "queued": data["queued"],
+                "queue_depth": self._queue_depth(name),
+                "avg_wait": data["total_wait"] / data["admitted"] if data["admitted"] else 0.0,
+                "max_wait": data["max_wait"]
+            }
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": sum(1 for entry in self._queue if not self._is_stale(entry)),
+            "requests_last_minute": len(self._window),
+            "tokens_last_minute": self._window_tokens,
+            "requests_per_minute_limit": self.requests_per_minute,
+            "tokens_per_minute_limit": self.tokens_per_minute,
+            "classes": classes
+        }
+
+    # =================== INTERNO ===================
+
+    def _queue_depth(self, priority: str) -> int:
+        return sum(1 for entry in self._queue if entry[3] == priority and not self._is_stale(entry))
+
+    @staticmethod
+    def _is_stale(entry: list) -> bool:
+        """Entrada expirada, cancelada ou de um event loop já encerrado."""
+        future = entry[2]
+        return future.done() or future.get_loop().is_closed()
+
+    def _prune_window(self):
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        while self._window and self._window[0][0] < cutoff:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _can_admit(self, tokens: int) -> bool:
+        if self._active >= self.max_concurrency:
+            return False
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            return False
+        # Uma chamada maior que o orçamento inteiro ainda passa quando a janela está vazia
+        if self.tokens_per_minute and self._window and self._window_tokens + tokens > self.tokens_per_minute:
+            return False
+        return True
+
+    def _admit(self, priority: str, tokens: int, waited: float) -> _Ticket:
+        self._active += 1
+        window_entry = [time.monotonic(), tokens]
+        self._window.append(window_entry)
+        self._window_tokens += tokens
+
+        stats = self.stats[priority]
+        stats["admitted"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+        return _Ticket(priority, window_entry)
+
+    def _dispatch(self):
+        """Admite os próximos da fila, sempre na ordem de prioridade."""
+        self._prune_window()
+        while self._queue:
+            entry = self._queue[0]
+            future = entry[2]
+            if self._is_stale(entry):
+                heapq.heappop(self._queue)
+                continue
+            if not self._can_admit(entry[4]):
+                break
+            heapq.heappop(self._queue)
+            future.set_result(self._admit(entry[3], entry[4], time.monotonic() - entry[5]))
+
+        # Bloqueado por orçamento (não por concorrência): tenta de novo quando a janela andar
+        if self._queue and self._active < self.max_concurrency and self._window:
+            self._schedule_retry(self._window[0][0] + WINDOW_SECONDS - time.monotonic())
+
+    def _schedule_retry(self, delay: float):
+        loop = self._queue[0][2].get_loop()
+        if self._timer is not None and self._timer_loop is loop:
+            return
+
+        def fire():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = loop.call_later(max(delay, 0.01), fire)
+        self._timer_loop = loop
+
+    def _expire(self, future: asyncio.Future, priority: str, timeout: float):
+        if not future.done():
+            self.stats[priority]["dropped"] += 1
+            future.set_exception(LLMRequestDropped(f"Espera na fila '{priority}' excedeu {timeout:.0f}s"))
@@ -0,0 +1,168 @@
+"""
+Pré-score local de viabilidade, para pular o LLM nos casos óbvios.
+
+Modelo linear sobre features com hashing (radicais do relato, bigramas,
+sinais do classificador e nº de evidências), treinado com os scores que o
+LLM já deu (LearningService.record_scored_report):
+- regressão logística: P(viável), com viável = score >= 60;
+- regressão linear: o score em si.
+
+Se P(viável) sai acima de `confidence` (ou abaixo de 1 - confidence), o
+LegalAgent responde localmente; os casos no meio vão para o LLM. O NumPy é
+opcional: sem ele (ou sem amostras suficientes) tudo vai para o LLM.
+"""
+
+import asyncio
+import os
+import zlib
+from itertools import chain
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from services.classifier import claim_classifier
+from services.legal_index import tokenize
+
+LOCAL_SCORER_ENABLED = os.getenv("LOCAL_SCORER_ENABLED", "true").lower() == "true"
+LOCAL_SCORER_CONFIDENCE = float(os.getenv("LOCAL_SCORER_CONFIDENCE", "0.9"))
+LOCAL_SCORER_MIN_SAMPLES = int(os.getenv("LOCAL_SCORER_MIN_SAMPLES", "50"))
+LOCAL_SCORER_RETRAIN_EVERY = int(os.getenv("LOCAL_SCORER_RETRAIN_EVERY", "100"))
+LOCAL_SCORER_FEATURES = 1 << 14
+VIABLE_SCORE = 60
+
+
+def _features(report: str, evidences_count: int, n_features: int) -> List[int]:
+    """Índices das features com hashing (crc32: estável entre processos)."""
+    tokens = tokenize(report)
+    names = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    names += [f"sig:{signal}" for signal in claim_classifier.match(report)]
+    names.append(f"ev:{min(evidences_count, 3)}")
+    names.append("bias")
+    return [zlib.crc32(name.encode("utf-8")) % n_features for name in names]
+
+
+class Prediction(NamedTuple):
+    probability: float  # P(viável)
+    score: int
+
+
+class LocalScorer:
+    def __init__(self, confidence: float = LOCAL_SCORER_CONFIDENCE, min_samples: int = LOCAL_SCORER_MIN_SAMPLES,
+                 retrain_every: int = LOCAL_SCORER_RETRAIN_EVERY, n_features: int = LOCAL_SCORER_FEATURES,
+                 enabled: bool = LOCAL_SCORER_ENABLED):
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.retrain_every = retrain_every
+        self.n_features = n_features
+        self.enabled = enabled and np is not None
+        self._model = None  # (pesos logísticos, pesos do score, score médio), trocados de uma vez só
+        self._new_samples = 0
+        self._training = False
+        self.stats = {
+            "trained_on": 0,
+            "trainings": 0,
+            "answered_locally": 0,
+            "sent_to_llm": 0
+        }
+
+    # =================== TREINO ===================
+
+    def fit(self, records: List[Dict], iterations: int = 300, l2: float = 1e-4) -> bool:
+        """Treina com [{"report", "evidences", "viability_score"}]. False se não deu para treinar."""
+        if np is None or len(records) < self.min_samples:
+            return False
+        scores = np.array([r["viability_score"] for r in records], dtype=np.float64)
+        labels = (scores >= VIABLE_SCORE).astype(np.float64)
+        if labels.min() == labels.max():
+            return False  # Só uma classe: não há fronteira para aprender
+
+        rows = [_features(r["report"], r.get("evidences", 0), self.n_features) for r in records]
+        lengths = np.array([len(row) for row in rows])
+        indices = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=int(lengths.sum()))
+        row_ids = np.repeat(np.arange(len(rows)), lengths)
+        values = np.repeat(1.0 / np.sqrt(lengths), lengths)  # linhas com norma ~1
+        n = len(rows)
+
+        def matvec(w):
+            return np.bincount(row_ids, weights=w[indices] * values, minlength=n)
+
+        def rmatvec(r):
+            return np.bincount(indices, weights=values * r[row_ids], minlength=self.n_features)
+
+        # Gradiente em lote completo; com linhas normalizadas os passos abaixo são estáveis
+        w_prob = np.zeros(self.n_features)
+        w_score = np.zeros(self.n_features)
+        mean_score = float(scores.mean())
+        targets = (scores - mean_score) / 100  # o score é previsto como desvio da média
+        for _ in range(iterations):
+            probabilities = 1 / (1 + np.exp(-matvec(w_prob)))
+            w_prob -= 2.0 * (rmatvec(probabilities - labels) / n + l2 * w_prob)
+            w_score -= 1.0 * (rmatvec(matvec(w_score) - targets) / n + l2 * w_score)
+
+        self._model = (w_prob, w_score, mean_score)
+        self.stats["trained_on"] = n
+        self.stats["trainings"] += 1
+        return True
+
+    def record_sample(self) -> bool:
+        """Conta um rótulo novo; True quando é hora de retreinar."""
+        self._new_samples += 1
+        return self.enabled and self._new_samples >= self.retrain_every and not self._training
+
+    async def retrain(self, load_records: Callable[[], List[Dict]]):
+        """Retreina numa thread, sem bloquear o event loop."""
+        if not self.enabled or self._training:
+            return
+        self._training = True
+        self._new_samples = 0
+        try:
+            await asyncio.to_thread(lambda: self.fit(load_records()))
+        except Exception as e:
+            print(f"[LocalScorer] Falha ao treinar: {e}")
+        finally:
+            self._training = False
+
+    # =================== PREDIÇÃO ===================
+
+    def predict(self, report: str, evidences_count: int) -> Optional[Prediction]:
+        if not self.enabled or self._model is None:
+            return None
+        w_prob, w_score, mean_score = self._model
+        indices = _features(report, evidences_count, self.n_features)
+        scale = 1.0 / len(indices) ** 0.5
+        probability = float(1 / (1 + np.exp(-w_prob[indices].sum() * scale)))
+        score = int(round(mean_score + 100 * float(w_score[indices].sum() * scale)))
+        return Prediction(probability, max(0, min(100, score)))
+
+    def decide(self, report: str, evidences_count: int) -> Optional[Prediction]:
+        """Predição só se for confiante; None manda o caso para o LLM."""
+        prediction = self.predict(report, evidences_count)
+        if prediction is None:
+            self.stats["sent_to_llm"] += 1
+            return None
+        if prediction.probability >= self.confidence:
+            score = max(prediction.score, VIABLE_SCORE)
+        elif prediction.probability <= 1 - self.confidence:
+            score = min(prediction.score, VIABLE_SCORE - 1)
+        else:
+            self.stats["sent_to_llm"] += 1
+            return None
+        self.stats["answered_locally"] += 1
+        return Prediction(prediction.probability, score)
+
+    def get_stats(self) -> Dict:
+        decided = self.stats["answered_locally"] + self.stats["sent_to_llm"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "ready": self._model is not None,
+            "confidence_threshold": self.confidence,
+            "llm_call_rate": self.stats["sent_to_llm"] / decided if decided else None
+        }
+
+
+# Instância global usada pelo LegalAgent
+local_scorer = LocalScorer()
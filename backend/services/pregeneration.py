@@ -0,0 +1,148 @@
+"""
+Pré-geração especulativa de reclamações.
+
+Quando /api/claim/analyze devolve um score alto, é provável que o usuário
+clique em "Gerar Reclamação" logo depois. A geração começa em segundo plano
+sob a impressão digital do relato; o /api/claim/generate seguinte pega o
+rascunho pronto ou se junta à tarefa em andamento.
+
+Especulação não pode competir sem limite com o trabalho real: no máximo
+`max_inflight` gerações rodam ao mesmo tempo, e uma nova especulação cancela
+a mais antiga ainda em andamento (que ninguém esperou até agora). Rascunho
+que caiu no fallback do LLM não é guardado nem servido: quem pedir a
+reclamação gera do jeito normal.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from services.analysis_store import report_fingerprint
+
+PREGENERATE_ENABLED = os.getenv("PREGENERATE_ENABLED", "true").lower() == "true"
+PREGENERATE_MIN_SCORE = int(os.getenv("PREGENERATE_MIN_SCORE", "70"))
+PREGENERATE_MAX_INFLIGHT = int(os.getenv("PREGENERATE_MAX_INFLIGHT", "4"))
+
+
+def _is_fallback(result) -> bool:
+    """Reclamação montada sem resposta real do LLM (ver GeneratorAgent._generate_with_llm)."""
+    return isinstance(result, dict) and bool(result.get("fallback"))
+
+
+class ClaimPregenerator:
+    def __init__(self, min_score: int = PREGENERATE_MIN_SCORE, max_inflight: int = PREGENERATE_MAX_INFLIGHT,
+                 max_entries: int = 256, ttl_seconds: float = 1800, enabled: bool = PREGENERATE_ENABLED):
+        self.min_score = min_score
+        self.max_inflight = max_inflight
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()  # fingerprint -> {"task", "created_at", "claimed"}
+        self.stats = {
+            "started": 0,
+            "cancelled": 0,
+            "hits_completed": 0,
+            "hits_inflight": 0,
+            "misses": 0,
+            "failed": 0,
+            "fallbacks": 0
+        }
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        task = entry["task"]
+        expired = time.monotonic() - entry["created_at"] > self.ttl_seconds
+        if expired or (task.done() and (task.cancelled() or task.exception() is not None
+                                        or _is_fallback(task.result()))):
+            del self._entries[key]
+            return None
+        if not task.done() and task.get_loop() is not asyncio.get_running_loop():
+            # Tarefa presa num event loop que não é o atual
+            del self._entries[key]
+            return None
+        return entry
+
+    def _inflight(self) -> list:
+        return [key for key, entry in self._entries.items() if not entry["task"].done()]
+
+    def maybe_start(self, report: str, viability_score: int, run: Callable[[], Awaitable[dict]]) -> bool:
+        """Começa a gerar em segundo plano se o score passa do limiar. True se iniciou."""
+        if not self.enabled or viability_score < self.min_score or self.max_inflight < 1:
+            return False
+        key = report_fingerprint(report)
+        if self._lookup(key) is not None:
+            return False
+
+        inflight = self._inflight()
+        while len(inflight) >= self.max_inflight:
+            # Fila cheia: desiste da especulação mais antiga que ninguém está esperando
+            victim = next((k for k in inflight if not self._entries[k]["claimed"]), None)
+            if victim is None:
+                return False
+            self._entries.pop(victim)["task"].cancel()
+            self.stats["cancelled"] += 1
+            inflight.remove(victim)
+
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(self._on_done)
+        self._entries[key] = {"task": task, "created_at": time.monotonic(), "claimed": False}
+        self.stats["started"] += 1
+        while len(self._entries) > self.max_entries:
+            _, oldest = self._entries.popitem(last=False)
+            if not oldest["task"].done():
+                oldest["task"].cancel()
+                self.stats["cancelled"] += 1
+        return True
+
+    def _on_done(self, task: asyncio.Future):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.stats["failed"] += 1
+        elif _is_fallback(task.result()):
+            self.stats["fallbacks"] += 1
+
+    async def take(self, report: str) -> Optional[dict]:
+        """Rascunho pré-gerado para o relato (aguarda se ainda em andamento), ou None."""
+        key = report_fingerprint(report)
+        entry = self._lookup(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        task = entry["task"]
+        if task.done():
+            self.stats["hits_completed"] += 1
+            return task.result()
+        self.stats["hits_inflight"] += 1
+        entry["claimed"] = True  # Alguém está esperando: não pode mais ser cancelada
+        try:
+            result = await asyncio.shield(task)
+            if _is_fallback(result):
+                # Fallback do LLM: sai do registro e quem chamou tenta a geração de verdade
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                return None
+            return result
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None  # Despejada da fila: quem chamou gera do jeito normal
+            raise
+        except Exception:
+            return None  # Geração especulativa falhou: idem
+
+    def cancel_all(self):
+        for entry in self._entries.values():
+            entry["task"].cancel()
+        self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "entries": len(self._entries), "inflight": len(self._inflight()),
+                "min_score": self.min_score}
+
+
+# Instância global usada por /api/claim
+claim_pregenerator = ClaimPregenerator()
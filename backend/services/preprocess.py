@@ -0,0 +1,282 @@
+"""
+Pré-processamento local das evidências, antes da análise forense.
+
+Mandar a imagem ou o PDF inteiro para o LLM sai caro; o que importa para a
+perícia cabe em poucas linhas: o texto do PDF, a data e o GPS do EXIF da
+foto e as dimensões da imagem. Esse trabalho é de CPU, então roda num
+ProcessPoolExecutor (o event loop só espera o resultado) e fica guardado por
+hash no índice de evidências. Um arquivo que estoura o PREPROCESS_TIMEOUT
+derruba o pool inteiro (o worker travado não pode continuar ocupando a vaga);
+os outros arquivos que estavam naquele pool rodam de novo num pool novo.
+
+Dependências opcionais, como o NumPy no LocalScorer:
+- pypdf: extração de texto de PDF. Sem ele, um extrator simples lê os
+  operadores de texto dos streams (zlib) do arquivo.
+- Pillow: dimensões da imagem (já com a rotação do EXIF). Sem ele, imagens
+  saem só com o EXIF (lido direto do JPEG, sem biblioteca).
+"""
+
+import asyncio
+import os
+import re
+import struct
+import weakref
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "true").lower() == "true"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(2, os.cpu_count() or 1))))
+PREPROCESS_TIMEOUT = float(os.getenv("PREPROCESS_TIMEOUT", "30"))
+MAX_TEXT_CHARS = 2000  # Texto do PDF que vai para o prompt
+EXIF_SCAN_BYTES = 128 * 1024  # O APP1 do EXIF fica no começo do JPEG
+
+
+# =================== PDF ===================
+
+_PDF_STREAM = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.DOTALL)
+_PDF_TEXT_OP = re.compile(rb"\((?:\\.|[^\\)])*\)\s*Tj|\[(?:\\.|[^\]])*\]\s*TJ")
+_PDF_STRING = re.compile(rb"\(((?:\\.|[^\\)])*)\)")
+_PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"(": b"(", b")": b")", b"\\": b"\\"}
+_PDF_PAGE = re.compile(rb"/Type\s*/Page\b")
+
+
+def _pdf_unescape(raw: bytes) -> str:
+    raw = re.sub(rb"\\([nrt()\\])", lambda m: _PDF_ESCAPES[m.group(1)], raw)
+    raw = re.sub(rb"\\([0-7]{1,3})", lambda m: bytes([int(m.group(1), 8) & 0xFF]), raw)
+    return raw.decode("latin-1")
+
+
+def _pdf_text_fallback(data: bytes) -> tuple:
+    """Texto dos operadores Tj/TJ dos streams (comprimidos ou não) e nº de páginas."""
+    parts = []
+    for stream in _PDF_STREAM.findall(data):
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        for op in _PDF_TEXT_OP.findall(stream):
+            parts.append("".join(_pdf_unescape(s) for s in _PDF_STRING.findall(op)))
+    return " ".join(" ".join(parts).split()), len(_PDF_PAGE.findall(data))
+
+
+def _pdf_features(path: str) -> dict:
+    text = pages = None
+    if PdfReader is not None:
+        try:
+            reader = PdfReader(path)
+            text_parts = []
+            for page in reader.pages:
+                text_parts.append(page.extract_text() or "")
+                if sum(len(t) for t in text_parts) >= MAX_TEXT_CHARS:
+                    break
+            text, pages = " ".join(" ".join(text_parts).split()), len(reader.pages)
+        except Exception:
+            pass  # PDF que o pypdf não abre (estrutura quebrada): tenta o extrator simples
+    if text is None:
+        with open(path, "rb") as f:
+            text, pages = _pdf_text_fallback(f.read())
+    return {"kind": "pdf", "pages": pages, "text": text[:MAX_TEXT_CHARS]}
+
+
+# =================== EXIF ===================
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+
+def _read_ifd(tiff: bytes, offset: int, order: str) -> Dict[int, object]:
+    """Entradas de um IFD do TIFF: tag -> valor (texto, inteiro ou lista de racionais)."""
+    entries = {}
+    (count,) = struct.unpack_from(order + "H", tiff, offset)
+    for i in range(count):
+        tag, kind, n, value = struct.unpack_from(order + "HHI4s", tiff, offset + 2 + 12 * i)
+        size = _TYPE_SIZES.get(kind, 1) * n
+        if size > len(tiff):
+            continue  # Contagem do arquivo maior que o próprio EXIF: entrada corrompida
+        raw = value[:size] if size <= 4 else tiff[struct.unpack(order + "I", value)[0]:][:size]
+        if kind == 2:
+            entries[tag] = raw.split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+        elif kind in (3, 4):
+            fmt = "H" if kind == 3 else "I"
+            entries[tag] = struct.unpack_from(order + fmt, raw)[0]
+        elif kind == 5:
+            pairs = struct.unpack_from(order + "I" * 2 * (len(raw) // 8), raw)
+            entries[tag] = [pairs[j] / pairs[j + 1] if pairs[j + 1] else 0.0 for j in range(0, len(pairs), 2)]
+    return entries
+
+
+def _gps_coordinate(values, ref) -> Optional[float]:
+    if not isinstance(values, list) or len(values) != 3:
+        return None
+    degrees = values[0] + values[1] / 60 + values[2] / 3600
+    return round(-degrees if ref in ("S", "W") else degrees, 6)
+
+
+def jpeg_exif(data: bytes) -> dict:
+    """Data da foto e GPS do EXIF de um JPEG, sem depender de biblioteca."""
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        (length,) = struct.unpack_from(">H", data, position + 2)
+        if marker == 0xE1 and data[position + 4:position + 10] == b"Exif\x00\x00":
+            tiff = data[position + 10:position + 2 + length]
+            break
+        if marker == 0xDA:  # Início da imagem: não há EXIF
+            return {}
+        position += 2 + length
+    else:
+        return {}
+
+    try:
+        order = "<" if tiff[:2] == b"II" else ">"
+        ifd0 = _read_ifd(tiff, struct.unpack_from(order + "I", tiff, 4)[0], order)
+        exif = {}
+        taken_at = ifd0.get(0x0132)
+        if 0x8769 in ifd0:
+            taken_at = _read_ifd(tiff, ifd0[0x8769], order).get(0x9003) or taken_at
+        if taken_at:
+            exif["taken_at"] = taken_at
+        if 0x8825 in ifd0:
+            gps = _read_ifd(tiff, ifd0[0x8825], order)
+            lat, lon = _gps_coordinate(gps.get(2), gps.get(1)), _gps_coordinate(gps.get(4), gps.get(3))
+            if lat is not None and lon is not None:
+                exif["gps"] = {"lat": lat, "lon": lon}
+        return exif
+    except (struct.error, IndexError, TypeError):
+        return {}  # EXIF corrompido não impede o resto
+
+
+# =================== IMAGEM ===================
+
+def _image_features(path: str) -> dict:
+    with open(path, "rb") as f:
+        head = f.read(EXIF_SCAN_BYTES)
+    features = {"kind": "image", "exif": jpeg_exif(head) if head.startswith(b"\xff\xd8") else {}}
+    if Image is None:
+        return features
+    try:
+        with Image.open(path) as image:
+            features["width"], features["height"] = ImageOps.exif_transpose(image).size
+    except (OSError, ValueError):
+        pass  # Imagem que o Pillow não decodifica: fica só o EXIF
+    return features
+
+
+def preprocess_file(path: str, content_type: str) -> dict:
+    """Roda no processo do pool: extrai o que a perícia precisa do arquivo."""
+    if content_type == "application/pdf":
+        return _pdf_features(path)
+    return _image_features(path)
+
+
+def format_preprocessed(features: Optional[dict]) -> str:
+    """Resumo curto para o prompt do ForensicAgent."""
+    if not features or "error" in features:
+        return ""
+    lines = []
+    if features.get("kind") == "pdf":
+        lines.append(f"PDF com {features.get('pages', 0)} página(s).")
+        if features.get("text"):
+            lines.append(f"Texto extraído: {features['text']}")
+        else:
+            lines.append("Sem texto extraível (provavelmente digitalizado).")
+    else:
+        if "width" in features:
+            lines.append(f"Imagem {features['width']}x{features['height']}.")
+        exif = features.get("exif") or {}
+        lines.append(f"Data da foto (EXIF): {exif['taken_at']}." if "taken_at" in exif else "Foto sem data no EXIF.")
+        if "gps" in exif:
+            lines.append(f"GPS (EXIF): {exif['gps']['lat']}, {exif['gps']['lon']}.")
+    return "\n".join(lines)
+
+
+class Preprocessor:
+    def __init__(self, workers: int = PREPROCESS_WORKERS, timeout: float = PREPROCESS_TIMEOUT,
+                 enabled: bool = PREPROCESS_ENABLED):
+        self.workers = workers
+        self.timeout = timeout
+        self.enabled = enabled
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._killed = weakref.WeakSet()  # Pools derrubados de propósito por um timeout
+        self.stats = {"runs": 0, "failures": 0, "timeouts": 0, "retried": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _kill_pool(self, executor: ProcessPoolExecutor):
+        """
+        Mata os workers na hora: cancelar o future não para o processo que já está
+        rodando. O ProcessPoolExecutor não tem API pública para isso, então usamos
+        de propósito o `_processes` dele (estável desde o Python 3.2); se um dia
+        sumir, o pool é só abandonado e o worker preso termina sozinho.
+        """
+        if self._executor is executor:
+            self._executor = None
+        self._killed.add(executor)
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+        # Sem cancel_futures: os arquivos na fila deste pool recebem BrokenProcessPool e tentam de novo
+        executor.shutdown(wait=False)
+
+    async def run(self, record: dict) -> dict:
+        """Features do arquivo da evidência; {"error": ...} se não deu para processar."""
+        if not self.enabled:
+            return {"error": "desativado"}
+        loop = asyncio.get_running_loop()
+        self.stats["runs"] += 1
+        for attempt in range(2):
+            executor = self._pool()
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(executor, preprocess_file, record["path"], record["content_type"]),
+                    self.timeout
+                )
+            except asyncio.TimeoutError:
+                # O worker segue preso no arquivo: sem matar o pool, a vaga fica ocupada para sempre
+                self._kill_pool(executor)
+                self.stats["failures"] += 1
+                self.stats["timeouts"] += 1
+                return {"error": f"pré-processamento passou de {self.timeout:g}s"}
+            except BrokenProcessPool as e:
+                if self._executor is executor:
+                    self._executor = None  # Um worker morreu: o próximo uso cria um pool novo
+                if attempt == 0 and executor in self._killed:
+                    # Pool derrubado pelo timeout de outro arquivo: este não tem culpa, roda de novo
+                    self.stats["retried"] += 1
+                    continue
+                self.stats["failures"] += 1
+                return {"error": f"pool de pré-processamento falhou: {e}"}
+            except Exception as e:
+                self.stats["failures"] += 1
+                return {"error": str(e) or type(e).__name__}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "pypdf": PdfReader is not None,
+            "pillow": Image is not None
+        }
+
+
+# Instância global; o pool de processos sobe no primeiro uso e desce no shutdown
+preprocessor = Preprocessor()
@@ -0,0 +1,115 @@
+"""
+Proteções contra latência de cauda do provedor de LLM.
+
+- CircuitBreaker: abre após falhas (ou chamadas lentas) consecutivas e faz
+  as próximas chamadas irem direto para o fallback, sem esperar o timeout.
+  Depois de um tempo, deixa passar uma chamada de teste (half-open).
+- LatencyTracker: janela das latências recentes, usada para calcular o
+  atraso do hedge (p95).
+"""
+
+import time
+from collections import deque
+from typing import Dict, Optional
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """O circuito está aberto: a chamada nem foi enviada ao provedor."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, slow_call_seconds: float = 20.0,
+                 open_seconds: float = 30.0, half_open_max_calls: int = 1):
+        """
+        Args:
+            failure_threshold: falhas/lentidões consecutivas para abrir
+            slow_call_seconds: chamada bem-sucedida acima disso conta como falha
+            open_seconds: tempo aberto antes de testar de novo
+            half_open_max_calls: chamadas de teste simultâneas no estado half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.stats = {
+            "failures": 0,
+            "slow_calls": 0,
+            "short_circuited": 0,
+            "times_opened": 0
+        }
+
+    def allow(self) -> bool:
+        """Decide se a chamada pode ir ao provedor."""
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.stats["short_circuited"] += 1
+                return False
+            self.state = STATE_HALF_OPEN
+            self._half_open_calls = 0
+
+        if self.state == STATE_HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                self.stats["short_circuited"] += 1
+                return False
+            self._half_open_calls += 1
+        return True
+
+    def record_success(self, duration: float):
+        if duration >= self.slow_call_seconds:
+            self.stats["slow_calls"] += 1
+            self._on_failure()
+            return
+        self._consecutive_failures = 0
+        if self.state == STATE_HALF_OPEN:
+            self.state = STATE_CLOSED
+
+    def record_skipped(self):
+        """A chamada liberada não chegou ao provedor (descartada ou cancelada)."""
+        if self.state == STATE_HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self._on_failure()
+
+    def _on_failure(self):
+        self._consecutive_failures += 1
+        if self.state == STATE_HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                self.stats["times_opened"] += 1
+            self.state = STATE_OPEN
+            self._opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            **self.stats
+        }
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, duration: float):
+        self._samples.append(duration)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(pct / 100 * len(ordered)))
+        return ordered[index]
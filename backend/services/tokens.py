@@ -0,0 +1,62 @@
+"""
+Contagem de tokens e orçamento de contexto.
+
+Usa o tiktoken quando instalado; sem ele, cai numa estimativa de
+~4 caracteres por token (suficiente para orçamento, não para cobrança).
+O vocabulário do tiktoken pode precisar de download, então só é carregado
+na primeira contagem (nunca no import) e uma falha vira a estimativa. O
+startup da aplicação faz essa primeira contagem numa thread, para o
+download não travar o event loop.
+"""
+
+from typing import Dict, List, Tuple
+
+_UNLOADED = object()
+_encoding = _UNLOADED
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is _UNLOADED:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:  # ImportError ou falha ao baixar o vocabulário
+            _encoding = None
+    return _encoding
+
+# Overhead aproximado por mensagem no formato chat (role, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def fit_messages(messages: List[Dict[str, str]], budget: int) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Preenche o orçamento da mensagem mais nova para a mais antiga.
+    A última mensagem entra sempre, mesmo que sozinha estoure o orçamento.
+
+    Returns:
+        (mensagens selecionadas em ordem cronológica, tokens usados)
+    """
+    selected = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_message_tokens(message)
+        if selected and used + tokens > budget:
+            break
+        selected.append(message)
+        used += tokens
+    selected.reverse()
+    return selected, used
@@ -0,0 +1,234 @@
+"""
+Recebimento de uploads em streaming.
+
+O corpo multipart é lido em pedaços direto de request.stream() e passado ao
+parser do python-multipart, sem o spool em arquivo temporário do Starlette.
+Para cada arquivo, enquanto os bytes chegam:
+- o tipo declarado é conferido no cabeçalho da parte, e o tipo real pelos
+  primeiros bytes (assinatura do JPG/PNG/PDF);
+- o tamanho é conferido a cada pedaço, e o upload é recusado no primeiro
+  pedaço que passa do limite (ou já pelo Content-Length);
+- o SHA-256 é calculado;
+- a gravação em disco roda numa thread, sem travar o event loop.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from typing import List, Optional
+
+from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+
+ALLOWED_TYPES = ["image/jpeg", "image/png", "application/pdf"]
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "application/pdf": "pdf"}
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"%PDF-", "application/pdf"),
+)
+SNIFF_BYTES = 8
+MULTIPART_OVERHEAD = 64 * 1024  # Cabeçalhos das partes e campos de texto
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """Tipo real do arquivo pelos primeiros bytes, ou None se não for JPG/PNG/PDF."""
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class UploadError(Exception):
+    """Upload recusado; `status_code` e `detail` vão direto para a HTTPException."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ReceivedFile:
+    """Um arquivo do multipart, gravado em `path` (temporário) ou recusado em `error`."""
+
+    def __init__(self, original_name: str, declared_type: str):
+        self.original_name = original_name
+        self.declared_type = declared_type
+        self.content_type: Optional[str] = None  # Tipo detectado pelos bytes
+        self.size = 0
+        self.path: Optional[str] = None
+        self.error: Optional[UploadError] = None
+        self._sha256 = hashlib.sha256()
+        self._pending = b""  # Primeiros bytes, até dar para identificar o tipo
+        self._file = None
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+
+class _Part:
+    def __init__(self):
+        self.headers = {}
+        self.field = b""
+        self.value = b""
+
+
+async def receive_upload(request, upload_dir: str, max_file_bytes: int, max_files: int = 1,
+                         stop_on_error: bool = True) -> List[ReceivedFile]:
+    """
+    Lê os arquivos do multipart da requisição para `upload_dir`.
+
+    Com `stop_on_error`, o primeiro arquivo recusado interrompe a leitura
+    (UploadError); sem ele, o arquivo recusado vem com `error` preenchido e os
+    demais seguem. Problemas na requisição como um todo sempre levantam UploadError.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise UploadError(400, "Envie os arquivos como multipart/form-data.")
+    max_request_bytes = max_files * max_file_bytes + MULTIPART_OVERHEAD
+    limit_mb = max_file_bytes // (1024 * 1024)
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_request_bytes:
+        raise UploadError(413, f"Arquivo muito grande. Máximo {limit_mb}MB.")
+
+    events = []  # Os callbacks do parser são síncronos: enfileiram, e o loop abaixo trata
+    completed = []  # Preenchido quando o parser vê o boundary final
+    part = _Part()
+
+    def on_header_field(data, start, end):
+        part.field += data[start:end]
+
+    def on_header_value(data, start, end):
+        part.value += data[start:end]
+
+    def on_header_end():
+        part.headers[part.field.lower()] = part.value
+        part.field = part.value = b""
+
+    def on_headers_finished():
+        events.append(("begin", dict(part.headers)))
+        part.headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    def on_end():
+        completed.append(True)
+
+    parser = MultipartParser(options[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+
+    files: List[ReceivedFile] = []
+    current: Optional[ReceivedFile] = None  # None também para campos que não são arquivo
+    received = 0
+
+    def reject(upload: ReceivedFile, status_code: int, detail: str):
+        upload.error = UploadError(status_code, detail)
+        if stop_on_error:
+            raise upload.error
+
+    async def discard(upload: ReceivedFile):
+        if upload._file is not None:
+            await asyncio.to_thread(upload._file.close)
+            upload._file = None
+        if upload.path is not None:
+            await asyncio.to_thread(_remove, upload.path)
+            upload.path = None
+
+    async def begin(headers: dict):
+        nonlocal current
+        _, disposition = parse_options_header(headers.get(b"content-disposition"))
+        if b"filename" not in disposition:
+            current = None
+            return
+        if len(files) >= max_files:
+            raise UploadError(400, f"Arquivos demais. Máximo {max_files} por envio.")
+        declared = headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+        current = ReceivedFile(disposition[b"filename"].decode("utf-8", "replace"), declared)
+        files.append(current)
+        if declared not in ALLOWED_TYPES:
+            reject(current, 400, "Tipo de arquivo não suportado. Use JPG, PNG ou PDF.")
+
+    async def feed(upload: ReceivedFile, data: bytes):
+        upload.size += len(data)
+        if upload.size > max_file_bytes:
+            await discard(upload)
+            reject(upload, 413, f"Arquivo muito grande. Máximo {limit_mb}MB.")
+            return
+        upload._sha256.update(data)
+        if upload.content_type is None:
+            upload._pending += data
+            if len(upload._pending) < SNIFF_BYTES:
+                return
+            if not await start_file(upload):
+                return
+            data, upload._pending = upload._pending, b""
+        await asyncio.to_thread(upload._file.write, data)
+
+    async def start_file(upload: ReceivedFile) -> bool:
+        upload.content_type = sniff_type(upload._pending)
+        if upload.content_type is None:
+            reject(upload, 400, "Conteúdo do arquivo não corresponde a JPG, PNG ou PDF.")
+            return False
+        upload.path = os.path.join(upload_dir, f".{uuid.uuid4().hex}.part")
+        upload._file = await asyncio.to_thread(open, upload.path, "wb")
+        return True
+
+    async def finish(upload: ReceivedFile):
+        if upload.error is None and upload.content_type is None:
+            if upload.size == 0:
+                reject(upload, 400, "Arquivo vazio.")
+            elif await start_file(upload):
+                # Arquivo menor que SNIFF_BYTES: identificado só agora
+                await asyncio.to_thread(upload._file.write, upload._pending)
+        if upload._file is not None:
+            await asyncio.to_thread(upload._file.close)
+            upload._file = None
+
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadError(413, f"Arquivo muito grande. Máximo {limit_mb}MB.")
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise UploadError(400, "Requisição multipart inválida.")
+            for kind, payload in events:
+                if kind == "begin":
+                    await begin(payload)
+                elif current is None or current.error is not None:
+                    continue  # Campo de texto, ou arquivo já recusado: ignora o resto
+                elif kind == "data":
+                    await feed(current, payload)
+                else:
+                    await finish(current)
+            events.clear()
+        parser.finalize()
+        if not completed:
+            # Corpo cortado antes do boundary final (cliente caiu no meio do envio)
+            raise UploadError(400, "Requisição multipart incompleta.")
+    except BaseException:
+        # Recusa, desconexão ou cancelamento: não deixa arquivos pela metade
+        for upload in files:
+            await discard(upload)
+        raise
+    return files
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
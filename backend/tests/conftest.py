@@ -2,16 +2,46 @@ import pytest
 from fastapi.testclient import TestClient
 import sys
 import os
+import tempfile
 
 # Add backend to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The module-level evidence store opens its index on import: keep it out of data/
+os.environ.setdefault("EVIDENCE_INDEX_PATH", os.path.join(tempfile.mkdtemp(prefix="evidence-"), "evidence.sqlite3"))
 
 from main import app
 
 @pytest.fixture
-def client():
-    """FastAPI TestClient fixture."""
-    return TestClient(app)
+def client(forensic_jobs, evidence_store):
+    """FastAPI TestClient fixture (runs the lifespan, so every request shares one event loop)."""
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture(autouse=True)
+def forensic_jobs(monkeypatch):
+    """A fresh forensic job queue per test, so no job carries over from an earlier test."""
+    import main
+    from routers import metrics, upload
+    from services.forensic_jobs import ForensicJobQueue
+
+    queue = ForensicJobQueue()
+    for module in (main, metrics, upload):
+        monkeypatch.setattr(module, "forensic_jobs", queue)
+    yield queue
+    queue.shutdown()
+
+@pytest.fixture(autouse=True)
+def evidence_store(tmp_path, monkeypatch):
+    """Uploads and the evidence index in tmp_path, never in temp_uploads/ or data/."""
+    from routers import claim, upload
+    from services.evidence_store import EvidenceStore
+
+    upload_dir = str(tmp_path / "uploads")
+    store = EvidenceStore(upload_dir, index_path=str(tmp_path / "evidence.sqlite3"))
+    monkeypatch.setattr(upload, "UPLOAD_DIR", upload_dir)
+    monkeypatch.setattr(upload, "evidence_store", store)
+    monkeypatch.setattr(claim, "evidence_store", store)
+    return store
 
 @pytest.fixture
 def sample_chat_message():
@@ -0,0 +1,548 @@
+import asyncio
+from services.llm import LLMService
+from agents import conversational
+from agents.conversational import ConversationalAgent
+from services.analysis_store import AnalysisStore
+
+
+class SlowLegalAgent:
+    """Legal agent stand-in whose analysis takes `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    async def analyze_case(self, user_report, evidences=[]):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"viability_score": 85, "analysis": "Art. 22", "missing_info": []}
+
+
+class TestConcurrentSilentAnalysis:
+    def test_slow_analysis_does_not_delay_reply_and_is_reused(self, monkeypatch):
+        """A late analysis is skipped for this turn and injected on the next one."""
+        monkeypatch.setattr(conversational, "CHAT_ANALYSIS_MODE", "concurrent")
+        monkeypatch.setattr(conversational, "CHAT_ANALYSIS_DEADLINE_SECONDS", 0.01)
+        agent = ConversationalAgent(LLMService(), SlowLegalAgent(delay=0.1), AnalysisStore())
+        report = "Tenho infiltração no teto do quarto desde março"
+
+        async def run():
+            _, first_prompt, _ = await agent._prepare_turn([{"role": "user", "content": report}])
+            await asyncio.sleep(0.2)
+            history = [
+                {"role": "user", "content": report},
+                {"role": "assistant", "content": "Entendi."},
+                {"role": "user", "content": "ok"}
+            ]
+            _, second_prompt, _ = await agent._prepare_turn(history)
+            return first_prompt, second_prompt
+
+        first_prompt, second_prompt = asyncio.run(run())
+        assert "Score de Viabilidade" not in first_prompt
+        assert "Score de Viabilidade: 85/100" in second_prompt
+        assert agent.stats["analysis_late"] == 1
+        assert agent.stats["late_analysis_reused"] == 1
+
+    def test_fast_analysis_enriches_same_turn(self, monkeypatch):
+        """An analysis finishing before the deadline is used right away."""
+        monkeypatch.setattr(conversational, "CHAT_ANALYSIS_DEADLINE_SECONDS", 1.0)
+        agent = ConversationalAgent(LLMService(), SlowLegalAgent(delay=0), AnalysisStore())
+        messages = [{"role": "user", "content": "Tenho infiltração no teto do quarto desde março"}]
+
+        _, prompt, _ = asyncio.run(agent._prepare_turn(messages))
+        assert "Score de Viabilidade: 85/100" in prompt
+        assert agent.stats["analysis_in_time"] == 1
+
+    def test_fallback_analysis_is_not_kept(self):
+        """An analysis built from the LLM fallback is served once and then recomputed."""
+        store = AnalysisStore()
+        runs = []
+
+        async def run():
+            runs.append(1)
+            return {"viability_score": 85, "fallback": True} if len(runs) == 1 else {"viability_score": 70}
+
+        async def scenario():
+            first = await store.get_or_run("Infiltração no teto", [], run)
+            second = await store.get_or_run("Infiltração no teto", [], run)
+            return first, second, store.peek(store.start("Infiltração no teto", [], run))
+
+        first, second, kept = asyncio.run(scenario())
+        assert first["fallback"] and second == kept == {"viability_score": 70}
+        assert len(runs) == 2
+
+
+class TestConversationSummarizer:
+    def test_long_history_is_folded_into_cached_summary(self, monkeypatch):
+        """Older turns become a summary; the summary is reused until enough new text piles up."""
+        from agents import summarizer
+        from agents.summarizer import ConversationSummarizer
+
+        monkeypatch.setattr(summarizer, "CHAT_SUMMARY_REFRESH_TOKENS", 10_000)
+        service = LLMService()
+        service.mock_mode = True
+        summarizer_agent = ConversationSummarizer(service)
+        history = []
+        for i in range(20):
+            history.append({"role": "user", "content": f"Fato {i}: a caução de R$ {i}00 não foi devolvida. Detalhes " + "x " * 40})
+            history.append({"role": "assistant", "content": "Entendi, pode continuar. " + "y " * 40})
+
+        summary, kept = asyncio.run(summarizer_agent.compact(history, budget=400))
+        assert "Fato 0: a caução" in summary
+        assert len(kept) < len(history)
+        assert summarizer_agent.stats["summary_refreshed"] == 1
+
+        history.append({"role": "user", "content": "E agora?"})
+        summary_again, kept_again = asyncio.run(summarizer_agent.compact(history, budget=400))
+        assert summary_again == summary
+        assert summarizer_agent.stats["summary_reused"] == 1
+        # Nada se perde: mensagens não resumidas ainda seguem verbatim
+        assert kept_again[-1]["content"] == "E agora?"
+
+    def test_short_history_is_untouched(self):
+        """A history that fits the budget is sent as-is, with no summary."""
+        from agents.summarizer import ConversationSummarizer
+
+        messages = [{"role": "user", "content": "Oi"}]
+        assert asyncio.run(ConversationSummarizer(LLMService()).compact(messages, budget=400)) == ("", messages)
+
+    def test_reused_summary_and_pending_messages_fit_the_budget(self, monkeypatch):
+        """Unsummarized messages ride along only while they fit; then they are folded in."""
+        from agents import summarizer
+        from agents.summarizer import ConversationSummarizer
+        from services.tokens import count_message_tokens, count_tokens
+
+        monkeypatch.setattr(summarizer, "CHAT_SUMMARY_REFRESH_TOKENS", 10_000)
+        service = LLMService()
+        service.mock_mode = True
+        summarizer_agent = ConversationSummarizer(service)
+        history = []
+        for i in range(20):
+            history.append({"role": "user", "content": f"Fato {i}: a caução de R$ {i}00 não foi devolvida. " + "x " * 40})
+            history.append({"role": "assistant", "content": "Entendi, pode continuar. " + "y " * 40})
+
+        for i in range(12):
+            history.append({"role": "user", "content": f"Novo fato {i}. " + "z " * 40})
+            summary, kept = asyncio.run(summarizer_agent.compact(history, budget=800))
+            assert count_tokens(summary) + sum(count_message_tokens(m) for m in kept) <= 800
+        assert summarizer_agent.stats["summary_reused"] >= 1
+        assert summarizer_agent.stats["summary_refreshed"] >= 2
+
+    def test_fallback_is_not_used_or_cached_as_summary(self):
+        """When the LLM is down, old turns stay verbatim (as far as they fit) and nothing is cached."""
+        from agents.summarizer import ConversationSummarizer
+        from services.llm import FallbackResponse
+        from services.tokens import count_message_tokens
+
+        class DownLLM(LLMService):
+            async def chat_completion(self, *args, **kwargs):
+                return FallbackResponse("Resposta simulada da IA.")
+
+        service = DownLLM()
+        service.mock_mode = False
+        summarizer_agent = ConversationSummarizer(service)
+        history = [{"role": "user", "content": f"Fato {i}: " + "x " * 40} for i in range(20)]
+
+        summary, kept = asyncio.run(summarizer_agent.compact(history, budget=400))
+        assert summary == ""
+        assert kept == history[-len(kept):] and sum(count_message_tokens(m) for m in kept) <= 400
+        assert not summarizer_agent._summaries
+        assert summarizer_agent.stats["summary_failed"] == 1
+
+
+    def test_session_summary_survives_trimming(self):
+        """Turns leaving the session store are folded into its summary first: few LLM calls, no fact lost."""
+        import re
+        from agents.summarizer import ConversationSummarizer
+        from services.conversation_store import ConversationStore
+
+        class FactLLM(LLMService):
+            calls = 0
+
+            async def chat_completion(self, messages, *args, **kwargs):
+                FactLLM.calls += 1
+                previous, new = messages[-1]["content"].split("NOVAS MENSAGENS:")
+                facts = re.findall(r"Fato \d+", previous) + re.findall(r"Fato \d+", new)
+                return "\n".join(f"- {fact}" for fact in facts)
+
+        service = FactLLM()
+        service.mock_mode = False
+        summarizer_agent = ConversationSummarizer(service)
+        store = ConversationStore(max_messages=10)
+        conversation_id = store.create()
+        for turn in range(40):
+            user = {"role": "user", "content": f"Fato {turn}: a caução não foi devolvida."}
+            summary, kept, folded = asyncio.run(summarizer_agent.compact_session(
+                store.get_summary(conversation_id), store.get(conversation_id) + [user], 3000, store.max_messages
+            ))
+            assert kept[-1] == user
+            store.append(conversation_id, user, {"role": "assistant", "content": "Entendi."},
+                         summary=summary, folded=folded)
+
+        summary, history = store.get_summary(conversation_id), store.get(conversation_id)
+        remembered = set(re.findall(r"Fato \d+", summary + " ".join(m["content"] for m in history)))
+        assert remembered == {f"Fato {i}" for i in range(40)}
+        assert len(history) <= store.max_messages
+        assert FactLLM.calls <= 40 * 2 // (store.max_messages // 2)
+        assert store.get_stats()["dropped_unsummarized"] == 0
+
+
+class TestClaimClassifier:
+    def test_longer_stem_keeps_the_signals_of_its_prefixes(self):
+        """A stem that extends another stem under a different signal reports both signals."""
+        from services.classifier import KeywordClassifier
+
+        classifier = KeywordClassifier({"a": ["multa"], "b": ["multas"], "c": ["mul"]})
+        assert classifier.match("Recebi multas") == {"a", "b", "c"}
+        assert classifier.match("Recebi uma multa") == {"a", "c"}
+        assert classifier.match("mult") == {"c"}
+
+    def test_accents_plurals_and_word_start(self):
+        """Stems match folded text at word starts only."""
+        from services.classifier import claim_classifier
+
+        signals = claim_classifier.match("INFILTRACOES no teto, cauções retidas e a sintaxe do contrato")
+        assert {"infiltracao", "caucao", "contrato"} <= signals
+        assert "taxa" not in signals  # "sintaxe" não é "taxa"
+
+    def test_call_sites_keep_their_priorities(self):
+        """LearningService and LegalAgent share the scan but keep their own ordering."""
+        from agents.legal import LegalAgent
+        from services.learning import LearningService
+
+        learning = LearningService.__new__(LearningService)
+        assert learning._detect_claim_type("Vazou água e cobraram multa") == "manutencao_hidraulica"
+        assert learning._detect_claim_type("Pedi a devolução do depósito") == "caucao"
+        assert learning._detect_claim_type("O vizinho faz barulho") == "outros"
+
+        analysis = LegalAgent(LLMService())._generate_mock_analysis("Tem mofo nas paredes desde quando mudei", [])
+        assert "Art. 22" in analysis["analysis"]
+        assert "Data do início do problema" not in analysis["missing_info"]
+
+
+class TestLegalIndex:
+    def test_search_ranks_relevant_articles(self, tmp_path):
+        """BM25 search over the article corpus finds the article for the report."""
+        from services.legal_index import LegalIndex
+
+        index = LegalIndex(index_path=str(tmp_path / "legal_index.bin"))
+        try:
+            assert index.search("A imobiliária não devolveu a caução em dinheiro")[0]["id"] == "lei8245-art38"
+            assert index.search("Multa rescisória abusiva")[0]["id"] == "lei8245-art4"
+            assert index.search("ok") == []
+            assert index.stats["loaded_from"] == "built"
+        finally:
+            index.close()
+
+        # Segunda carga lê o arquivo já montado via mmap
+        reloaded = LegalIndex(index_path=str(tmp_path / "legal_index.bin"))
+        try:
+            assert reloaded.search("infiltração no teto")[0]["id"] == "lei8245-art22"
+            assert reloaded.stats["loaded_from"] == "mmap"
+        finally:
+            reloaded.close()
+
+    def test_prompts_carry_only_relevant_articles(self):
+        """The chat persona prompt injects retrieved articles instead of a fixed excerpt."""
+        agent = ConversationalAgent(LLMService(), SlowLegalAgent(delay=0), AnalysisStore())
+        _, prompt, _ = asyncio.run(agent._prepare_turn([{"role": "user", "content": "Quero minha caução de volta"}]))
+        assert "Art. 38" in prompt
+        assert "Art. 26" not in prompt
+
+
+class TestLocalScorer:
+    @staticmethod
+    def training_records():
+        records = []
+        for i in range(40):
+            records.append({"report": f"Infiltração e mofo no quarto, mandei notificação {i}", "evidences": 2, "viability_score": 85})
+            records.append({"report": f"O vizinho faz barulho e estou chateado {i}", "evidences": 0, "viability_score": 30})
+        return records
+
+    def test_clear_cases_are_answered_without_the_llm(self):
+        """Confident predictions skip the LLM; the call rate is reported."""
+        from agents.legal import LegalAgent
+        from services.local_scorer import LocalScorer
+
+        class NoLLM(LLMService):
+            async def chat_completion(self, *args, **kwargs):
+                raise AssertionError("LLM chamado para um caso óbvio")
+
+        scorer = LocalScorer(min_samples=10, enabled=True)
+        assert scorer.fit(self.training_records())
+        agent = LegalAgent(NoLLM(), scorer=scorer)
+
+        analysis = asyncio.run(agent.analyze_case("Tem infiltração e mofo na parede", ["a.jpg", "b.jpg"]))
+        assert analysis["viability_score"] >= 60
+        assert scorer.get_stats()["answered_locally"] == 1
+        assert scorer.get_stats()["llm_call_rate"] == 0.0
+
+    def test_borderline_and_untrained_go_to_the_llm(self):
+        """Without a model (or below the confidence threshold) nothing is decided locally."""
+        from services.local_scorer import LocalScorer
+
+        scorer = LocalScorer(min_samples=10, enabled=True)
+        assert scorer.decide("Infiltração no teto", 1) is None
+        assert not scorer.fit(self.training_records()[:4])  # amostras de menos
+
+        scorer.fit(self.training_records())
+        scorer.confidence = 1.0
+        assert scorer.decide("Infiltração no teto", 1) is None
+        assert scorer.get_stats()["sent_to_llm"] == 2
+
+
+class TestClaimTemplates:
+    def test_company_stops_at_sentence_end_and_dates_skip_fractions(self):
+        """Company names never swallow the next sentence; "1/2" is a fraction, not a date."""
+        from services.claim_templates import extract_entities
+
+        assert extract_entities("A imobiliária Lopes. Desde março cobra a taxa")["company"] == "Lopes"
+        assert extract_entities("Imobiliária Silva Ontem me cobrou a multa")["company"] == "Silva"
+        assert extract_entities("A Imobiliária Lopes Ltda. não devolveu")["company"] == "Lopes Ltda."
+        assert extract_entities("a Construtora Casa da Praia S.A. atrasou")["company"] == "Casa da Praia S.A."
+        assert extract_entities("Empresa Lopes & Filhos, de novo")["company"] == "Lopes & Filhos"
+
+        assert extract_entities("Paguei 1/2 do aluguel e 3/4 da multa")["date"] is None
+        assert extract_entities("Paguei 1/2 do aluguel em 5/3/2024")["date"] == "5/3/2024"
+        assert extract_entities("Vence todo dia 05/03")["date"] == "05/03"
+
+    def test_routine_claim_is_rendered_without_the_llm(self):
+        """Known claim types come from the template, with entities pulled from the report."""
+        from agents.generator import GeneratorAgent
+        from services.claim_templates import extract_entities
+
+        class NoLLM(LLMService):
+            async def chat_completion(self, *args, **kwargs):
+                raise AssertionError("LLM chamado para um tipo com modelo")
+
+        report = "Desde 12/03/2024 há infiltração no quarto da Rua das Flores, 120 e a Imobiliária Lopes não resolve."
+        assert extract_entities(report) == {
+            "date": "12/03/2024", "amount": None, "company": "Lopes", "address": "Rua das Flores, 120"
+        }
+
+        agent = GeneratorAgent(NoLLM())
+        claim = asyncio.run(agent.generate_claim({"report": report, "forensic_data": {}, "legal_analysis": {}}))
+        assert claim["source"] == "template"
+        assert claim["claim_type"] == "manutencao_hidraulica"
+        assert "Rua das Flores, 120" in claim["facts"] and "(Lopes)" in claim["facts"]
+        assert "draft_id" not in claim  # mock mode: nada para lapidar
+        assert agent.stats["from_template"] == 1
+
+    def test_polish_runs_in_background_and_unknown_types_use_the_llm(self):
+        from agents.generator import GeneratorAgent
+
+        class PolishingLLM(LLMService):
+            async def chat_completion(self, *args, **kwargs):
+                return ('{"title": "Título revisado", "facts": "Fatos revisados", '
+                        '"request": "Pedido revisado", "value": "R$ 500,00"}')
+
+        llm = PolishingLLM()
+        llm.mock_mode = False
+        agent = GeneratorAgent(llm)
+
+        async def scenario():
+            claim = await agent.generate_claim({"report": "Não devolveram minha caução de R$ 500,00"}, polish=True)
+            assert claim["source"] == "template" and claim["value"] == "R$ 500,00"
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            other = await agent.generate_claim({"report": "O vizinho faz barulho de madrugada"})
+            return claim["draft_id"], other
+
+        draft_id, other = asyncio.run(scenario())
+        draft = agent.get_draft(draft_id)
+        assert draft["status"] == "ready" and draft["claim"]["title"] == "Título revisado"
+        assert draft["claim"]["source"] == "polished" and draft["error"] is None
+        assert other["title"] == "Título revisado" and "source" not in other
+        assert agent.stats["from_llm"] == 1
+        assert agent.get_draft("desconhecido") is None
+
+    def test_polish_is_opt_in_and_failures_are_reported_on_the_draft(self):
+        from agents.generator import GeneratorAgent
+
+        class FailingLLM(LLMService):
+            async def chat_completion(self, *args, **kwargs):
+                raise RuntimeError("provedor fora do ar")
+
+        llm = FailingLLM()
+        llm.mock_mode = False
+        agent = GeneratorAgent(llm)
+        case = {"report": "Não devolveram minha caução de R$ 500,00"}
+
+        async def scenario():
+            plain = await agent.generate_claim(case)
+            claim = await agent.generate_claim(case, polish=True)
+            await asyncio.gather(*(entry["task"] for entry in agent._drafts.values()))
+            return plain, claim["draft_id"]
+
+        plain, draft_id = asyncio.run(scenario())
+        assert "draft_id" not in plain
+        draft = agent.get_draft(draft_id)
+        assert draft["status"] == "failed" and draft["error"] == "provedor fora do ar"
+        assert draft["claim"]["source"] == "template"
+        assert agent.stats["polish_failed"] == 1
+
+
+class TestClaimPregeneration:
+    def test_threshold_attach_and_bounded_queue(self):
+        """Low scores are ignored, waiters attach to running tasks, a full queue cancels the oldest."""
+        from services.pregeneration import ClaimPregenerator
+
+        pregen = ClaimPregenerator(min_score=70, max_inflight=2, enabled=True)
+
+        async def scenario():
+            gate = asyncio.Event()
+
+            async def generate(name):
+                await gate.wait()
+                return {"title": name}
+
+            assert not pregen.maybe_start("relato fraco", 40, lambda: generate("fraco"))
+            assert pregen.maybe_start("relato a", 80, lambda: generate("a"))
+            assert pregen.maybe_start("relato b", 80, lambda: generate("b"))
+            assert not pregen.maybe_start("relato b", 95, lambda: generate("b"))  # já em andamento
+
+            waiter = asyncio.ensure_future(pregen.take("relato b"))
+            await asyncio.sleep(0)
+            # Fila cheia: "a" (ninguém esperando) é cancelada; "b" tem quem espere e fica
+            assert pregen.maybe_start("relato c", 80, lambda: generate("c"))
+            gate.set()
+            assert await waiter == {"title": "b"}
+            assert await pregen.take("relato a") is None
+            assert await pregen.take("relato c") == {"title": "c"}
+
+        asyncio.run(scenario())
+        stats = pregen.get_stats()
+        assert stats["cancelled"] == 1 and stats["started"] == 3
+        assert stats["hits_inflight"] == 1 and stats["hits_completed"] == 1
+
+
+    def test_fallback_claim_is_not_kept_or_served(self):
+        """A generation that got the LLM fallback is marked, and the pregenerator drops it."""
+        from agents.generator import GeneratorAgent
+        from services.llm import FallbackResponse
+        from services.pregeneration import ClaimPregenerator
+
+        class DownLLM(LLMService):
+            async def chat_completion(self, *args, **kwargs):
+                # O mock de fallback para um prompt "Jurídicos" é a análise jurídica simulada
+                return FallbackResponse('{"viability_score": 60, "analysis": "simulada"}')
+
+        service = DownLLM()
+        service.mock_mode = False
+        generator = GeneratorAgent(service)
+        pregen = ClaimPregenerator(min_score=70, max_inflight=2, enabled=True)
+
+        async def scenario():
+            claim = await generator._generate_with_llm({"report": "relato"})
+            assert claim["fallback"] and {"title", "facts", "request", "value"} <= set(claim)
+
+            assert pregen.maybe_start("relato a", 80, lambda: generator._generate_with_llm({"report": "a"}))
+            inflight = await pregen.take("relato a")
+            assert pregen.maybe_start("relato b", 80, lambda: generator._generate_with_llm({"report": "b"}))
+            await asyncio.sleep(0.01)
+            return inflight, await pregen.take("relato b")
+
+        assert asyncio.run(scenario()) == (None, None)
+        assert pregen.get_stats()["fallbacks"] == 2 and pregen.get_stats()["entries"] == 0
+
+
+class TestPreprocess:
+    @staticmethod
+    def jpeg_with_exif():
+        import struct
+
+        def entry(tag, kind, count, value):
+            return struct.pack("<HHI", tag, kind, count) + value
+
+        tiff = b"II*\x00" + struct.pack("<I", 8)
+        tiff += struct.pack("<H", 2) + entry(0x0132, 2, 20, struct.pack("<I", 38))
+        tiff += entry(0x8825, 4, 1, struct.pack("<I", 58)) + struct.pack("<I", 0)
+        tiff += b"2024:03:12 10:30:00\x00"
+        tiff += struct.pack("<H", 4) + entry(1, 2, 2, b"S\x00\x00\x00") + entry(2, 5, 3, struct.pack("<I", 112))
+        tiff += entry(3, 2, 2, b"W\x00\x00\x00") + entry(4, 5, 3, struct.pack("<I", 136)) + struct.pack("<I", 0)
+        tiff += struct.pack("<6I", 23, 1, 33, 1, 0, 1) + struct.pack("<6I", 46, 1, 38, 1, 0, 1)
+        app1 = b"Exif\x00\x00" + tiff
+        return b"\xff\xd8\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xff\xda\x00\x02"
+
+    def test_exif_date_and_gps_without_pillow(self):
+        from services.preprocess import jpeg_exif, format_preprocessed
+
+        exif = jpeg_exif(self.jpeg_with_exif())
+        assert exif == {"taken_at": "2024:03:12 10:30:00", "gps": {"lat": -23.55, "lon": -46.633333}}
+        assert jpeg_exif(b"\xff\xd8\xff\xda\x00\x02") == {}
+        assert "2024:03:12" in format_preprocessed({"kind": "image", "exif": exif})
+
+    def test_exif_with_huge_count_is_skipped(self):
+        import struct
+        from services.preprocess import jpeg_exif
+
+        # Entrada de GPS racional dizendo ter 2^30 valores num EXIF de poucos bytes
+        tiff = b"II*\x00" + struct.pack("<I", 8) + struct.pack("<H", 1)
+        tiff += struct.pack("<HHI", 0x8825, 4, 1) + struct.pack("<I", 26) + struct.pack("<I", 0)
+        tiff += struct.pack("<H", 1) + struct.pack("<HHI", 2, 5, 2 ** 30) + struct.pack("<I", 0)
+        app1 = b"Exif\x00\x00" + tiff
+        jpeg = b"\xff\xd8\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xff\xda\x00\x02"
+        assert jpeg_exif(jpeg) == {}
+
+    def test_timeout_kills_the_stuck_worker(self, tmp_path):
+        import os
+        from services.preprocess import Preprocessor
+
+        # Abrir um FIFO sem escritor bloqueia: o worker fica preso como num arquivo patológico
+        stuck = tmp_path / "travado.pdf"
+        os.mkfifo(stuck)
+        preprocessor = Preprocessor(workers=1, timeout=0.5, enabled=True)
+
+        pdf = tmp_path / "ok.pdf"
+        pdf.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Page >> endobj\n%%EOF")
+
+        async def scenario():
+            task = asyncio.create_task(preprocessor.run({"path": str(stuck), "content_type": "application/pdf"}))
+            await asyncio.sleep(0.2)
+            workers = list(preprocessor._executor._processes.values())
+            # Arquivo saudável na fila atrás do travado: leva o BrokenProcessPool do kill e roda de novo
+            neighbour = asyncio.create_task(preprocessor.run({"path": str(pdf), "content_type": "application/pdf"}))
+            return await task, await neighbour, workers
+
+        try:
+            result, neighbour, workers = asyncio.run(scenario())
+            assert "error" in result and preprocessor.stats["timeouts"] == 1
+            assert neighbour["pages"] == 1 and preprocessor.stats["retried"] == 1
+            assert preprocessor.stats["failures"] == 1
+            for worker in workers:
+                worker.join(5)
+                assert not worker.is_alive()
+
+            features = asyncio.run(preprocessor.run({"path": str(pdf), "content_type": "application/pdf"}))
+            assert features["pages"] == 1
+        finally:
+            preprocessor.shutdown()
+
+    def test_pdf_text_reaches_forensic_prompt_through_process_pool(self, tmp_path):
+        import zlib
+        from services.preprocess import Preprocessor, _pdf_text_fallback
+        from agents.forensic import ForensicAgent
+
+        content = zlib.compress(b"BT /F1 12 Tf (Contrato de loca\\347\\343o) Tj [(Aluguel: R$ 1.500) -250 (,00)] TJ ET")
+        pdf = (b"%PDF-1.4\n1 0 obj << /Type /Page >> endobj\n2 0 obj << /Filter /FlateDecode >>\nstream\n"
+               + content + b"\nendstream\nendobj\n%%EOF")
+        assert _pdf_text_fallback(pdf) == ("Contrato de locação Aluguel: R$ 1.500,00", 1)
+
+        path = tmp_path / "contrato.pdf"
+        path.write_bytes(pdf)
+        preprocessor = Preprocessor(workers=1, enabled=True)
+        record = {"evidence_id": "a" * 64, "path": str(path), "content_type": "application/pdf"}
+        try:
+            features = asyncio.run(preprocessor.run(record))
+        finally:
+            preprocessor.shutdown()
+        assert features["pages"] == 1 and "R$ 1.500,00" in features["text"]
+
+        class CapturingLLM(LLMService):
+            async def chat_completion(self, messages, *args, **kwargs):
+                self.prompt = messages[-1]["content"]
+                return "{}"
+
+        llm = CapturingLLM()
+        asyncio.run(ForensicAgent(llm).analyze_evidence(str(path), "Documento", preprocessed=features))
+        assert "Texto extraído: Contrato de locação" in llm.prompt
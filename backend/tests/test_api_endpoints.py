@@ -36,6 +36,51 @@ class TestChatEndpoint:
         assert response.json()["message"]["role"] == "assistant"
 
 
+class TestChatSessions:
+    def test_conversation_mode_keeps_history_server_side(self, client):
+        """Test that the client can send only the new message after the first turn."""
+        from routers import chat
+
+        first = client.post("/api/chat", json={"message": "Tenho um vazamento no banheiro"})
+        assert first.status_code == 200
+        conversation_id = first.json()["conversation_id"]
+        assert conversation_id
+
+        second = client.post("/api/chat", json={"conversation_id": conversation_id, "message": "Já avisei o dono"})
+        assert second.status_code == 200
+        assert second.json()["conversation_id"] == conversation_id
+
+        history = chat.conversation_store.get(conversation_id)
+        assert [m["role"] for m in history] == ["user", "assistant", "user", "assistant"]
+        assert history[2]["content"] == "Já avisei o dono"
+
+    def test_unknown_conversation_returns_404(self, client):
+        """Test that an expired or unknown conversation asks the client to resend history."""
+        response = client.post("/api/chat", json={"conversation_id": "nao-existe", "message": "Oi"})
+        assert response.status_code == 404
+
+    def test_store_evicts_and_expires(self):
+        """Test the LRU bound, the idle expiry, the per-conversation message cap and folding into the summary."""
+        from services.conversation_store import ConversationStore
+
+        store = ConversationStore(max_conversations=2, idle_seconds=60, max_messages=3)
+        first = store.create()
+        store.create()
+        store.create()
+        assert store.get(first) is None
+
+        # Sem resumo que as cubra, as mensagens antigas só saem no dobro do teto
+        conversation_id = store.create([{"role": "user", "content": str(i)} for i in range(8)])
+        assert [m["content"] for m in store.get(conversation_id)] == ["2", "3", "4", "5", "6", "7"]
+        assert store.append(conversation_id, {"role": "user", "content": "8"}, summary="- 2 a 6", folded=5)
+        assert [m["content"] for m in store.get(conversation_id)] == ["7", "8"]
+        assert store.get_summary(conversation_id) == "- 2 a 6"
+
+        store.idle_seconds = -1
+        assert store.get(conversation_id) is None
+        assert store.get_stats()["expired"] == 1
+
+
 class TestUploadEndpoint:
     def test_upload_valid_image(self, client):
         """Test uploading a valid image file."""
@@ -56,6 +101,247 @@ class TestUploadEndpoint:
         assert response.status_code == 400
         assert "não suportado" in response.json()["detail"]
 
+    def test_upload_hashes_and_sniffs_content(self, client):
+        """Test that the stored file is hashed while streaming and typed by its magic bytes."""
+        import hashlib
+
+        content = b"%PDF-1.4 contrato de locacao"
+        response = client.post("/api/upload", files={"file": ("contrato.pdf", content, "application/pdf")})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["sha256"] == hashlib.sha256(content).hexdigest()
+        assert data["size"] == len(content) and data["filename"].endswith(".pdf")
+
+        disguised = client.post("/api/upload", files={"file": ("foto.jpg", b"MZ\x90\x00" * 10, "image/jpeg")})
+        assert disguised.status_code == 400
+        assert "não corresponde" in disguised.json()["detail"]
+
+    def test_duplicate_upload_reuses_file_and_analysis(self, client, monkeypatch):
+        """Test that re-uploading the same content skips the disk copy and the forensic call."""
+        import os
+        from routers import upload
+
+        calls = []
+
+        async def forensic(file_path, context="", preprocessed=None):
+            calls.append(file_path)
+            return {"summary": "Foto de infiltração", "context": context}
+
+        monkeypatch.setattr(upload.forensic_agent, "analyze_evidence", forensic)
+        monkeypatch.setattr(upload.forensic_agent.llm, "mock_mode", False)
+        content = b"\x89PNG\r\n\x1a\n" + os.urandom(64)
+
+        first = client.post("/api/upload", files={"file": ("foto.png", content, "image/png")}).json()
+        assert client.get(f"{first['job_url']}?wait=5").json()["status"] == "done"
+        second = client.post("/api/upload", files={"file": ("copia.png", content, "image/png")}).json()
+        assert first["evidence_id"] == second["evidence_id"] == first["sha256"]
+        assert not first["deduplicated"] and second["deduplicated"]
+        assert second["forensic_analysis"] == {"summary": "Foto de infiltração", "context": "Foto do Dano"}
+        assert len(calls) == 1
+        assert not [name for name in os.listdir(upload.UPLOAD_DIR) if name.endswith(".part")]
+
+    def test_fallback_analysis_is_not_persisted(self, client, monkeypatch, evidence_store):
+        """Test that a forensic answer produced by the LLM fallback is neither stored nor reused."""
+        import asyncio
+        import os
+        from routers import upload
+        from services.llm import FallbackResponse
+
+        calls = []
+
+        async def failing_completion(messages, *args, **kwargs):
+            calls.append(1)
+            return FallbackResponse('{"doc_type": "foto_dano"}')
+
+        monkeypatch.setattr(upload.forensic_agent.llm, "mock_mode", False)
+        monkeypatch.setattr(upload.forensic_agent.llm, "chat_completion", failing_completion)
+        content = b"\xff\xd8\xff" + os.urandom(64)
+
+        first = client.post("/api/upload", files={"file": ("foto.jpg", content, "image/jpeg")}).json()
+        job = client.get(f"{first['job_url']}?wait=5").json()
+        assert job["forensic_analysis"] == {"doc_type": "foto_dano", "fallback": True}
+        record = asyncio.run(evidence_store.get(first["evidence_id"]))
+        assert record["forensic_analysis"] is None
+
+        second = client.post("/api/upload", files={"file": ("foto.jpg", content, "image/jpeg")}).json()
+        assert second["forensic_status"] != "done"
+        assert client.get(f"{second['job_url']}?wait=5").json()["status"] == "done"
+        assert len(calls) == 2
+
+    def test_analysis_without_preprocessing_is_not_persisted(self, client, monkeypatch, evidence_store):
+        """Test that a forensic answer computed after a failed preprocess is served but redone on re-upload."""
+        import asyncio
+        import os
+        from routers import upload
+
+        calls = []
+
+        async def broken_preprocess(record):
+            return {"error": "pool de pré-processamento falhou"}
+
+        async def forensic(file_path, context="", preprocessed=None):
+            calls.append(preprocessed)
+            return {"summary": "Foto de infiltração"}
+
+        monkeypatch.setattr(upload.preprocessor, "enabled", True)
+        monkeypatch.setattr(upload.preprocessor, "run", broken_preprocess)
+        monkeypatch.setattr(upload.forensic_agent, "analyze_evidence", forensic)
+        monkeypatch.setattr(upload.forensic_agent.llm, "mock_mode", False)
+        content = b"\xff\xd8\xff" + os.urandom(64)
+
+        first = client.post("/api/upload", files={"file": ("foto.jpg", content, "image/jpeg")}).json()
+        job = client.get(f"{first['job_url']}?wait=5").json()
+        assert job["forensic_analysis"] == {"summary": "Foto de infiltração", "retryable": True}
+        assert asyncio.run(evidence_store.get(first["evidence_id"]))["forensic_analysis"] is None
+
+        second = client.post("/api/upload", files={"file": ("foto.jpg", content, "image/jpeg")}).json()
+        assert client.get(f"{second['job_url']}?wait=5").json()["status"] == "done"
+        assert len(calls) == 2
+
+    def test_upload_returns_before_analysis_and_job_is_pollable(self, client, monkeypatch):
+        """Test that upload queues the forensic analysis and the result comes by polling or SSE."""
+        import asyncio
+        import json
+        import os
+        from routers import upload
+
+        async def slow_forensic(file_path, context="", preprocessed=None):
+            await asyncio.sleep(0.2)
+            return {"summary": "Contrato de locação"}
+
+        monkeypatch.setattr(upload.forensic_agent, "analyze_evidence", slow_forensic)
+        content = b"%PDF-1.7 " + os.urandom(32)
+        data = client.post("/api/upload", files={"file": ("contrato.pdf", content, "application/pdf")}).json()
+        assert data["forensic_status"] == "queued" and data["forensic_analysis"] is None
+
+        job = client.get(f"{data['job_url']}?wait=5").json()
+        assert job["status"] == "done"
+        assert job["forensic_analysis"] == {"summary": "Contrato de locação"}
+        assert job["processing_ms"] >= 150
+
+        events = client.get(f"{data['job_url']}/events").text
+        assert "event: done" in events
+        done = json.loads(events.split("event: done\ndata: ")[1].split("\n")[0])
+        assert done["forensic_analysis"] == {"summary": "Contrato de locação"}
+
+        stats = client.get("/api/metrics").json()["forensic_jobs"]
+        assert stats["completed"] >= 1 and stats["processing_p50"] is not None
+        assert client.get("/api/upload/jobs/" + "0" * 64).status_code == 404
+
+    def test_job_queue_recovers_orphans_only_after_restart(self):
+        """Test that a job cut short by shutdown runs again on the next start, and only then."""
+        import asyncio
+        from services.forensic_jobs import ForensicJobQueue
+
+        queue = ForensicJobQueue(workers=1)
+        runs = []
+
+        async def run():
+            runs.append(1)
+            await asyncio.sleep(10 if len(runs) == 1 else 0)
+            return {"summary": "ok"}
+
+        async def first_life():
+            queue.start()
+            queue.submit("a" * 64, run)
+            assert (await queue.wait("a" * 64, 0.05))["status"] == "running"
+            queue.submit("a" * 64, run)  # Já em andamento: não duplica
+            queue.shutdown()
+
+        async def second_life():
+            queue.start()
+            return await queue.wait("a" * 64, 5)
+
+        asyncio.run(first_life())
+        assert len(runs) == 1
+        job = asyncio.run(second_life())
+        queue.shutdown()
+        assert job["status"] == "done" and len(runs) == 2
+        assert queue.stats["recovered"] == 1 and queue.stats["submitted"] == 1
+
+    def test_batch_upload_reports_partial_failures(self, client, monkeypatch):
+        """Test that one multipart request stores many files and rejects bad ones individually."""
+        import os
+        from routers import upload
+
+        async def forensic(file_path, context="", preprocessed=None):
+            return {"context": context}
+
+        monkeypatch.setattr(upload.forensic_agent, "analyze_evidence", forensic)
+        files = [
+            ("files", ("sala.jpg", b"\xff\xd8\xff" + os.urandom(32), "image/jpeg")),
+            ("files", ("virus.exe", b"MZ" + os.urandom(32), "application/x-msdownload")),
+            ("files", ("falso.png", b"GIF89a" + os.urandom(32), "image/png")),
+            ("files", ("contrato.pdf", b"%PDF-1.4" + os.urandom(32), "application/pdf")),
+        ]
+        response = client.post("/api/upload/batch?wait=5", files=files)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["summary"] == {"total": 4, "ok": 2, "error": 2}
+
+        results = data["files"]
+        assert [r["original_name"] for r in results] == ["sala.jpg", "virus.exe", "falso.png", "contrato.pdf"]
+        assert results[0]["forensic_status"] == "done"
+        assert results[0]["forensic_analysis"] == {"context": "Foto do Dano"}
+        assert results[1]["status_code"] == 400 and "não suportado" in results[1]["error"]
+        assert "não corresponde" in results[2]["error"]
+        assert results[3]["forensic_analysis"] == {"context": "Documento"}
+
+    def test_upload_rejects_oversize_early(self, client, monkeypatch):
+        """Test rejection at Content-Length and, without it, at the first chunk past the limit."""
+        import asyncio
+        import os
+        from routers import upload
+        from services.upload_stream import UploadError, receive_upload
+
+        monkeypatch.setattr(upload, "MAX_SIZE_MB", 1024)
+        big = b"\xff\xd8\xff" + b"\x00" * 70 * 1024
+        response = client.post("/api/upload", files={"file": ("grande.jpg", big, "image/jpeg")})
+        assert response.status_code == 413
+
+        class ChunkedRequest:
+            """Body sem Content-Length, entregue em pedaços de 1KB."""
+            headers = {"content-type": "multipart/form-data; boundary=xyz"}
+            consumed = 0
+
+            async def stream(self):
+                body = (b'--xyz\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+                        b"Content-Type: image/jpeg\r\n\r\n" + big + b"\r\n--xyz--\r\n")
+                for i in range(0, len(body), 1024):
+                    self.consumed += 1
+                    yield body[i:i + 1024]
+
+        request = ChunkedRequest()
+        before = set(os.listdir(upload.UPLOAD_DIR))
+        try:
+            asyncio.run(receive_upload(request, upload.UPLOAD_DIR, max_file_bytes=4096))
+            raise AssertionError("upload grande aceito")
+        except UploadError as e:
+            assert e.status_code == 413
+        assert request.consumed <= 6  # parou logo depois de passar do limite
+        assert set(os.listdir(upload.UPLOAD_DIR)) == before  # sem arquivo .part esquecido
+
+    def test_truncated_upload_leaves_no_partial_file(self, tmp_path):
+        """Test that a body cut before the closing boundary is rejected and its file removed."""
+        import asyncio
+        from services.upload_stream import UploadError, receive_upload
+
+        class TruncatedRequest:
+            headers = {"content-type": "multipart/form-data; boundary=xyz"}
+
+            async def stream(self):
+                yield (b'--xyz\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+                       b"Content-Type: image/jpeg\r\n\r\n\xff\xd8\xff" + b"\x00" * 1024)
+
+        upload_dir = tmp_path / "truncated"
+        upload_dir.mkdir()
+        try:
+            asyncio.run(receive_upload(TruncatedRequest(), str(upload_dir), max_file_bytes=4096))
+            raise AssertionError("upload cortado aceito")
+        except UploadError as e:
+            assert e.status_code == 400
+        assert list(upload_dir.iterdir()) == []
+
 
 class TestClaimEndpoint:
     def test_generate_claim(self, client, sample_claim_data):
@@ -66,6 +352,218 @@ class TestClaimEndpoint:
         # Generator may return raw or processed format depending on input
         assert "title" in data or "analysis" in data or "facts" in data
 
+    def test_analyze_reuses_chat_analysis(self, client, monkeypatch):
+        """Test that /claim/analyze serves the chat turn's analysis via analysis_id."""
+        from routers import claim
+
+        report = "O proprietário não devolveu minha caução depois que entreguei as chaves"
+        chat_response = client.post("/api/chat", json={"messages": [{"role": "user", "content": report}]})
+        analysis_id = chat_response.json()["analysis_id"]
+        assert analysis_id
+
+        async def must_not_run(*args, **kwargs):
+            raise AssertionError("análise recalculada")
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", must_not_run)
+        response = client.post("/api/claim/analyze", json={"report": report, "analysis_id": analysis_id})
+        assert response.status_code == 200
+        assert 0 <= response.json()["viability_score"] <= 100
+
+    def test_analyze_reuses_chat_analysis_only_for_the_same_case(self, client, monkeypatch):
+        """Test that after two messages the widget's joined report reuses the chat analysis, and a foreign id is ignored."""
+        from routers import claim
+
+        first = "O proprietário não devolveu minha caução depois que entreguei as chaves"
+        second = "Já mandei mensagem três vezes e ele não responde mais nada"
+        chat = client.post("/api/chat", json={"message": first}).json()
+        chat = client.post("/api/chat", json={"conversation_id": chat["conversation_id"], "message": second}).json()
+        analysis_id = chat["analysis_id"]
+        assert analysis_id
+
+        reports = []
+
+        async def recorded(user_report, evidences=[], priority="analysis"):
+            reports.append(user_report)
+            return {"viability_score": 42, "analysis": "a", "strategy": "s",
+                    "missing_info": [], "strengths": [], "risks": []}
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", recorded)
+        joined = client.post("/api/claim/analyze", json={"report": f"{first} {second}", "analysis_id": analysis_id})
+        assert joined.status_code == 200 and reports == []
+
+        other = "Meu vizinho faz barulho toda noite depois das dez horas"
+        response = client.post("/api/claim/analyze", json={"report": other, "analysis_id": analysis_id})
+        assert response.json()["viability_score"] == 42 and reports == [other]
+
+    def test_analyze_batch_streams_ndjson_with_item_errors(self, client, monkeypatch):
+        """Test that a failing item is reported on its own line without failing the batch."""
+        import json
+        from routers import claim
+
+        real_analyze = claim.legal_agent.analyze_case
+
+        async def flaky_analyze(user_report, evidences=[], priority="analysis"):
+            if "explode" in user_report:
+                raise RuntimeError("falhou")
+            if "descartado" in user_report:
+                # Como o LegalAgent responde quando o scheduler descarta a chamada
+                return {"viability_score": 60, "analysis": "simulada", "fallback": True}
+            return await real_analyze(user_report, evidences, priority=priority)
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", flaky_analyze)
+        payload = {"items": [
+            {"id": "a", "report": "Infiltração no quarto do lote"},
+            {"id": "b", "report": "Este relato explode"},
+            {"id": "c", "report": "Caução não devolvida no lote"},
+            {"id": "d", "report": "Relato descartado pela fila"}
+        ], "concurrency": 2}
+        response = client.post("/api/claim/analyze/batch", json=payload)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        items = {line["id"]: line for line in lines if "id" in line}
+        assert items["a"]["status"] == "ok" and "viability_score" in items["a"]["result"]
+        assert items["b"]["status"] == "error"
+        assert items["c"]["status"] == "ok"
+        assert items["d"]["status"] == "error" and "result" not in items["d"]
+        assert lines[-1] == {"summary": {"total": 4, "ok": 2, "error": 2}}
+
+    def test_analyze_batch_dedupes_locally_and_cancels_on_disconnect(self, monkeypatch):
+        """Test that a batch leaves the shared analysis store alone and stops its queued analyses."""
+        import asyncio
+        import json
+        from routers import claim
+        from services.analysis_store import AnalysisStore
+
+        store = AnalysisStore(max_entries=2)
+        monkeypatch.setattr(claim, "analysis_store", store)
+        started, cancelled = [], []
+
+        async def analyze(user_report, evidences=[], priority="analysis"):
+            started.append(user_report)
+            try:
+                if user_report != "rapido":
+                    await asyncio.sleep(10)
+                return {"viability_score": 70}
+            except asyncio.CancelledError:
+                cancelled.append(user_report)
+                raise
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", analyze)
+        items = [claim.BatchAnalyzeItem(id=str(i), report=report)
+                 for i, report in enumerate(["rapido", "rapido", "lento 1", "lento 2", "lento 3"])]
+
+        async def scenario():
+            stream = claim._analyze_batch(items, concurrency=2)
+            first = json.loads(await stream.__anext__())
+            second = json.loads(await stream.__anext__())
+            await stream.aclose()  # Cliente desconectou
+            await asyncio.sleep(0)
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first["status"] == second["status"] == "ok"
+        assert started.count("rapido") == 1  # Repetido no lote: uma análise só
+        assert store.get_stats()["entries"] == 0
+        assert len(cancelled) == len(started) - 1 and "lento 3" not in started
+
+    def test_analyze_batch_jsonl_upload(self, client):
+        """Test that a JSONL upload is analyzed line by line, with bad lines reported."""
+        import json
+
+        content = '{"id": "1", "report": "Multa rescisória abusiva em jsonl"}\nnao é json\n'
+        files = {"file": ("lote.jsonl", content.encode("utf-8"), "application/x-ndjson")}
+        response = client.post("/api/claim/analyze/batch/jsonl", files=files)
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        statuses = sorted(line["status"] for line in lines[:-1])
+        assert statuses == ["error", "ok"]
+        assert lines[-1]["summary"]["total"] == 2
+
+    def test_high_score_pregenerates_claim(self, client, monkeypatch):
+        """Test that /claim/generate returns the draft started by a high-score /claim/analyze."""
+        from routers import claim
+
+        report = "Caução retida pela imobiliária há três meses, pré-geração"
+
+        async def confident(user_report, evidences=[], priority="analysis"):
+            return {"viability_score": 90, "analysis": "Art. 38", "strategy": "Notificar."}
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", confident)
+        real_generate = claim.generator_agent.generate_claim
+        calls = []
+
+        async def counting_generate(case_data, polish=False, priority="interactive"):
+            calls.append(priority)
+            assert not polish  # A especulação não dispara lapidação fora do pregenerator
+            return await real_generate(case_data, polish=polish, priority=priority)
+
+        monkeypatch.setattr(claim.generator_agent, "generate_claim", counting_generate)
+        assert client.post("/api/claim/analyze", json={"report": report}).json()["viability_score"] == 90
+        response = client.post("/api/claim/generate", json={"report": report})
+        assert response.status_code == 200
+        assert response.json()["claim_type"] == "caucao"
+        assert calls == ["analysis"]  # só a geração especulativa rodou
+
+    def test_pipeline_overlaps_forensic_and_legal(self, client, monkeypatch):
+        """Test that forensic jobs run alongside the legal analysis and feed generation."""
+        import asyncio
+        import json
+        from routers import claim, upload
+
+        uploaded = client.post("/api/upload", files={"file": ("foto.jpg", b"\xff\xd8\xff fake image", "image/jpeg")})
+        evidence_id = uploaded.json()["evidence_id"]
+        legal_done = asyncio.Event()
+        real_analyze = claim.legal_agent.analyze_case
+
+        async def legal(user_report, evidences=[], priority="analysis"):
+            result = await real_analyze(user_report, evidences, priority=priority)
+            legal_done.set()
+            return result
+
+        async def forensic(file_path, context="", preprocessed=None):
+            # Só termina depois da análise jurídica: trava se as etapas rodassem em série
+            await asyncio.wait_for(legal_done.wait(), timeout=2)
+            return {"file": file_path, "context": context}
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", legal)
+        monkeypatch.setattr(upload.forensic_agent, "analyze_evidence", forensic)
+        payload = {"report": "Infiltração no teto do pipeline", "evidences": [evidence_id, "../main.py"]}
+        response = client.post("/api/claim/pipeline", json=payload)
+        assert response.status_code == 200
+
+        events = [json.loads(line) for line in response.text.splitlines()]
+        stages = [(e["stage"], e["status"]) for e in events[:-1]]
+        assert stages[0] == ("forensic", "error")  # id inválido falha na hora
+        assert stages[1:] == [("legal", "ok"), ("forensic", "ok"), ("generate", "ok")]
+        assert "title" in events[3]["result"]
+        assert events[-1] == {"stage": "done", "errors": 1}
+
+
+    def test_pipeline_goes_through_the_forensic_queue_and_reports_fallback(self, client, monkeypatch, forensic_jobs):
+        """Test that the forensic stage respects the job queue bound and a fallback legal analysis is an error."""
+        import hashlib
+        import json
+        import os
+        from routers import claim
+
+        async def fallback(user_report, evidences=[], priority="analysis"):
+            return {"viability_score": 60, "analysis": "simulada", "fallback": True}
+
+        monkeypatch.setattr(claim.legal_agent, "analyze_case", fallback)
+        monkeypatch.setattr(forensic_jobs, "max_queue", 0)
+        content = b"\xff\xd8\xff" + os.urandom(32)
+        # Fila cheia: o arquivo fica guardado, mas a análise não entra
+        assert client.post("/api/upload", files={"file": ("foto.jpg", content, "image/jpeg")}).status_code == 503
+
+        payload = {"report": "Caução não devolvida, pipeline com fila cheia",
+                   "evidences": [hashlib.sha256(content).hexdigest()]}
+        events = {e["stage"]: e for e in map(json.loads, client.post("/api/claim/pipeline", json=payload).text.splitlines())}
+        assert events["forensic"]["status"] == "error" and "Muitas análises" in events["forensic"]["error"]
+        assert events["legal"] == {"stage": "legal", "status": "error", "error": claim.ANALYSIS_UNAVAILABLE}
+        assert events["generate"]["status"] == "ok"
+        assert events["done"] == {"stage": "done", "errors": 2}
 
 class TestAutomationEndpoint:
     def test_submit_claim_mock(self, client):
@@ -84,3 +582,28 @@ class TestAutomationEndpoint:
         assert data["status"] == "success"
         assert "protocol" in data
         assert len(data["logs"]) > 0
+
+
+class TestChatStreamEndpoint:
+    def test_stream_sends_tokens_and_done(self, client, sample_chat_message):
+        """Test that the streaming endpoint emits SSE token events and a final done event."""
+        response = client.post("/api/chat/stream", json=sample_chat_message)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = response.text
+        assert "event: token" in body
+        assert "event: done" in body
+
+    def test_stream_failure_sends_fallback(self, client, sample_chat_message, monkeypatch):
+        """Test that a stream failing partway still delivers the fallback message."""
+        from routers import chat
+
+        async def broken_stream(messages, context=None):
+            yield "Olá"
+            raise RuntimeError("upstream caiu")
+
+        monkeypatch.setattr(chat.conversational_agent, "stream_chat", broken_stream)
+        response = client.post("/api/chat/stream", json=sample_chat_message)
+        assert response.status_code == 200
+        assert "event: fallback" in response.text
+        assert chat.FALLBACK_MESSAGE in response.text
@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+from tools.fake_llm_server import create_app
+
+
+class TestFakeLLMServer:
+    def test_completion_is_openai_shaped(self):
+        """The stand-in server answers like the OpenAI chat completions API."""
+        client = TestClient(create_app(latency="fixed:0"))
+        payload = {
+            "model": "gpt-4o-mini",
+            "messages": [
+                {"role": "system", "content": "Você é um Agente Jurídico"},
+                {"role": "user", "content": "infiltração no teto"}
+            ]
+        }
+        response = client.post("/v1/chat/completions", json=payload)
+        assert response.status_code == 200
+        data = response.json()
+        assert "viability_score" in data["choices"][0]["message"]["content"]
+        assert data["usage"]["total_tokens"] > 0
+
+    def test_rate_limit_injection(self):
+        """Injected rate limiting returns 429 with Retry-After."""
+        client = TestClient(create_app(latency="fixed:0", rate_limit_rate=1.0))
+        response = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "oi"}]})
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+    def test_streaming_emits_chunks_and_done(self):
+        """Streaming responses are SSE chunks terminated by [DONE]."""
+        client = TestClient(create_app(latency="fixed:0", token_delay=0))
+        payload = {"stream": True, "messages": [{"role": "user", "content": "oi"}]}
+        response = client.post("/v1/chat/completions", json=payload)
+        assert response.status_code == 200
+        assert "chat.completion.chunk" in response.text
+        assert response.text.rstrip().endswith("data: [DONE]")
@@ -0,0 +1,371 @@
+import asyncio
+import pytest
+from services.llm import LLMService
+from services.llm_cache import ResponseCache
+from services.llm_scheduler import AdmissionScheduler, LLMRequestDropped
+from services.tokens import fit_messages, count_message_tokens
+from services.json_extract import extract_json
+from services.resilience import CircuitBreaker, LatencyTracker
+from services.learning import LearningService
+from services.local_scorer import LocalScorer
+from agents.legal import LegalAgent
+
+
+def make_service(responses=None, delay=0.0):
+    """LLMService fora do modo mock, com a chamada ao provedor substituída por um contador."""
+    service = LLMService()
+    service.mock_mode = False
+    service.cache = ResponseCache(max_entries=8, ttl_seconds=60)
+    service.upstream_calls = 0
+
+    async def fake_request(messages, system_prompt, temperature, response_format=None):
+        service.upstream_calls += 1
+        await asyncio.sleep(delay)
+        return (responses or {}).get(messages[-1]["content"], f"resposta {service.upstream_calls}"), None
+
+    service._request_completion = fake_request
+    return service
+
+
+class TestResponseCache:
+    def test_repeated_prompt_hits_cache(self):
+        """A second identical call is served from the cache."""
+        service = make_service()
+        messages = [{"role": "user", "content": "infiltração no teto"}]
+
+        async def run():
+            first = await service.chat_completion(messages, "prompt")
+            second = await service.chat_completion(messages, "prompt")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first == second
+        assert service.upstream_calls == 1
+        assert service.cache.stats["hits"] == 1
+        assert service.cache.stats["misses"] == 1
+
+    def test_cache_opt_out(self):
+        """use_cache=False always goes upstream."""
+        service = make_service()
+        messages = [{"role": "user", "content": "oi"}]
+
+        async def run():
+            await service.chat_completion(messages, "prompt", use_cache=False)
+            await service.chat_completion(messages, "prompt", use_cache=False)
+
+        asyncio.run(run())
+        assert service.upstream_calls == 2
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted when the cache is full."""
+        cache = ResponseCache(max_entries=2, ttl_seconds=60)
+
+        async def run():
+            await cache.set("a", "1")
+            await cache.set("b", "2")
+            await cache.get("a")
+            await cache.set("c", "3")
+            return await cache.get("b"), await cache.get("a")
+
+        evicted, kept = asyncio.run(run())
+        assert evicted is None
+        assert kept == "1"
+        assert cache.stats["evictions"] == 1
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Entries written to disk are found by a fresh cache instance."""
+        path = str(tmp_path / "cache.sqlite3")
+
+        asyncio.run(ResponseCache(disk_path=path).set("chave", "valor"))
+        fresh = ResponseCache(disk_path=path)
+        assert asyncio.run(fresh.get("chave")) == "valor"
+        assert fresh.stats["disk_hits"] == 1
+
+
+class TestSingleFlight:
+    def test_concurrent_identical_calls_are_coalesced(self):
+        """Identical calls in flight at the same time share one upstream request."""
+        service = make_service(delay=0.05)
+        service.cache = None
+        messages = [{"role": "user", "content": "mesmo relato"}]
+
+        async def run():
+            return await asyncio.gather(*[service.chat_completion(messages, "prompt") for _ in range(3)])
+
+        results = asyncio.run(run())
+        assert len(set(results)) == 1
+        assert service.upstream_calls == 1
+        assert service.stats["coalesced"] == 2
+        assert not service._inflight
+
+    def test_different_prompts_are_not_coalesced(self):
+        """Distinct prompts still go upstream separately."""
+        service = make_service(delay=0.01)
+
+        async def run():
+            await asyncio.gather(
+                service.chat_completion([{"role": "user", "content": "a"}], "prompt"),
+                service.chat_completion([{"role": "user", "content": "b"}], "prompt")
+            )
+
+        asyncio.run(run())
+        assert service.upstream_calls == 2
+        assert service.stats["coalesced"] == 0
+
+
+class TestAdmissionScheduler:
+    def test_interactive_jumps_the_queue(self):
+        """When saturated, a waiting interactive call is admitted before earlier batch work."""
+        scheduler = AdmissionScheduler(max_concurrency=1)
+        order = []
+
+        async def worker(priority):
+            async with scheduler.slot(priority):
+                order.append(priority)
+
+        async def run():
+            first = await scheduler.acquire("analysis")
+            batch = asyncio.ensure_future(worker("batch"))
+            await asyncio.sleep(0)
+            interactive = asyncio.ensure_future(worker("interactive"))
+            await asyncio.sleep(0)
+            scheduler.release(first)
+            await asyncio.gather(batch, interactive)
+
+        asyncio.run(run())
+        assert order == ["interactive", "batch"]
+        assert scheduler.get_stats()["active"] == 0
+
+    def test_background_work_is_dropped_after_max_wait(self):
+        """Background calls that wait too long are dropped; interactive ones are not."""
+        scheduler = AdmissionScheduler(max_concurrency=1, max_wait={"interactive": None, "analysis": 0.01, "batch": 0.01})
+
+        async def run():
+            held = await scheduler.acquire("interactive")
+            with pytest.raises(LLMRequestDropped):
+                await scheduler.acquire("batch")
+            scheduler.release(held)
+
+        asyncio.run(run())
+        assert scheduler.stats["batch"]["dropped"] == 1
+
+    def test_dropped_call_falls_back_to_mock(self):
+        """chat_completion degrades to the mock response when the scheduler drops the call."""
+        service = make_service()
+        service.scheduler = AdmissionScheduler(max_concurrency=0, max_queue_depth=0)
+        messages = [{"role": "user", "content": "infiltração no teto"}]
+
+        result = asyncio.run(service.chat_completion(messages, "Você é um Agente Jurídico", priority="batch"))
+        assert "viability_score" in result
+        assert service.upstream_calls == 0
+
+
+class TestTokenBudget:
+    def test_fills_budget_newest_first(self):
+        """Only the newest messages that fit in the budget are kept, in order."""
+        messages = [{"role": "user", "content": "x" * 400} for _ in range(5)]
+        messages.append({"role": "user", "content": "última"})
+        budget = count_message_tokens(messages[-1]) + 2 * count_message_tokens(messages[0])
+
+        selected, used = fit_messages(messages, budget)
+        assert selected == messages[-3:]
+        assert used == budget
+
+    def test_short_messages_use_more_history(self):
+        """Many short messages all fit where a flat message cap would drop them."""
+        messages = [{"role": "user", "content": f"msg {i}"} for i in range(30)]
+        selected, _ = fit_messages(messages, 1000)
+        assert len(selected) == 30
+
+    def test_last_message_always_kept(self):
+        """The newest message is kept even when it alone exceeds the budget."""
+        messages = [{"role": "user", "content": "y" * 4000}]
+        selected, _ = fit_messages(messages, 10)
+        assert selected == messages
+
+    def test_encoding_loads_lazily_and_falls_back_to_estimate(self, monkeypatch):
+        """The tiktoken vocabulary is fetched on first count, and a failed fetch uses ~4 chars/token."""
+        import sys
+        import types
+        from services import tokens
+
+        class OfflineTiktoken(types.ModuleType):
+            calls = 0
+
+            def get_encoding(self, name):
+                OfflineTiktoken.calls += 1
+                raise OSError("sem rede")
+
+        monkeypatch.setitem(sys.modules, "tiktoken", OfflineTiktoken("tiktoken"))
+        monkeypatch.setattr(tokens, "_encoding", tokens._UNLOADED)
+        assert OfflineTiktoken.calls == 0
+        assert tokens.count_tokens("x" * 40) == 10
+        assert tokens.count_tokens("y" * 8) == 2
+        assert OfflineTiktoken.calls == 1
+
+    def test_startup_loads_encoding_off_the_event_loop(self, monkeypatch):
+        """The app lifespan does the first count in a worker thread, not in a request handler."""
+        import sys
+        import types
+        from fastapi.testclient import TestClient
+        from main import app
+        from services import tokens
+
+        loaded_in = []
+
+        class SlowTiktoken(types.ModuleType):
+            def get_encoding(self, name):
+                try:
+                    asyncio.get_running_loop()
+                    loaded_in.append("event loop")
+                except RuntimeError:
+                    loaded_in.append("thread")
+                raise OSError("sem rede")
+
+        monkeypatch.setitem(sys.modules, "tiktoken", SlowTiktoken("tiktoken"))
+        monkeypatch.setattr(tokens, "_encoding", tokens._UNLOADED)
+        with TestClient(app) as client:
+            assert loaded_in == ["thread"]
+            client.get("/health")
+        assert loaded_in == ["thread"]
+
+    def test_usage_recorded_per_priority(self):
+        """Prompt and completion tokens are recorded for each upstream call."""
+        service = make_service()
+        asyncio.run(service.chat_completion([{"role": "user", "content": "oi"}], "prompt", priority="interactive"))
+        usage = service.usage["interactive"]
+        assert usage["calls"] == 1
+        assert usage["prompt_tokens"] > 0
+        assert usage["completion_tokens"] > 0
+
+
+class TestJsonExtraction:
+    def test_plain_json(self):
+        data, recovered = extract_json('{"viability_score": 80}')
+        assert data == {"viability_score": 80}
+        assert recovered is False
+
+    def test_fenced_json_with_prose(self):
+        """JSON wrapped in markdown fences and prose is recovered."""
+        text = 'Claro! Segue a análise:\n```json\n{"viability_score": 70, "analysis": "ok {sic}"}\n```\nAbraços.'
+        data, recovered = extract_json(text)
+        assert data == {"viability_score": 70, "analysis": "ok {sic}"}
+        assert recovered is True
+
+    def test_no_json(self):
+        assert extract_json("Resposta simulada da IA.") == (None, False)
+
+    def test_scan_skips_non_json_braces_in_linear_time(self):
+        """Braces in prose are skipped block by block; a never-closing '{' run ends the scan."""
+        import time
+
+        data, recovered = extract_json('Use {chave} e {"a": {"b": "}"}} fim')
+        assert data == {"a": {"b": "}"}} and recovered is True
+
+        started = time.perf_counter()
+        assert extract_json("{" * 20000 + " sem fechar") == (None, False)
+        assert extract_json("{x} " * 20000) == (None, False)
+        assert time.perf_counter() - started < 2
+
+    def test_agent_uses_recovered_json_and_counts_failures(self, tmp_path):
+        """LegalAgent keeps a fenced LLM answer instead of discarding it."""
+        fenced = '```json\n{"viability_score": 91, "analysis": "a", "strategy": "s", "missing_info": [], "strengths": [], "risks": []}\n```'
+        service = make_service()
+        learning = LearningService(str(tmp_path / "knowledge.json"), str(tmp_path / "scored_reports.jsonl"))
+        agent = LegalAgent(service, scorer=LocalScorer(), learning=learning)
+
+        async def fenced_request(messages, system_prompt, temperature, response_format=None):
+            assert response_format["type"] == "json_schema"
+            return fenced, None
+
+        service._request_completion = fenced_request
+        analysis = asyncio.run(agent.analyze_case("infiltração no teto do quarto"))
+        assert analysis["viability_score"] == 91
+        assert service.json_stats["legal_analysis"] == {"parsed": 0, "recovered": 1, "failed": 0}
+        assert [r["viability_score"] for r in learning.load_scored_reports()] == [91]
+
+    def test_fallback_scores_are_not_training_labels(self, tmp_path):
+        """A provider failure yields a usable analysis, but its mock score is never recorded."""
+        service = make_service()
+        service.cache = None
+        learning = LearningService(str(tmp_path / "knowledge.json"), str(tmp_path / "scored_reports.jsonl"))
+        agent = LegalAgent(service, scorer=LocalScorer(), learning=learning)
+
+        async def failing_request(messages, system_prompt, temperature, response_format=None):
+            raise RuntimeError("provedor fora do ar")
+
+        service._request_completion = failing_request
+        analysis = asyncio.run(agent.analyze_case("infiltração no teto do quarto"))
+        assert analysis["fallback"] and 0 <= analysis["viability_score"] <= 100
+        assert learning.load_scored_reports() == []
+
+
+class TestCircuitBreakerAndHedging:
+    def test_breaker_opens_and_skips_upstream(self):
+        """After repeated failures the breaker opens and calls go straight to the fallback."""
+        service = make_service()
+        service.cache = None
+        service.breaker = CircuitBreaker(failure_threshold=2, open_seconds=60)
+        calls = []
+
+        async def failing_request(messages, system_prompt, temperature, response_format=None):
+            calls.append(1)
+            raise RuntimeError("provedor fora do ar")
+
+        service._request_completion = failing_request
+
+        async def run():
+            for i in range(4):
+                await service.chat_completion([{"role": "user", "content": f"msg {i}"}], "prompt")
+
+        asyncio.run(run())
+        assert len(calls) == 2
+        assert service.breaker.state == "open"
+        assert service.breaker.stats["short_circuited"] == 2
+
+    def test_slow_calls_count_as_failures(self):
+        """Calls slower than the threshold trip the breaker too."""
+        breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=1.0)
+        breaker.record_success(5.0)
+        breaker.record_success(5.0)
+        assert breaker.state == "open"
+
+    def test_half_open_probe_closes_breaker(self):
+        """A successful probe after the open period closes the breaker."""
+        breaker = CircuitBreaker(failure_threshold=1, open_seconds=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        assert not breaker.allow()
+        breaker.record_success(0.1)
+        assert breaker.state == "closed"
+
+    def test_hedge_uses_fastest_answer(self):
+        """A slow primary is hedged after the p95 delay and the backup answer wins."""
+        service = make_service()
+        service.cache = None
+        service.hedging_enabled = True
+        service.latency = LatencyTracker()
+        for _ in range(50):
+            service.latency.record(0.01)
+        delays = [1.0, 0.0]
+
+        async def request(messages, system_prompt, temperature, response_format=None):
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return f"resposta após {delay}s", None
+
+        service._request_completion = request
+        result = asyncio.run(service.chat_completion([{"role": "user", "content": "oi"}], "prompt",
+                                                     priority="interactive"))
+        assert result == "resposta após 0.0s"
+        assert service.stats["hedged"] == 1
+        assert service.stats["hedge_wins"] == 1
+
+
+class TestMetricsEndpoint:
+    def test_metrics_exposes_llm_stats(self, client):
+        """Metrics endpoint reports LLM service state."""
+        response = client.get("/api/metrics")
+        assert response.status_code == 200
+        assert "llm" in response.json()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark do classificador de relatos (services/classifier.py).
+
+Compara, sobre um corpus sintético de relatos (ou um arquivo com um relato
+por linha):
+- as cadeias de `in` que o LegalAgent e o LearningService usavam antes
+  (sem acentos dobrados nem início de palavra);
+- um `in` por radical da taxonomia sobre o texto dobrado (os mesmos
+  radicais do classificador, buscados do jeito antigo);
+- o classificador compilado (uma varredura).
+
+Com poucas dezenas de radicais as buscas de substring em C ainda empatam ou
+ganham; --scale multiplica a taxonomia com radicais sintéticos para mostrar
+como cada abordagem cresce com ela.
+
+Uso:
+    python tools/bench_classifier.py --reports 50000
+    python tools/bench_classifier.py --scale 20
+    python tools/bench_classifier.py --corpus relatos.txt --repeat 3
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.classifier import TAXONOMY_PATH, KeywordClassifier, fold  # noqa: E402
+from services.learning import CLAIM_TYPE_RULES  # noqa: E402
+
+FRAGMENTS = [
+    "Tenho uma infiltração no teto do quarto há três meses.",
+    "As infiltrações voltaram depois da chuva e a imobiliária não responde.",
+    "O proprietário não devolveu minha caução depois que entreguei as chaves.",
+    "Recebi uma multa rescisória de três aluguéis.",
+    "Vazamento no banheiro causou mofo na parede.",
+    "A imobiliária está cobrando taxa de manutenção que não estava no contrato.",
+    "Mandei notificação por e-mail e não tive retorno.",
+    "O encanamento da cozinha estourou quando eu estava viajando.",
+    "Moro no apartamento desde 2021 e sempre paguei em dia.",
+    "O vizinho de cima faz barulho todas as noites.",
+]
+
+
+def legacy_signals(report: str) -> tuple:
+    """As duas varreduras antigas (LegalAgent + LearningService), juntas."""
+    lower = report.lower()
+    legal = (
+        "infiltração" in lower or "vazamento" in lower or "mofo" in lower,
+        "cobrança" in lower or "multa" in lower,
+        "caução" in lower or "depósito" in lower,
+        "manutenção" in lower,
+        "data" in lower or "quando" in lower,
+        "notific" in lower or "aviso" in lower,
+    )
+    if any(w in lower for w in ["infiltração", "vazamento", "hidráulica", "encanamento"]):
+        claim_type = "manutencao_hidraulica"
+    elif any(w in lower for w in ["caução", "depósito", "devolução"]):
+        claim_type = "caucao"
+    elif any(w in lower for w in ["multa", "cobrança", "taxa"]):
+        claim_type = "cobranca_indevida"
+    elif any(w in lower for w in ["contrato", "rescisão"]):
+        claim_type = "contrato"
+    else:
+        claim_type = "outros"
+    return legal, claim_type
+
+
+def load_taxonomy(scale: int, seed: int) -> dict:
+    with open(TAXONOMY_PATH, "r", encoding="utf-8") as f:
+        signals = json.load(f)["signals"]
+    rng = random.Random(seed)
+    for stems in signals.values():
+        for _ in range(len(stems) * (scale - 1)):
+            stems.append("".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 9))))
+    return signals
+
+
+def make_naive(signals: dict):
+    stems = [(fold(stem), signal) for signal, values in signals.items() for stem in values]
+
+    def naive_signals(report: str) -> tuple:
+        text = fold(report)
+        found = {signal for stem, signal in stems if stem in text}
+        return found, classify(found)
+    return naive_signals
+
+
+def make_compiled(signals: dict):
+    classifier = KeywordClassifier(signals)
+
+    def compiled_signals(report: str) -> tuple:
+        found = classifier.match(report)
+        return found, classify(found)
+    return compiled_signals
+
+
+def classify(found) -> str:
+    for label, wanted in CLAIM_TYPE_RULES:
+        if not found.isdisjoint(wanted):
+            return label
+    return "outros"
+
+
+def make_corpus(count: int, sentences: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(FRAGMENTS, k=rng.randint(1, sentences))) for _ in range(count)]
+
+
+def bench(fn, corpus: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for report in corpus:
+            fn(report)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do classificador de relatos")
+    parser.add_argument("--reports", type=int, default=20000, help="Tamanho do corpus sintético")
+    parser.add_argument("--sentences", type=int, default=12, help="Máximo de frases por relato sintético")
+    parser.add_argument("--corpus", help="Arquivo com um relato por linha (substitui o sintético)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1, help="Multiplica o número de radicais da taxonomia")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = make_corpus(args.reports, args.sentences, args.seed)
+    total_chars = sum(len(r) for r in corpus)
+    signals = load_taxonomy(args.scale, args.seed)
+    stem_count = sum(len(v) for v in signals.values())
+
+    print(f"Corpus: {len(corpus)} relatos, {total_chars / 1e6:.1f} M caracteres | "
+          f"{stem_count} radicais | melhor de {args.repeat}\n")
+    candidates = [("'in' por radical", make_naive(signals)), ("compilado", make_compiled(signals))]
+    if args.scale == 1:
+        candidates.insert(0, ("cadeias antigas", legacy_signals))
+    for name, fn in candidates:
+        elapsed = bench(fn, corpus, args.repeat)
+        print(f"{name:<20}{elapsed * 1000:>10.1f} ms{len(corpus) / elapsed:>12.0f} relatos/s"
+              f"{total_chars / elapsed / 1e6:>8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Servidor OpenAI-compatível de mentira para testes offline e de carga.
+
+Responde em /v1/chat/completions (com e sem stream) usando as mesmas
+respostas simuladas do LLMService, mas com latência realista, erros
+injetados e 429 de rate limit.
+
+Uso:
+    python tools/fake_llm_server.py --port 9000 --latency lognormal:0.8,0.5 --error-rate 0.02 --rpm 300
+
+E no backend:
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://localhost:9000/v1 python -m uvicorn main:app
+
+Distribuições de latência (segundos):
+    fixed:1.0            sempre 1.0s
+    uniform:0.2,1.5      uniforme entre 0.2s e 1.5s
+    lognormal:0.8,0.5    mediana 0.8s, sigma 0.5 (cauda longa, como provedores reais)
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from services.llm import LLMService
+from services.tokens import count_tokens, count_message_tokens
+
+
+def parse_latency(spec: str):
+    """Converte 'tipo:params' numa função que sorteia uma latência em segundos."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+
+
+def create_app(latency: str = "lognormal:0.8,0.5", token_delay: float = 0.02, error_rate: float = 0.0,
+               rate_limit_rate: float = 0.0, rpm: int = 0, stream_error_rate: float = 0.0) -> FastAPI:
+    """
+    Args:
+        latency: distribuição do tempo até a resposta (ou até o 1º token, em stream)
+        token_delay: atraso entre pedaços no modo stream
+        error_rate: fração de requisições que recebem 500
+        rate_limit_rate: fração de requisições que recebem 429 aleatoriamente
+        rpm: limite real de requisições por minuto (0 = sem limite) -> 429
+        stream_error_rate: fração de streams que quebram no meio
+    """
+    app = FastAPI(title="Fake LLM Server")
+    sample_latency = parse_latency(latency)
+    mock = LLMService()
+    recent = deque()
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0, "streams": 0}
+
+    def rate_limited() -> bool:
+        if random.random() < rate_limit_rate:
+            return True
+        if rpm:
+            now = time.monotonic()
+            while recent and recent[0] < now - 60:
+                recent.popleft()
+            if len(recent) >= rpm:
+                return True
+            recent.append(now)
+        return False
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+
+        if rate_limited():
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": "1"},
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}}
+            )
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(sample_latency())
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Injected failure", "type": "server_error"}}
+            )
+
+        messages = body.get("messages", [])
+        system_prompt = " ".join(m["content"] for m in messages if m.get("role") == "system")
+        conversation = [m for m in messages if m.get("role") != "system"] or [{"role": "user", "content": ""}]
+        content = mock._mock_response(conversation, system_prompt)
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        usage = {
+            "prompt_tokens": sum(count_message_tokens(m) for m in messages),
+            "completion_tokens": count_tokens(content)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep(sample_latency())
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            }
+
+        stats["streams"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        breaks_midway = random.random() < stream_error_rate
+
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                "usage": chunk_usage
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            await asyncio.sleep(sample_latency())  # Time-to-first-token
+            yield chunk({"role": "assistant", "content": ""})
+            pieces = re.findall(r"\S+\s*", content)
+            for i, piece in enumerate(pieces):
+                if breaks_midway and i == len(pieces) // 2:
+                    stats["errors"] += 1
+                    raise RuntimeError("Injected stream failure")
+                yield chunk({"content": piece})
+                await asyncio.sleep(token_delay)
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk(None, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor OpenAI-compatível de mentira")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5")
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        rpm=args.rpm,
+        stream_error_rate=args.stream_error_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Gerador de carga para a API do Procon Ágil.
+
+Dispara /api/chat, /api/claim/analyze, /api/claim/generate e /api/upload
+com concorrência fixa e reporta p50/p95/p99, vazão e taxa de erro por rota.
+Feito para rodar com o backend apontando para o tools/fake_llm_server.py.
+
+Uso:
+    python tools/fake_llm_server.py --port 9000 --latency lognormal:0.8,0.5 &
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://localhost:9000/v1 python -m uvicorn main:app --port 8000 &
+    python tools/load_test.py --base-url http://localhost:8000 --concurrency 20 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+REPORTS = [
+    "Tenho uma infiltração no teto do quarto há três meses e a imobiliária não resolve.",
+    "O proprietário não devolveu minha caução depois que entreguei as chaves em janeiro.",
+    "Recebi uma multa rescisória de três aluguéis, mas faltavam só dois meses de contrato.",
+    "Vazamento no banheiro causou mofo na parede, já mandei fotos e notificação por e-mail.",
+    "A imobiliária está cobrando taxa de manutenção que não estava no contrato.",
+]
+
+# Cabeçalho JPEG mínimo, como no teste de upload
+JPEG_HEADER = b"\xFF\xD8\xFF"
+UPLOAD_SIZE = 2048
+
+
+async def call_chat(client: httpx.AsyncClient):
+    report = random.choice(REPORTS)
+    return await client.post("/api/chat", json={"messages": [{"role": "user", "content": report}]})
+
+
+async def call_analyze(client: httpx.AsyncClient):
+    return await client.post("/api/claim/analyze", json={"report": random.choice(REPORTS)})
+
+
+async def call_generate(client: httpx.AsyncClient):
+    return await client.post("/api/claim/generate", json={
+        "report": random.choice(REPORTS),
+        "forensic_data": {},
+        "legal_analysis": {}
+    })
+
+
+async def call_upload(client: httpx.AsyncClient):
+    # Conteúdo novo a cada envio: bytes repetidos só mediriam a deduplicação por hash
+    content = JPEG_HEADER + random.randbytes(UPLOAD_SIZE)
+    files = {"file": ("foto.jpg", content, "image/jpeg")}
+    return await client.post("/api/upload", files=files)
+
+
+SCENARIOS = {
+    "chat": call_chat,
+    "analyze": call_analyze,
+    "generate": call_generate,
+    "upload": call_upload,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_load(base_url: str, scenarios: List[str], concurrency: int, duration: float,
+                   max_requests: int, timeout: float) -> Dict:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    status_codes: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    issued = 0
+    deadline = time.monotonic() + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def worker():
+            nonlocal issued
+            while time.monotonic() < deadline and (not max_requests or issued < max_requests):
+                issued += 1
+                name = random.choice(scenarios)
+                start = time.perf_counter()
+                try:
+                    response = await SCENARIOS[name](client)
+                    status_codes[name][response.status_code] += 1
+                    if response.status_code >= 400:
+                        errors[name] += 1
+                except httpx.HTTPError:
+                    status_codes[name][0] += 1
+                    errors[name] += 1
+                latencies[name].append(time.perf_counter() - start)
+
+        started = time.monotonic()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+
+    report = {"elapsed_seconds": elapsed, "concurrency": concurrency, "endpoints": {}}
+    for name in scenarios:
+        values = sorted(latencies[name])
+        count = len(values)
+        report["endpoints"][name] = {
+            "requests": count,
+            "throughput_rps": count / elapsed if elapsed else 0.0,
+            "error_rate": errors[name] / count if count else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "status_codes": dict(status_codes[name])
+        }
+    total = sum(len(v) for v in latencies.values())
+    report["total_requests"] = total
+    report["total_throughput_rps"] = total / elapsed if elapsed else 0.0
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\nDuração: {report['elapsed_seconds']:.1f}s | Concorrência: {report['concurrency']} | "
+          f"Total: {report['total_requests']} req ({report['total_throughput_rps']:.1f} req/s)\n")
+    header = f"{'rota':<10}{'req':>7}{'req/s':>9}{'erro%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, data in report["endpoints"].items():
+        print(f"{name:<10}{data['requests']:>7}{data['throughput_rps']:>9.1f}{data['error_rate'] * 100:>8.1f}"
+              f"{data['p50_ms']:>10.0f}{data['p95_ms']:>10.0f}{data['p99_ms']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API do Procon Ágil")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scenarios", default="chat,analyze,generate,upload",
+                        help="Rotas a exercitar, separadas por vírgula")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de teste")
+    parser.add_argument("--requests", type=int, default=0, help="Limite de requisições (0 = só duração)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", dest="json_path", help="Salva o relatório completo em JSON")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Cenários desconhecidos: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run_load(args.base_url, scenarios, args.concurrency, args.duration,
+                                  args.requests, args.timeout))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
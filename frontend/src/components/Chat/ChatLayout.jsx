@@ -21,6 +21,8 @@ export function ChatLayout() {
     const [isTyping, setIsTyping] = useState(false);
     const [scoreData, setScoreData] = useState(null);
     const [showScore, setShowScore] = useState(false);
+    const [conversationId, setConversationId] = useState(null);
+    const [evidenceIds, setEvidenceIds] = useState([]);
 
     const { user, login, logout } = useAuth();
 
@@ -64,20 +66,25 @@ export function ChatLayout() {
     const handleGenerateClaim = async () => {
         setIsGenerating(true);
         try {
-            const lastUserMessage = messages.slice().reverse().find(m => m.role === 'user')?.content || "";
+            // Mesmo relato enviado ao /claim/analyze: reaproveita a reclamação pré-gerada pelo backend
+            const report = messages.filter(m => m.role === 'user').map(m => m.content).join(' ');
 
-            const response = await fetch('http://localhost:8000/api/claim/generate', {
+            // Perícia das evidências, análise jurídica e geração numa chamada só (NDJSON por etapa)
+            const response = await fetch('http://localhost:8000/api/claim/pipeline', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
-                    report: lastUserMessage,
-                    forensic_data: {},
-                    legal_analysis: {}
+                    report,
+                    evidences: evidenceIds
                 })
             });
 
-            const data = await response.json();
-            setClaimData(data);
+            const events = (await response.text()).split('\n').filter(Boolean).map(line => JSON.parse(line));
+            const generated = events.find(e => e.stage === 'generate' && e.status === 'ok');
+            if (!generated) {
+                throw new Error("Falha ao gerar a reclamação");
+            }
+            setClaimData(generated.result);
             setShowReview(true);
         } catch (error) {
             console.error("Erro ao gerar:", error);
@@ -108,15 +115,23 @@ export function ChatLayout() {
         setIsTyping(true);
 
         try {
-            const response = await fetch('http://localhost:8000/api/chat', {
+            // Modo sessão: o servidor guarda o histórico, mandamos só a mensagem nova.
+            // No 1º turno (ou se a conversa expirou) vai o histórico local junto.
+            const sendTurn = (id) => fetch('http://localhost:8000/api/chat', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    messages: [...messages, newMessage].map(m => ({ role: m.role, content: m.content }))
-                })
+                body: JSON.stringify(id
+                    ? { conversation_id: id, message: text }
+                    : { messages: messages.map(m => ({ role: m.role, content: m.content })), message: text })
             });
 
+            let response = await sendTurn(conversationId);
+            if (response.status === 404) {
+                response = await sendTurn(null);
+            }
+
             const data = await response.json();
+            setConversationId(data.conversation_id || null);
 
             // Simulate natural typing delay
             setTimeout(async () => {
@@ -135,7 +150,9 @@ export function ChatLayout() {
                             method: 'POST',
                             headers: { 'Content-Type': 'application/json' },
                             body: JSON.stringify({
-                                report: userMessages.map(m => m.content).join(' ')
+                                report: userMessages.map(m => m.content).join(' '),
+                                // Reaproveita a análise que o chat já fez neste turno (mesmo texto: todos os relatos do usuário)
+                                analysis_id: data.analysis_id
                             })
                         });
                         const analysisData = await analysisResponse.json();
@@ -174,6 +191,7 @@ export function ChatLayout() {
 
     const handleUploadComplete = (fileData) => {
         setShowUpload(false);
+        setEvidenceIds(prev => prev.includes(fileData.evidence_id) ? prev : [...prev, fileData.evidence_id]);
         setMessages(prev => [...prev, {
             id: Date.now(),
             role: 'user',
@@ -21,34 +21,36 @@ export function UploadWidget({ onUploadComplete, onCancel }) {
         e.preventDefault();
         e.stopPropagation();
         setIsDragging(false);
-        if (e.dataTransfer.files && e.dataTransfer.files[0]) {
-            handleFiles(e.dataTransfer.files[0]);
+        if (e.dataTransfer.files && e.dataTransfer.files.length) {
+            handleFiles(Array.from(e.dataTransfer.files));
         }
     };
 
     const handleChange = (e) => {
         e.preventDefault();
-        if (e.target.files && e.target.files[0]) {
-            handleFiles(e.target.files[0]);
+        if (e.target.files && e.target.files.length) {
+            handleFiles(Array.from(e.target.files));
         }
     };
 
-    const handleFiles = async (file) => {
-        if (!file) return;
+    const handleFiles = async (files) => {
+        if (!files.length) return;
 
         // Basic client validation
-        if (file.size > 10 * 1024 * 1024) {
+        if (files.some(file => file.size > 10 * 1024 * 1024)) {
             alert("Arquivo muito grande. Máximo 10MB.");
             return;
         }
 
         setIsUploading(true);
 
+        // Vários arquivos vão numa requisição só; o backend valida cada um
         const formData = new FormData();
-        formData.append("file", file);
+        files.forEach(file => formData.append(files.length === 1 ? "file" : "files", file));
+        const url = files.length === 1 ? 'http://localhost:8000/api/upload' : 'http://localhost:8000/api/upload/batch';
 
         try {
-            const response = await fetch('http://localhost:8000/api/upload', {
+            const response = await fetch(url, {
                 method: 'POST',
                 body: formData,
             });
@@ -58,7 +60,21 @@ export function UploadWidget({ onUploadComplete, onCancel }) {
             }
 
             const data = await response.json();
-            onUploadComplete(data);
+            if (files.length === 1) {
+                onUploadComplete(data);
+                return;
+            }
+
+            const accepted = data.files.filter(item => item.status === 'ok');
+            const rejected = data.files.filter(item => item.status === 'error');
+            if (rejected.length) {
+                alert(`Não foi possível enviar: ${rejected.map(item => `${item.original_name} (${item.error})`).join(', ')}`);
+            }
+            if (!accepted.length) {
+                setIsUploading(false);
+                return;
+            }
+            accepted.forEach(item => onUploadComplete(item));
 
         } catch (error) {
             console.error(error);
@@ -115,6 +131,7 @@ export function UploadWidget({ onUploadComplete, onCancel }) {
                             type="file"
                             className="hidden"
                             accept="image/png, image/jpeg, application/pdf"
+                            multiple
                             onChange={handleChange}
                         />
                     </>